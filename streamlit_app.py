@@ -1,14 +1,27 @@
 import streamlit as st
 import json
 import os
+import copy
 from datetime import datetime, date, timedelta
 import secrets
+import shutil
+import threading
+import time
 import string
 import base64
+import hashlib
+import heapq
+import math
+import pickle
+import re
+import unicodedata
+import tempfile
+import zipfile
 from io import BytesIO
 import numpy as np
+import pandas as pd
 import plotly.graph_objects as go
-import plotly.express as px
+from plotly.utils import PlotlyJSONEncoder
 
 # ===================== Konfigurasi ===================== #
 st.set_page_config(
@@ -20,18 +33,72 @@ st.set_page_config(
 
 COURSES_FILE = "courses.json"
 USERS_FILE = "users.json"
-PROGRESS_FILE = "progress.json"
-ATTENDANCE_FILE = "attendance.json"
-FORUM_FILE = "forum.json"
+PROGRESS_FILE = "progress.json"  # format lama, hanya dibaca saat migrasi ke bitset
+PROGRESS_BITS_FILE = "progress_bits.json"  # {"records": {"user_id:course_id": ...}, "by_user": {user_id: [course_id]}}
+DEFAULT_MODULE_COUNT = 7  # jumlah modul bawaan untuk kursus yang belum memiliki modul
+ATTENDANCE_FILE = "attendance.json"  # format lama, hanya dibaca saat migrasi ke partisi
+ATTENDANCE_DIR = "attendance_partitions"  # <course_id>/<tanggal>.json + rollup.json per kursus
+ATTENDANCE_STATUSES = ["Hadir", "Izin", "Sakit"]
+ATTENDANCE_STATUS_CODES = {"Alpa": 0, "Sakit": 1, "Izin": 2, "Hadir": 3}  # nilai sel heatmap; Alpa = tanpa catatan
+FORUM_FILE = "forum.json"  # format lama, hanya dibaca saat migrasi ke partisi
+FORUM_DIR = "forum_partitions"  # satu log + indeks balasan per (course_id, module_id)
+FORUM_META_FILE = os.path.join(FORUM_DIR, "meta.json")  # penghitung ID pesan global
+FORUM_INDEX_VERSION = 2  # v2: indeks menyimpan offset byte tiap pesan di log
+FORUM_THREADS_PER_PAGE = 10
 COURSE_CODES_FILE = "course_codes.json"
 NOTIFICATIONS_FILE = "notifications.json"
-ASSIGNMENTS_FILE = "assignments.json"
+ASSIGNMENTS_FILE = "assignments.json"  # per kursus di COURSE_DATA_DIR; file di root hanya format lama
+COURSE_DATA_DIR = "course_data"  # <course_id>/quizzes.json, quiz_results.json, assignments.json, ...
+COURSE_REGISTRY_FILE = os.path.join(COURSE_DATA_DIR, "registry.json")  # ID kuis/tugas -> course_id + penghitung ID
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SUBMISSIONS_FILE = os.path.join(BASE_DIR, "submissions.json")
-VIRTUAL_LAB_FILE = "virtual_lab.json"
-QUIZZES_FILE = "quizzes.json"
+VIRTUAL_LAB_FILE = "virtual_lab.json"  # format lama, hanya dibaca saat migrasi ke log
+VIRTUAL_LAB_LOG_FILE = "virtual_lab.jsonl"
+VIRTUAL_LAB_INDEX_DIR = "virtual_lab_index"  # <user_id>.idx (offset & panjang tiap record di log) + meta.json
+VIRTUAL_LAB_META_FILE = os.path.join(VIRTUAL_LAB_INDEX_DIR, "meta.json")  # penghitung ID hasil lab
+LAB_FRAME_SNAPSHOT_FILE = os.path.join(VIRTUAL_LAB_INDEX_DIR, "frame.pkl")  # cache kolumnar analitik + offset log
+QUIZZES_FILE = "quizzes.json"  # empat file kuis ini per kursus di COURSE_DATA_DIR
 QUIZ_RESULTS_FILE = "quiz_results.json"
+QUIZ_ATTEMPT_INDEX_FILE = "quiz_attempt_index.json"
+QUIZ_STATS_FILE = "quiz_stats.json"  # agregat berjalan per kuis
+QUIZ_HISTOGRAM_BINS = 10  # histogram nilai per rentang 10%
+LEARNING_GAIN_FILE = "learning_gain.json"  # pasangan nilai pre-/post-test per siswa & modul
+GAIN_CATEGORIES = [(0.7, "Tinggi"), (0.3, "Sedang"), (float("-inf"), "Rendah")]  # kriteria Hake
+QUESTION_BANK_FILE = "question_bank.json"
+QUIZ_SESSIONS_FILE = "quiz_sessions.json"  # sesi kuis yang sedang berjalan, kunci "quiz_id:user_id"
+QUIZ_SESSION_LOG_DIR = "quiz_session_logs"  # satu log jawaban append-only per attempt
+QUIZ_DEADLINE_GRACE_SECONDS = 5  # toleransi latensi jaringan saat batas waktu
 MEDIA_FILE = "media_ajar.json"
+EXPORT_CHUNK_SIZE = 64 * 1024  # byte per potongan saat menyalin file ke ZIP
+SUBMISSION_BLOB_DIR = os.path.join(BASE_DIR, "submission_blobs")  # isi file tugas, dinamai hash SHA-256
+SUBMISSION_INDEX_FILE = os.path.join(BASE_DIR, "submission_index.json")  # status per "assignment_id:user_id"
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # byte per potongan saat menulis upload ke disk
+MAX_SUBMISSION_SIZE = 10 * 1024 * 1024
+BLOB_GC_GRACE_SECONDS = 60 * 60  # blob tanpa referensi yang lebih muda dari ini tidak dihapus GC
+DEFAULT_SUBMISSION_FILE_TYPES = [".pdf", ".doc", ".docx", ".jpg", ".png"]
+EVENT_LOG_DIR = "event_log"  # segmen events-NNNNNN.jsonl + users/<user_id>.idx
+EVENT_SEGMENT_BYTES = 4 * 1024 * 1024  # segmen baru dimulai setelah ukuran ini
+EVENT_BACKFILL_MARKER = os.path.join(EVENT_LOG_DIR, "backfill.done")  # ditulis setelah backfill awal selesai
+EVENT_TYPES = {"attendance": "📋 Absensi", "quiz": "📝 Kuis", "submission": "📤 Tugas",
+               "lab": "🔬 Lab", "forum": "💬 Forum", "module": "📚 Modul"}
+RISK_STATE_FILE = "student_risk.json"  # agregat per siswa & per "user_id:course_id" dari log event + cursor feed
+RISK_STATE_VERSION = 2  # v2: agregat absensi/modul/kuis/tugas dipisah per kursus
+RISK_WEIGHTS = {"attendance": 30, "quiz": 25, "completion": 20, "late": 15, "lab": 10}  # total 100
+RISK_LAB_IDLE_DAYS = 14  # tanpa eksperimen lab selama ini = komponen lab penuh
+RISK_CATEGORIES = [(60, "Tinggi"), (35, "Sedang"), (float("-inf"), "Rendah")]
+SEARCH_INDEX_FILE = "search_index.json"  # snapshot dokumen indeks pencarian beserta frekuensi term
+SEARCH_INDEX_VERSION = 2  # v2: kuis hanya diindeks dari judul & deskripsi
+SEARCH_JOURNAL_FILE = "search_journal.jsonl"  # perubahan indeks sejak snapshot terakhir
+SEARCH_JOURNAL_COMPACT_BYTES = 2 * 1024 * 1024  # journal sebesar ini digabung ke snapshot
+SEARCH_BM25_K1 = 1.5
+SEARCH_BM25_B = 0.75
+SEARCH_DOC_TYPES = {"forum": "💬 Forum", "module": "📚 Modul", "quiz": "📝 Kuis", "media": "📁 Media"}
+SEARCH_STOPWORDS = frozenset("""
+    yang dan di ke dari ini itu dengan untuk pada adalah dalam tidak akan juga atau ada oleh sebagai
+    karena bisa dapat saya aku kamu anda kami kita mereka ia dia apa apakah bagaimana mengapa kenapa
+    kapan jika kalau maka sudah telah belum lebih sangat hanya serta tersebut agar supaya bahwa
+    tentang antara setiap secara ya tolong mohon
+""".split())
 
 # ===================== CSS Custom ===================== #
 def inject_custom_css():
@@ -234,18 +301,68 @@ def save_data(data, filename):
     with open(filename, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=4, ensure_ascii=False)
 
+def load_json_dict(filename):
+    """Memuat file JSON berbentuk objek (indeks); kembalikan dict kosong jika belum ada"""
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, "r", encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except:
+            return {}
+    return data if isinstance(data, dict) else {}
+
+@st.cache_resource(show_spinner=False)
+def _json_file_cache():
+    return {}
+
+def load_data_cached(filename, loader=None):
+    """Memuat file JSON dengan cache per versi file; hasilnya dibagi antar sesi, jangan diubah"""
+    loader = loader or load_data
+    cache = _json_file_cache()
+    signature = get_file_signature(filename)
+    cached = cache.get((filename, loader))
+    if cached is None or cached[0] != signature:
+        cached = (signature, loader(filename))
+        cache[(filename, loader)] = cached
+    return cached[1]
+
+def get_file_signature(filename):
+    """Tanda versi file (mtime, ukuran) untuk invalidasi cache turunan"""
+    try:
+        stat = os.stat(filename)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return (0, 0)
+
 def generate_course_code(length=8):
     characters = string.ascii_uppercase + string.digits
     return ''.join(secrets.choice(characters) for _ in range(length))
 
 def init_data():
     for f in [COURSES_FILE, USERS_FILE, PROGRESS_FILE, ATTENDANCE_FILE, FORUM_FILE, 
-              COURSE_CODES_FILE, NOTIFICATIONS_FILE, ASSIGNMENTS_FILE, SUBMISSIONS_FILE, 
-              VIRTUAL_LAB_FILE, QUIZZES_FILE, QUIZ_RESULTS_FILE, MEDIA_FILE]:
+              COURSE_CODES_FILE, NOTIFICATIONS_FILE, SUBMISSIONS_FILE, 
+              VIRTUAL_LAB_FILE, MEDIA_FILE, QUESTION_BANK_FILE]:
         if not os.path.exists(f):
             with open(f, "w", encoding="utf-8") as file:
                 json.dump([], file)
 
+    init_lab_log()
+    migrate_quizzes_to_question_bank()
+    migrate_course_data_to_partitions()
+    migrate_submissions_to_blobs()
+    init_forum_store()
+    migrate_attendance_to_partitions()
+    migrate_progress_to_bitsets()
+    init_event_log()
+    if not os.path.exists(SUBMISSION_INDEX_FILE):
+        rebuild_submission_index()
+    if any(a.get("deleted_at") and not a.get("purged_at") for a in load_all_course_data(ASSIGNMENTS_FILE, cached=True)):
+        schedule_submission_gc()  # lanjutkan GC yang terputus saat proses berhenti
+    if not os.path.exists(LEARNING_GAIN_FILE):
+        rebuild_learning_gain()
+    expire_quiz_sessions()
+
     users = load_data(USERS_FILE)
     if not any(u.get("username") == "edoanugrah" for u in users):
         admin = {
@@ -287,6 +404,130 @@ def init_data():
             })
             save_data(course_codes, COURSE_CODES_FILE)
 
+    if load_data_cached(SEARCH_INDEX_FILE, _load_search_index_version) != SEARCH_INDEX_VERSION:
+        rebuild_search_index()
+
+# ===================== Course Catalog ===================== #
+def _build_course_catalog(filename):
+    """Katalog kursus: lookup kursus, (course, modul), dan indeks balik media -> modul"""
+    courses = load_data(filename)
+    catalog = {"courses": courses, "by_id": {}, "modules": {}, "module_ids": {}, "media_modules": {}}
+    for course in courses:
+        course_id = course.get("id")
+        catalog["by_id"][course_id] = course
+        for module in course.get("modules", []):
+            catalog["modules"][(course_id, module.get("id"))] = module
+            for media_id in module.get("media_ids", []):
+                catalog["media_modules"].setdefault(media_id, []).append((course_id, module.get("id")))
+        catalog["module_ids"][course_id] = sorted(
+            m.get("id") for m in course.get("modules", []) if m.get("id") is not None
+        )
+    return catalog
+
+def get_course_catalog():
+    """Dibangun ulang hanya saat courses.json berubah; hasil cache, jangan diubah"""
+    return load_data_cached(COURSES_FILE, _build_course_catalog)
+
+def get_course_by_id(course_id):
+    return get_course_catalog()["by_id"].get(course_id)
+
+def get_catalog_module(course_id, module_id):
+    return get_course_catalog()["modules"].get((course_id, module_id))
+
+def get_course_module_ids(course_id):
+    """ID modul kursus, urut; modul bawaan bila kursus belum memiliki modul"""
+    return get_course_catalog()["module_ids"].get(course_id) or list(range(1, DEFAULT_MODULE_COUNT + 1))
+
+def get_media_modules(media_id, course_id=None):
+    """Modul tempat media terpasang, sebagai daftar (course_id, module_id)"""
+    placements = get_course_catalog()["media_modules"].get(media_id, [])
+    return [p for p in placements if course_id is None or p[0] == course_id]
+
+def _build_media_index(filename):
+    items = load_data(filename)
+    return {"items": items, "by_id": {m.get("id"): m for m in items}}
+
+def get_media_index():
+    return load_data_cached(MEDIA_FILE, _build_media_index)
+
+# ===================== Course Data ===================== #
+@st.cache_resource(show_spinner=False)
+def _course_registry_lock():
+    return threading.Lock()
+
+def course_data_path(course_id, filename):
+    """Path koleksi milik satu kursus: course_data/<course_id>/<filename>"""
+    return os.path.join(COURSE_DATA_DIR, str(course_id), filename)
+
+def _load_course_list(path):
+    return load_data(path) if os.path.exists(path) else []
+
+def load_course_data(course_id, filename):
+    """Koleksi (list) satu kursus; list kosong jika kursus belum memiliki data"""
+    return _load_course_list(course_data_path(course_id, filename))
+
+def save_course_data(course_id, filename, data):
+    os.makedirs(os.path.join(COURSE_DATA_DIR, str(course_id)), exist_ok=True)
+    save_data(data, course_data_path(course_id, filename))
+
+def list_course_data_ids():
+    """ID kursus yang sudah memiliki folder data"""
+    if not os.path.isdir(COURSE_DATA_DIR):
+        return []
+    return sorted(int(name) for name in os.listdir(COURSE_DATA_DIR) if name.isdigit())
+
+def load_all_course_data(filename, cached=False):
+    """Gabungan koleksi semua kursus, untuk rebuild indeks global; cached=True hasilnya baca-saja"""
+    items = []
+    for course_id in list_course_data_ids():
+        path = course_data_path(course_id, filename)
+        items += load_data_cached(path, _load_course_list) if cached else _load_course_list(path)
+    return items
+
+def get_item_course_id(kind, item_id):
+    """course_id pemilik kuis/tugas ("quizzes"/"assignments") dari registry; None jika tidak dikenal"""
+    return load_data_cached(COURSE_REGISTRY_FILE, load_json_dict).get(kind, {}).get(str(item_id))
+
+def register_course_item(kind, course_id):
+    """Mengalokasikan ID global baru untuk kuis/tugas dan mencatat kursus pemiliknya"""
+    with _course_registry_lock():
+        registry = load_json_dict(COURSE_REGISTRY_FILE)
+        next_ids = registry.setdefault("next_ids", {})
+        item_id = next_ids.get(kind, 1)
+        next_ids[kind] = item_id + 1
+        registry.setdefault(kind, {})[str(item_id)] = course_id
+        save_data(registry, COURSE_REGISTRY_FILE)
+    return item_id
+
+def migrate_course_data_to_partitions():
+    """Memecah quizzes/quiz_results/assignments global ke folder per kursus (sekali saja)"""
+    if os.path.exists(COURSE_REGISTRY_FILE):
+        return
+    quizzes, results, assignments = (load_data(f) if os.path.exists(f) else []
+                                     for f in (QUIZZES_FILE, QUIZ_RESULTS_FILE, ASSIGNMENTS_FILE))
+    quiz_courses = {q.get("id"): q.get("course_id") for q in quizzes}
+    partitions = {}
+    for filename, items, course_of in ((QUIZZES_FILE, quizzes, lambda q: q.get("course_id")),
+                                       (QUIZ_RESULTS_FILE, results, lambda r: quiz_courses.get(r.get("quiz_id"))),
+                                       (ASSIGNMENTS_FILE, assignments, lambda a: a.get("course_id"))):
+        for item in items:
+            if course_of(item) is not None:
+                partitions.setdefault(course_of(item), {}).setdefault(filename, []).append(item)
+    
+    for course_id, collections in partitions.items():
+        for filename, items in collections.items():
+            save_course_data(course_id, filename, items)
+        rebuild_quiz_attempt_index(course_id)
+        rebuild_quiz_stats(course_id)
+    
+    # Registry ditulis terakhir sebagai penanda migrasi selesai
+    registry = {"quizzes": {}, "assignments": {}, "next_ids": {}}
+    for kind, items in (("quizzes", quizzes), ("assignments", assignments)):
+        registry[kind] = {str(i.get("id")): i.get("course_id") for i in items if i.get("course_id") is not None}
+        registry["next_ids"][kind] = max((i.get("id") or 0 for i in items), default=0) + 1
+    os.makedirs(COURSE_DATA_DIR, exist_ok=True)
+    save_data(registry, COURSE_REGISTRY_FILE)
+
 # ===================== Media Ajar System ===================== #
 def save_media_file(file_data, file_name, file_type, file_size, media_type, description=""):
     """Menyimpan file media ajar"""
@@ -306,29 +547,20 @@ def save_media_file(file_data, file_name, file_type, file_size, media_type, desc
     
     media_data.append(new_media)
     save_data(media_data, MEDIA_FILE)
+    index_search_documents([_media_search_doc(new_media)])
     return new_media
 
 def get_media_by_id(media_id):
     """Mendapatkan media berdasarkan ID"""
-    media_data = load_data(MEDIA_FILE)
-    return next((m for m in media_data if m.get("id") == media_id), None)
+    return get_media_index()["by_id"].get(media_id)
 
 def get_media_by_module(course_id, module_id):
     """Mendapatkan semua media untuk modul tertentu"""
-    courses = load_data(COURSES_FILE)
-    course = next((c for c in courses if c.get("id") == course_id), None)
-    if not course:
-        return []
-    
-    modules = course.get("modules", [])
-    module = next((m for m in modules if m.get("id") == module_id), None)
+    module = get_catalog_module(course_id, module_id)
     if not module:
         return []
-    
-    media_ids = module.get("media_ids", [])
-    media_data = load_data(MEDIA_FILE)
-    
-    return [m for m in media_data if m.get("id") in media_ids]
+    by_id = get_media_index()["by_id"]
+    return [by_id[media_id] for media_id in module.get("media_ids", []) if media_id in by_id]
 
 def add_media_to_module(course_id, module_id, media_id):
     """Menambahkan media ke modul"""
@@ -364,11 +596,25 @@ def remove_media_from_module(course_id, module_id, media_id):
     save_data(courses, COURSES_FILE)
     return True
 
+def detach_media_from_modules(media_id):
+    """Melepas media dari semua modul yang memakainya (dicari lewat indeks balik) dalam satu penulisan"""
+    placements = set(get_media_modules(media_id))
+    if not placements:
+        return False
+    courses = load_data(COURSES_FILE)
+    for course in courses:
+        for module in course.get("modules", []):
+            if (course.get("id"), module.get("id")) in placements and media_id in module.get("media_ids", []):
+                module["media_ids"].remove(media_id)
+    save_data(courses, COURSES_FILE)
+    return True
+
 def delete_media_file(media_id):
     """Menghapus file media"""
     media_data = load_data(MEDIA_FILE)
     media_data = [m for m in media_data if m.get("id") != media_id]
     save_data(media_data, MEDIA_FILE)
+    remove_search_documents([f"media:{media_id}"])
     return True
 
 def get_file_icon(file_type):
@@ -456,17 +702,33 @@ def create_download_link(file_data, file_name, file_type):
     return href
 
 # ===================== Quiz System ===================== #
-def create_quiz(course_id, module_id, title, description, questions, quiz_type="pre-test", time_limit=None, max_attempts=1):
-    """Membuat kuis baru"""
-    quizzes = load_data(QUIZZES_FILE)
+@st.cache_resource(show_spinner=False)
+def _quiz_results_lock(course_id):
+    """Kunci per kursus untuk baca-ubah-tulis quiz_results.json beserta indeks attempt & agregatnya"""
+    return threading.Lock()
+
+@st.cache_resource(show_spinner=False)
+def _learning_gain_lock():
+    return threading.Lock()
+
+def create_quiz(course_id, module_id, title, description, questions, quiz_type="pre-test", time_limit=None, max_attempts=1,
+                question_refs=None, topic=None):
+    """Membuat kuis baru (soal disimpan di bank soal, kuis hanya menyimpan referensi)"""
+    quizzes = load_course_data(course_id, QUIZZES_FILE)
+    
+    refs = list(question_refs or [])
+    if questions:
+        refs += add_questions_to_bank(course_id, module_id, topic or title, questions)
     
     new_quiz = {
-        "id": len(quizzes) + 1,
+        "id": register_course_item("quizzes", course_id),
         "course_id": course_id,
         "module_id": module_id,
         "title": title,
         "description": description,
-        "questions": questions,
+        "question_refs": refs,
+        "shuffle_questions": True,
+        "shuffle_options": True,
         "quiz_type": quiz_type,
         "time_limit": time_limit,
         "max_attempts": max_attempts,
@@ -476,7 +738,8 @@ def create_quiz(course_id, module_id, title, description, questions, quiz_type="
     }
     
     quizzes.append(new_quiz)
-    save_data(quizzes, QUIZZES_FILE)
+    save_course_data(course_id, QUIZZES_FILE, quizzes)
+    index_search_documents([_quiz_search_doc(new_quiz)])
     
     # Notifikasi untuk siswa yang terdaftar
     users = load_data(USERS_FILE)
@@ -496,8 +759,8 @@ def create_quiz(course_id, module_id, title, description, questions, quiz_type="
 
 def get_quizzes(course_id, module_id=None, quiz_type=None):
     """Mendapatkan daftar kuis"""
-    quizzes = load_data(QUIZZES_FILE)
-    filtered_quizzes = [q for q in quizzes if q.get("course_id") == course_id and q.get("is_active")]
+    quizzes = load_course_data(course_id, QUIZZES_FILE)
+    filtered_quizzes = [q for q in quizzes if q.get("is_active")]
     
     if module_id:
         filtered_quizzes = [q for q in filtered_quizzes if q.get("module_id") == module_id]
@@ -508,56 +771,95 @@ def get_quizzes(course_id, module_id=None, quiz_type=None):
     return filtered_quizzes
 
 def get_quiz_by_id(quiz_id):
-    """Mendapatkan kuis berdasarkan ID"""
-    quizzes = load_data(QUIZZES_FILE)
-    return next((q for q in quizzes if q.get("id") == quiz_id), None)
+    """Mendapatkan kuis berdasarkan ID (hanya membaca file kuis milik kursusnya)"""
+    course_id = get_item_course_id("quizzes", quiz_id)
+    if course_id is None:
+        return None
+    return next((q for q in load_course_data(course_id, QUIZZES_FILE) if q.get("id") == quiz_id), None)
+
+def set_quiz_active(quiz_id, is_active):
+    """Mengaktifkan/menonaktifkan kuis; kuis nonaktif dikeluarkan dari indeks pencarian"""
+    course_id = get_item_course_id("quizzes", quiz_id)
+    quizzes = load_course_data(course_id, QUIZZES_FILE)
+    quiz = next((q for q in quizzes if q.get("id") == quiz_id), None)
+    if not quiz:
+        return False
+    quiz["is_active"] = is_active
+    save_course_data(course_id, QUIZZES_FILE, quizzes)
+    if is_active:
+        index_search_documents([_quiz_search_doc(quiz)])
+    else:
+        remove_search_documents([f"quiz:{quiz_id}"])
+    return True
 
 def submit_quiz_result(quiz_id, user_id, answers, score, total_questions, time_taken=None):
-    """Menyimpan hasil kuis"""
-    quiz_results = load_data(QUIZ_RESULTS_FILE)
-    
-    # Hitung attempt number
-    user_attempts = [r for r in quiz_results if r.get("quiz_id") == quiz_id and r.get("user_id") == user_id]
-    attempt_number = len(user_attempts) + 1
-    
-    new_result = {
-        "id": len(quiz_results) + 1,
-        "quiz_id": quiz_id,
-        "user_id": user_id,
-        "answers": answers,
-        "score": score,
-        "total_questions": total_questions,
-        "percentage": round((score / total_questions) * 100, 2),
-        "attempt_number": attempt_number,
-        "time_taken": time_taken,
-        "submitted_at": datetime.now().isoformat()
-    }
+    """Menyimpan hasil kuis ke file hasil & indeks milik kursus kuis tersebut"""
+    quiz = get_quiz_by_id(quiz_id)
+    if not quiz:
+        return None
+    course_id = quiz.get("course_id")
     
-    quiz_results.append(new_result)
-    save_data(quiz_results, QUIZ_RESULTS_FILE)
+    # ID hasil, attempt number, dan kedua indeks dibaca-ubah-tulis sebagai satu langkah per kursus
+    with _quiz_results_lock(course_id):
+        quiz_results = load_course_data(course_id, QUIZ_RESULTS_FILE)
+        
+        # Hitung attempt number dari indeks, bukan dengan memindai semua hasil
+        attempt_index = load_json_dict(_quiz_index_path(course_id, QUIZ_ATTEMPT_INDEX_FILE))
+        attempt_number = attempt_index.get(_quiz_attempt_key(quiz_id, user_id), {}).get("count", 0) + 1
+        
+        new_result = {
+            "id": max((r.get("id") or 0 for r in quiz_results), default=0) + 1,
+            "quiz_id": quiz_id,
+            "user_id": user_id,
+            "answers": answers,
+            "score": score,
+            "total_questions": total_questions,
+            "percentage": round((score / total_questions) * 100, 2),
+            "attempt_number": attempt_number,
+            "time_taken": time_taken,
+            "submitted_at": datetime.now().isoformat()
+        }
+        
+        quiz_results.append(new_result)
+        save_course_data(course_id, QUIZ_RESULTS_FILE, quiz_results)
+        _update_quiz_attempt_index(attempt_index, new_result)
+        save_course_data(course_id, QUIZ_ATTEMPT_INDEX_FILE, attempt_index)
+        quiz_stats = load_json_dict(_quiz_index_path(course_id, QUIZ_STATS_FILE))
+        _update_quiz_stats(quiz_stats, new_result)
+        save_course_data(course_id, QUIZ_STATS_FILE, quiz_stats)
+    
+    log_event(user_id, "quiz", course_id, **_quiz_event_data(new_result, quiz))
+    if quiz.get("quiz_type") in ("pre-test", "post-test"):
+        with _learning_gain_lock():
+            gain_index = load_json_dict(LEARNING_GAIN_FILE)
+            _update_learning_gain(gain_index, quiz, new_result)
+            save_data(gain_index, LEARNING_GAIN_FILE)
     
     # Notifikasi untuk admin
-    quiz = get_quiz_by_id(quiz_id)
-    if quiz:
-        users = load_data(USERS_FILE)
-        student = next((u for u in users if u.get("id") == user_id), None)
-        admins = [u for u in users if u.get("role") == "admin"]
-        
-        for admin in admins:
-            create_notification(
-                admin.get("id"),
-                "📊 Kuis Diselesaikan",
-                f"{student.get('name')} menyelesaikan kuis '{quiz.get('title')}' dengan nilai {new_result['percentage']}%",
-                "info",
-                quiz.get("course_id"),
-                quiz.get("module_id")
-            )
+    users = load_data(USERS_FILE)
+    student = next((u for u in users if u.get("id") == user_id), None)
+    admins = [u for u in users if u.get("role") == "admin"]
+    
+    for admin in admins:
+        create_notification(
+            admin.get("id"),
+            "📊 Kuis Diselesaikan",
+            f"{student.get('name')} menyelesaikan kuis '{quiz.get('title')}' dengan nilai {new_result['percentage']}%",
+            "info",
+            course_id,
+            quiz.get("module_id")
+        )
     
     return new_result
 
-def get_quiz_results(quiz_id=None, user_id=None):
-    """Mendapatkan hasil kuis"""
-    quiz_results = load_data(QUIZ_RESULTS_FILE)
+def get_quiz_results(quiz_id=None, user_id=None, course_id=None):
+    """Mendapatkan hasil kuis; cukup membaca satu kursus bila quiz_id atau course_id diberikan"""
+    if quiz_id:
+        course_id = get_item_course_id("quizzes", quiz_id)
+    if course_id is not None:
+        quiz_results = load_course_data(course_id, QUIZ_RESULTS_FILE)
+    else:
+        quiz_results = load_all_course_data(QUIZ_RESULTS_FILE)
     
     if quiz_id:
         quiz_results = [r for r in quiz_results if r.get("quiz_id") == quiz_id]
@@ -569,38 +871,582 @@ def get_quiz_results(quiz_id=None, user_id=None):
 
 def get_user_quiz_attempts(quiz_id, user_id):
     """Mendapatkan jumlah attempt user untuk kuis tertentu"""
-    quiz_results = load_data(QUIZ_RESULTS_FILE)
-    return [r for r in quiz_results if r.get("quiz_id") == quiz_id and r.get("user_id") == user_id]
+    return get_quiz_results(quiz_id, user_id)
+
+def _quiz_index_path(course_id, filename):
+    """Path indeks attempt/agregat kuis satu kursus; dibangun ulang dari hasil kuis bila filenya hilang"""
+    path = course_data_path(course_id, filename)
+    if not os.path.exists(path) and os.path.exists(course_data_path(course_id, QUIZ_RESULTS_FILE)):
+        (rebuild_quiz_attempt_index if filename == QUIZ_ATTEMPT_INDEX_FILE else rebuild_quiz_stats)(course_id)
+    return path
+
+# ---- Indeks attempt per (quiz_id, user_id) ---- #
+def _quiz_attempt_key(quiz_id, user_id):
+    return f"{quiz_id}:{user_id}"
+
+def _update_quiz_attempt_index(attempt_index, result):
+    """Memperbarui ringkasan attempt (jumlah, nilai terbaik, attempt terakhir) secara inkremental"""
+    key = _quiz_attempt_key(result.get("quiz_id"), result.get("user_id"))
+    entry = attempt_index.setdefault(key, {"count": 0, "best_percentage": None, "latest_attempt_id": None})
+    entry["count"] += 1
+    if entry["best_percentage"] is None or result.get("percentage", 0) > entry["best_percentage"]:
+        entry["best_percentage"] = result.get("percentage", 0)
+    entry["latest_attempt_id"] = result.get("id")
+
+def rebuild_quiz_attempt_index(course_id):
+    """Membangun ulang indeks attempt satu kursus dari quiz_results.json kursus tersebut"""
+    attempt_index = {}
+    for result in load_course_data(course_id, QUIZ_RESULTS_FILE):
+        _update_quiz_attempt_index(attempt_index, result)
+    save_course_data(course_id, QUIZ_ATTEMPT_INDEX_FILE, attempt_index)
+    return attempt_index
+
+def get_quiz_attempt_summary(quiz_id, user_id):
+    """Ringkasan attempt user untuk satu kuis: lookup O(1) pada indeks kursus kuis"""
+    course_id = get_item_course_id("quizzes", quiz_id)
+    attempt_index = load_data_cached(_quiz_index_path(course_id, QUIZ_ATTEMPT_INDEX_FILE), load_json_dict)
+    return attempt_index.get(_quiz_attempt_key(quiz_id, user_id),
+                             {"count": 0, "best_percentage": None, "latest_attempt_id": None})
+
+# ---- Agregat nilai per kuis ---- #
+def _update_quiz_stats(quiz_stats, result):
+    """Menambahkan satu hasil ke agregat kuis (jumlah, jumlah kuadrat, min, max, histogram)"""
+    percentage = float(result.get("percentage", 0))
+    entry = quiz_stats.setdefault(str(result.get("quiz_id")), {
+        "count": 0, "sum": 0.0, "sum_sq": 0.0, "min": None, "max": None,
+        "histogram": [0] * QUIZ_HISTOGRAM_BINS
+    })
+    entry["count"] += 1
+    entry["sum"] += percentage
+    entry["sum_sq"] += percentage * percentage
+    entry["min"] = percentage if entry["min"] is None else min(entry["min"], percentage)
+    entry["max"] = percentage if entry["max"] is None else max(entry["max"], percentage)
+    entry["histogram"][min(int(percentage * QUIZ_HISTOGRAM_BINS // 100), QUIZ_HISTOGRAM_BINS - 1)] += 1
+
+def rebuild_quiz_stats(course_id):
+    """Membangun ulang agregat kuis satu kursus dari quiz_results.json kursus tersebut"""
+    quiz_stats = {}
+    for result in load_course_data(course_id, QUIZ_RESULTS_FILE):
+        _update_quiz_stats(quiz_stats, result)
+    save_course_data(course_id, QUIZ_STATS_FILE, quiz_stats)
+    return quiz_stats
+
+def get_quiz_stats(quiz_id):
+    """Statistik nilai kuis (rata-rata, simpangan baku, min, max, histogram) dari agregat; None jika belum ada hasil"""
+    course_id = get_item_course_id("quizzes", quiz_id)
+    entry = load_data_cached(_quiz_index_path(course_id, QUIZ_STATS_FILE), load_json_dict).get(str(quiz_id))
+    if not entry or not entry["count"]:
+        return None
+    count = entry["count"]
+    mean = entry["sum"] / count
+    variance = max(entry["sum_sq"] / count - mean * mean, 0.0)
+    return {
+        "count": count,
+        "mean": mean,
+        "std": variance ** 0.5,
+        "min": entry["min"],
+        "max": entry["max"],
+        "histogram": entry["histogram"]
+    }
+
+# ---- N-Gain pre-/post-test ---- #
+def _update_learning_gain(gain_index, quiz, result):
+    """Memasangkan hasil ke (siswa, modul): pre = attempt pre-test pertama, post = attempt post-test terakhir"""
+    key = f"{result.get('user_id')}:{quiz.get('course_id')}:{quiz.get('module_id')}"
+    entry = gain_index.setdefault(key, {
+        "user_id": result.get("user_id"),
+        "course_id": quiz.get("course_id"),
+        "module_id": quiz.get("module_id"),
+        "pre": None, "pre_at": None, "post": None, "post_at": None
+    })
+    if quiz.get("quiz_type") == "pre-test" and entry["pre"] is None:
+        entry["pre"], entry["pre_at"] = result.get("percentage", 0), result.get("submitted_at")
+    elif quiz.get("quiz_type") == "post-test":
+        entry["post"], entry["post_at"] = result.get("percentage", 0), result.get("submitted_at")
+
+def rebuild_learning_gain():
+    """Membangun ulang pasangan pre-/post-test dari seluruh hasil kuis (urut waktu submit)"""
+    quizzes = {q.get("id"): q for q in load_all_course_data(QUIZZES_FILE)}
+    gain_index = {}
+    for result in sorted(load_all_course_data(QUIZ_RESULTS_FILE), key=lambda r: r.get("submitted_at") or ""):
+        quiz = quizzes.get(result.get("quiz_id"))
+        if quiz and quiz.get("quiz_type") in ("pre-test", "post-test"):
+            _update_learning_gain(gain_index, quiz, result)
+    save_data(gain_index, LEARNING_GAIN_FILE)
+    return gain_index
+
+def _load_learning_gain_frame(filename):
+    """Tabel pasangan pre/post dengan g individu = (post - pre) / (100 - pre)"""
+    frame = pd.DataFrame(list(load_json_dict(filename).values()),
+                         columns=["user_id", "course_id", "module_id", "pre", "pre_at", "post", "post_at"])
+    pre = pd.to_numeric(frame["pre"], errors="coerce")
+    post = pd.to_numeric(frame["post"], errors="coerce")
+    frame["pre"], frame["post"] = pre, post
+    frame["g"] = ((post - pre) / (100 - pre)).where(pre < 100)
+    return frame
+
+def get_learning_gain_frame(course_id=None):
+    """Pasangan pre/post per siswa & modul dari cache (hanya dibaca ulang jika file berubah)"""
+    frame = load_data_cached(LEARNING_GAIN_FILE, _load_learning_gain_frame)
+    if course_id is not None:
+        frame = frame[frame["course_id"] == course_id]
+    return frame
+
+def classify_gain(g):
+    """Kategori N-Gain menurut Hake (tinggi/sedang/rendah)"""
+    if g is None or pd.isna(g):
+        return "-"
+    return next(label for threshold, label in GAIN_CATEGORIES if g >= threshold)
+
+def summarize_learning_gain(frame):
+    """Ringkasan per modul: rata-rata pre/post, rerata g individu, dan g kelas <g> = (<post> - <pre>) / (100 - <pre>)"""
+    complete = frame.dropna(subset=["pre", "post"])
+    summary = complete.groupby("module_id").agg(
+        siswa=("user_id", "nunique"),
+        pre=("pre", "mean"),
+        post=("post", "mean"),
+        g_individu=("g", "mean"),
+    ).reset_index()
+    summary["g_kelas"] = ((summary["post"] - summary["pre"]) / (100 - summary["pre"])).where(summary["pre"] < 100)
+    summary["kategori"] = summary["g_kelas"].map(classify_gain)
+    return summary
+
+def get_quiz_answer_key(questions):
+    """Kunci jawaban sebagai indeks opsi (integer) per soal; -1 jika kunci tidak ada di opsi"""
+    key = np.full(len(questions), -1, dtype=np.int16)
+    for i, question in enumerate(questions):
+        options = question.get("options", [])
+        if question.get("correct_answer") in options:
+            key[i] = options.index(question.get("correct_answer"))
+    return key
+
+def encode_quiz_answers(questions, answer_dicts):
+    """Mengubah jawaban teks {"q_i": opsi} menjadi matriks indeks opsi (attempt × soal), -1 = kosong"""
+    option_maps = [{opt: j for j, opt in enumerate(q.get("options", []))} for q in questions]
+    encoded = np.full((len(answer_dicts), len(questions)), -1, dtype=np.int16)
+    for a, answers in enumerate(answer_dicts):
+        for i, option_map in enumerate(option_maps):
+            encoded[a, i] = option_map.get(answers.get(f"q_{i}"), -1)
+    return encoded
+
+def grade_quiz_attempts(questions, answer_dicts):
+    """Menilai banyak attempt sekaligus: satu perbandingan matriks terhadap kunci jawaban"""
+    encoded = encode_quiz_answers(questions, answer_dicts)
+    key = get_quiz_answer_key(questions)
+    correct = (key >= 0) & (encoded == key)  # kunci -1 (tidak ada di opsi) tidak boleh cocok dengan jawaban kosong
+    return encoded, correct, correct.sum(axis=1)
 
 def calculate_quiz_score(questions, user_answers):
     """Menghitung skor kuis"""
-    score = 0
+    _, correct, scores = grade_quiz_attempts(questions, [user_answers])
     detailed_results = []
     
     for i, question in enumerate(questions):
-        user_answer = user_answers.get(f"q_{i}")
-        correct_answer = question.get("correct_answer")
-        is_correct = user_answer == correct_answer
-        
-        if is_correct:
-            score += 1
-        
         detailed_results.append({
             "question": question.get("question"),
-            "user_answer": user_answer,
-            "correct_answer": correct_answer,
-            "is_correct": is_correct,
+            "user_answer": user_answers.get(f"q_{i}"),
+            "correct_answer": question.get("correct_answer"),
+            "is_correct": bool(correct[0, i]),
             "options": question.get("options", [])
         })
     
-    return score, detailed_results
+    return int(scores[0]), detailed_results
+
+def analyze_quiz_items(questions, answer_dicts):
+    """Statistik butir soal klasik: tingkat kesukaran, daya beda point-biserial, frekuensi pengecoh"""
+    encoded, correct, scores = grade_quiz_attempts(questions, answer_dicts)
+    X = correct.astype(float)
+    num_attempts, num_questions = X.shape
+    
+    # Frekuensi opsi: kolom 0 = tidak dijawab, kolom j+1 = opsi j
+    max_options = max((len(q.get("options", [])) for q in questions), default=0)
+    frequencies = np.zeros((num_questions, max_options + 1), dtype=int)
+    np.add.at(frequencies, (np.broadcast_to(np.arange(num_questions), encoded.shape), encoded + 1), 1)
+    
+    if not num_attempts:
+        difficulty = np.zeros(num_questions)
+        discrimination = np.full(num_questions, np.nan)
+    else:
+        difficulty = X.mean(axis=0)
+        # Point-biserial terkoreksi: korelasi benar/salah butir dengan skor total tanpa butir itu
+        rest = scores[:, None] - X
+        item_std = X.std(axis=0)
+        rest_std = rest.std(axis=0)
+        covariance = (X * rest).mean(axis=0) - difficulty * rest.mean(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            discrimination = np.where((item_std > 0) & (rest_std > 0), covariance / (item_std * rest_std), np.nan)
+    
+    return {
+        "scores": scores,
+        "difficulty": difficulty,
+        "discrimination": discrimination,
+        "option_frequencies": frequencies,
+    }
+
+# ===================== Question Bank ===================== #
+def _load_question_bank_index(filename):
+    """Memuat bank soal beserta indeks per ID, per (course, modul), dan per (course, modul, topik)"""
+    items = load_data(filename)
+    index = {"items": items, "by_id": {}, "by_module": {}, "by_topic": {}}
+    for item in items:
+        index["by_id"][item.get("id")] = item
+        index["by_module"].setdefault((item.get("course_id"), item.get("module_id")), []).append(item.get("id"))
+        index["by_topic"].setdefault((item.get("course_id"), item.get("module_id"), item.get("topic")), []).append(item.get("id"))
+    return index
+
+def get_question_bank_index():
+    return load_data_cached(QUESTION_BANK_FILE, _load_question_bank_index)
+
+def add_questions_to_bank(course_id, module_id, topic, questions, migrated_from=None):
+    """Menambahkan soal ke bank soal dan mengembalikan ID-nya.
+    migrated_from: daftar (quiz_id, posisi) sejajar questions, dicatat saat migrasi soal tertanam"""
+    bank = load_data(QUESTION_BANK_FILE)
+    next_id = max([item.get("id", 0) for item in bank], default=0) + 1
+    ids = []
+    for position, question in enumerate(questions):
+        item = {
+            "id": next_id,
+            "course_id": course_id,
+            "module_id": module_id,
+            "topic": topic,
+            "question": question.get("question"),
+            "options": question.get("options", []),
+            "correct_answer": question.get("correct_answer"),
+            "created_at": datetime.now().isoformat()
+        }
+        if migrated_from:
+            item["migrated_from"] = list(migrated_from[position])
+        bank.append(item)
+        ids.append(next_id)
+        next_id += 1
+    save_data(bank, QUESTION_BANK_FILE)
+    return ids
+
+def get_bank_questions(course_id, module_id=None, topic=None):
+    """Mendapatkan soal bank berdasarkan modul dan/atau topik melalui indeks"""
+    index = get_question_bank_index()
+    if module_id is None:
+        return [item for item in index["items"] if item.get("course_id") == course_id]
+    if topic is None:
+        ids = index["by_module"].get((course_id, module_id), [])
+    else:
+        ids = index["by_topic"].get((course_id, module_id, topic), [])
+    return [index["by_id"][i] for i in ids]
+
+def get_bank_topics(course_id, module_id):
+    index = get_question_bank_index()
+    return sorted({t for (c, m, t) in index["by_topic"] if c == course_id and m == module_id and t})
+
+def get_quiz_questions(quiz):
+    """Soal kuis dalam urutan kanonik: referensi bank soal, atau daftar soal lama yang tertanam.
+    Referensi yang hilang dari bank diganti placeholder agar posisi "q_i" pada jawaban tetap sejajar"""
+    if "question_refs" not in quiz:
+        return quiz.get("questions", [])
+    by_id = get_question_bank_index()["by_id"]
+    return [by_id.get(ref) or {"id": ref, "question": "⚠️ Soal tidak ditemukan di bank soal", "options": [],
+                               "correct_answer": None, "missing": True}
+            for ref in quiz.get("question_refs", [])]
+
+def migrate_quizzes_to_question_bank():
+    """Memindahkan soal yang masih tertanam di quizzes.json lama ke bank soal (sebelum dipecah per kursus)"""
+    if os.path.exists(COURSE_REGISTRY_FILE) or not os.path.exists(QUIZZES_FILE):
+        return
+    quizzes = load_data(QUIZZES_FILE)
+    # Soal yang sudah dipindah pada percobaan sebelumnya (mis. proses berhenti sebelum quizzes.json
+    # tersimpan) dipakai ulang berdasarkan (quiz_id, posisi), sehingga migrasi aman diulang
+    migrated = {tuple(item["migrated_from"]): item.get("id")
+                for item in load_data(QUESTION_BANK_FILE) if item.get("migrated_from")}
+    changed = False
+    for quiz in quizzes:
+        if "question_refs" in quiz:
+            continue
+        questions = quiz.get("questions", [])
+        missing = [(quiz.get("id"), i) for i in range(len(questions)) if (quiz.get("id"), i) not in migrated]
+        if missing:
+            new_ids = add_questions_to_bank(quiz.get("course_id"), quiz.get("module_id"), quiz.get("title"),
+                                            [questions[i] for _, i in missing], migrated_from=missing)
+            migrated.update(zip(missing, new_ids))
+        quiz["question_refs"] = [migrated[(quiz.get("id"), i)] for i in range(len(questions))]
+        # Urutan lama dipertahankan agar jawaban "q_i" pada hasil kuis tetap valid
+        quiz.setdefault("shuffle_questions", False)
+        quiz.setdefault("shuffle_options", False)
+        quiz.pop("questions", None)
+        changed = True
+    if changed:
+        save_data(quizzes, QUIZZES_FILE)
+
+def generate_quiz_form(quiz, user_id, attempt_number):
+    """Membuat form acak deterministik (seed per siswa & attempt) dengan kunci jawaban integer"""
+    questions = get_quiz_questions(quiz)
+    rng = np.random.default_rng([int(quiz.get("id") or 0), int(user_id or 0), int(attempt_number)])
+    
+    question_order = np.arange(len(questions))
+    if quiz.get("shuffle_questions"):
+        question_order = rng.permutation(len(questions))
+    
+    option_orders = []
+    for i in question_order:
+        num_options = len(questions[i].get("options", []))
+        option_orders.append((rng.permutation(num_options) if quiz.get("shuffle_options") else np.arange(num_options)).tolist())
+    
+    # Kunci jawaban form: posisi opsi benar setelah diacak
+    canonical_key = get_quiz_answer_key(questions)
+    answer_key = [order.index(int(canonical_key[i])) if canonical_key[i] >= 0 else -1
+                  for i, order in zip(question_order, option_orders)]
+    
+    return {
+        "seed": [int(quiz.get("id") or 0), int(user_id or 0), int(attempt_number)],
+        "question_order": question_order.tolist(),
+        "option_orders": option_orders,
+        "answer_key": answer_key,
+    }
+
+def grade_quiz_form(questions, form, selected):
+    """Menilai jawaban form (indeks opsi per posisi) dengan satu perbandingan vektor.
+    Jawaban dikembalikan dalam urutan kanonik {"q_i": teks opsi} agar kompatibel dengan hasil lama."""
+    selected = np.array([-1 if s is None else s for s in selected], dtype=np.int16)
+    answer_key = np.array(form["answer_key"], dtype=np.int16)
+    correct = (answer_key >= 0) & (selected == answer_key)
+    
+    canonical_answers = {}
+    detailed_results = []
+    for pos, (i, order) in enumerate(zip(form["question_order"], form["option_orders"])):
+        question = questions[i]
+        options = question.get("options", [])
+        user_answer = options[order[selected[pos]]] if selected[pos] >= 0 else None
+        canonical_answers[f"q_{i}"] = user_answer
+        detailed_results.append({
+            "question": question.get("question"),
+            "user_answer": user_answer,
+            "correct_answer": question.get("correct_answer"),
+            "is_correct": bool(correct[pos]),
+            "options": [options[j] for j in order]
+        })
+    return int(correct.sum()), canonical_answers, detailed_results
+
+# ===================== Quiz Session ===================== #
+@st.cache_resource(show_spinner=False)
+def _quiz_session_lock():
+    """Kunci proses untuk baca-ubah-tulis indeks sesi kuis"""
+    return threading.Lock()
+
+def _quiz_session_log_path(session_id):
+    return os.path.join(QUIZ_SESSION_LOG_DIR, f"{session_id}.jsonl")
+
+def _quiz_session_deadline(session):
+    return datetime.fromisoformat(session["deadline"]) if session.get("deadline") else None
+
+def is_quiz_session_expired(session, now=None):
+    """Cek batas waktu sesi di sisi server (dengan toleransi latensi)"""
+    deadline = _quiz_session_deadline(session)
+    if deadline is None:
+        return False
+    now = now or datetime.now()
+    return now > deadline + timedelta(seconds=QUIZ_DEADLINE_GRACE_SECONDS)
+
+def get_quiz_session_remaining(session, now=None):
+    """Sisa waktu sesi dalam detik; None jika kuis tanpa batas waktu"""
+    deadline = _quiz_session_deadline(session)
+    if deadline is None:
+        return None
+    return max(0, int((deadline - (now or datetime.now())).total_seconds()))
+
+def get_active_quiz_session(quiz_id, user_id):
+    """Mendapatkan sesi kuis yang sedang berjalan untuk user (untuk melanjutkan setelah reconnect)"""
+    sessions = load_data_cached(QUIZ_SESSIONS_FILE, load_json_dict)
+    return sessions.get(_quiz_attempt_key(quiz_id, user_id))
+
+def _read_quiz_session_log(session):
+    """Memutar ulang log sesi: form dari baris pertama, lalu jawaban terakhir per posisi soal"""
+    form, answers = None, {}
+    path = _quiz_session_log_path(session["session_id"])
+    if not os.path.exists(path):
+        return form, answers
+    
+    cutoff = _quiz_session_deadline(session)
+    if cutoff:
+        cutoff += timedelta(seconds=QUIZ_DEADLINE_GRACE_SECONDS)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # baris terakhir bisa terpotong jika proses mati saat menulis
+            if "form" in entry:
+                form = entry["form"]
+            elif cutoff is None or datetime.fromisoformat(entry["at"]) <= cutoff:
+                answers[int(entry["pos"])] = entry["choice"]
+    return form, answers
+
+def load_quiz_session_answers(session):
+    """Jawaban tersimpan sesi per posisi soal (jawaban setelah batas waktu diabaikan)"""
+    return _read_quiz_session_log(session)[1]
+
+def start_quiz_session(quiz, user_id):
+    """Memulai (atau melanjutkan) sesi kuis; batas waktu dihitung server saat sesi dibuat"""
+    key = _quiz_attempt_key(quiz.get("id"), user_id)
+    with _quiz_session_lock():
+        sessions = load_json_dict(QUIZ_SESSIONS_FILE)
+        if key in sessions:
+            session = dict(sessions[key])
+            session["form"] = _read_quiz_session_log(session)[0]
+            if session["form"] is not None:
+                return session
+        
+        attempt_number = get_quiz_attempt_summary(quiz.get("id"), user_id)["count"] + 1
+        started_at = datetime.now()
+        deadline = started_at + timedelta(minutes=quiz["time_limit"]) if quiz.get("time_limit") else None
+        session = {
+            "session_id": f"{quiz.get('id')}-{user_id}-{attempt_number}",
+            "quiz_id": quiz.get("id"),
+            "user_id": user_id,
+            "attempt_number": attempt_number,
+            "started_at": started_at.isoformat(),
+            "deadline": deadline.isoformat() if deadline else None
+        }
+        form = generate_quiz_form(quiz, user_id, attempt_number)
+        
+        # Form disimpan sebagai baris pertama log agar indeks sesi tetap kecil
+        os.makedirs(QUIZ_SESSION_LOG_DIR, exist_ok=True)
+        with open(_quiz_session_log_path(session["session_id"]), "w", encoding="utf-8") as f:
+            f.write(json.dumps({"form": form}) + "\n")
+        sessions[key] = session
+        save_data(sessions, QUIZ_SESSIONS_FILE)
+    return dict(session, form=form)
+
+def record_quiz_answer(session, position, choice):
+    """Menyimpan satu perubahan jawaban sebagai baris baru di log sesi (tanpa menulis ulang file besar)"""
+    key = _quiz_attempt_key(session["quiz_id"], session["user_id"])
+    # Di bawah kunci sesi agar jawaban tidak ditulis ke sesi yang sedang/sudah dinilai di tab lain
+    with _quiz_session_lock():
+        stored = load_json_dict(QUIZ_SESSIONS_FILE).get(key)
+        if not stored or stored.get("session_id") != session["session_id"]:
+            return {"error": "Sesi kuis sudah selesai, jawaban tidak lagi disimpan."}
+        if is_quiz_session_expired(stored):
+            return {"error": "Waktu pengerjaan sudah habis, jawaban tidak lagi disimpan."}
+        
+        line = json.dumps({"pos": position, "choice": choice, "at": datetime.now().isoformat()})
+        with open(_quiz_session_log_path(session["session_id"]), "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    return {"success": True}
+
+def _grade_quiz_session(session, timed_out):
+    """Menilai satu sesi dari log jawaban server dan menyimpan hasilnya"""
+    quiz = get_quiz_by_id(session["quiz_id"])
+    form, answers = _read_quiz_session_log(session)
+    outcome = None
+    if quiz and form:
+        questions = get_quiz_questions(quiz)
+        selected = [answers.get(pos) for pos in range(len(form["question_order"]))]
+        score, canonical_answers, detailed_results = grade_quiz_form(questions, form, selected)
+        
+        started_at = datetime.fromisoformat(session["started_at"])
+        finished_at = datetime.now()
+        deadline = _quiz_session_deadline(session)
+        if deadline:
+            finished_at = min(finished_at, deadline)
+        
+        result = submit_quiz_result(session["quiz_id"], session["user_id"], canonical_answers, score, len(questions),
+                                    time_taken=max(0, int((finished_at - started_at).total_seconds())))
+        outcome = {"result": result, "detailed_results": detailed_results, "timed_out": timed_out}
+    
+    log_path = _quiz_session_log_path(session["session_id"])
+    if os.path.exists(log_path):
+        os.remove(log_path)
+    return outcome
+
+def finish_quiz_session(quiz_id, user_id, timed_out=False):
+    """Menilai sesi tepat sekali (saat submit atau waktu habis); None jika sudah dinilai"""
+    key = _quiz_attempt_key(quiz_id, user_id)
+    with _quiz_session_lock():
+        sessions = load_json_dict(QUIZ_SESSIONS_FILE)
+        if key not in sessions:
+            return None
+        outcome = _grade_quiz_session(sessions[key], timed_out)
+        # Sesi baru ditutup setelah hasil tersimpan agar attempt tidak hilang jika proses mati di tengah
+        del sessions[key]
+        save_data(sessions, QUIZ_SESSIONS_FILE)
+    return outcome
+
+def expire_quiz_sessions():
+    """Menilai otomatis semua sesi yang lewat batas waktu (juga memulihkan sesi setelah restart)"""
+    now = datetime.now()
+    if not any(is_quiz_session_expired(s, now) for s in load_data_cached(QUIZ_SESSIONS_FILE, load_json_dict).values()):
+        return 0
+    
+    with _quiz_session_lock():
+        sessions = load_json_dict(QUIZ_SESSIONS_FILE)
+        expired = [key for key, s in sessions.items() if is_quiz_session_expired(s, now)]
+        for key in expired:
+            _grade_quiz_session(sessions.pop(key), timed_out=True)
+        save_data(sessions, QUIZ_SESSIONS_FILE)
+    return len(expired)
 
 # ===================== Virtual Lab System ===================== #
+@st.cache_resource(show_spinner=False)
+def _lab_log_lock():
+    """Kunci proses untuk alokasi ID, append log, dan append indeks lab"""
+    return threading.Lock()
+
+def _lab_user_index_path(user_id, index_dir=VIRTUAL_LAB_INDEX_DIR):
+    return os.path.join(index_dir, f"{user_id}.idx")
+
+def _format_lab_index_line(offset, length):
+    # Baris berlebar tetap: jumlah & halaman riwayat dihitung dari ukuran file tanpa membacanya
+    return f"{offset:012d} {length:08d}\n"
+
+LAB_INDEX_LINE_BYTES = len(_format_lab_index_line(0, 0))
+
+def _append_lab_log_lines(records, log_path=VIRTUAL_LAB_LOG_FILE, index_dir=VIRTUAL_LAB_INDEX_DIR):
+    """Menambahkan record ke log lab (satu JSON per baris) dan offset-nya ke indeks per user"""
+    index_lines = {}
+    with open(log_path, "ab") as f:
+        offset = f.seek(0, os.SEEK_END)
+        for record in records:
+            line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+            f.write(line)
+            index_lines.setdefault(record.get("user_id"), []).append(_format_lab_index_line(offset, len(line)))
+            offset += len(line)
+    for user_id, lines in index_lines.items():
+        with open(_lab_user_index_path(user_id, index_dir), "a", encoding="ascii") as idx:
+            idx.writelines(lines)
+
+def init_lab_log():
+    """Migrasi virtual_lab.json (atau log tanpa indeks) ke log append-only + indeks offset per user (sekali saja)"""
+    if os.path.isdir(VIRTUAL_LAB_INDEX_DIR):
+        return
+    with _lab_log_lock():
+        if os.path.isdir(VIRTUAL_LAB_INDEX_DIR):
+            return
+        records = load_lab_log() if os.path.exists(VIRTUAL_LAB_LOG_FILE) else load_data(VIRTUAL_LAB_FILE)
+        records.sort(key=lambda r: r.get("created_at") or "")
+        
+        # Log & indeks baru ditulis ke lokasi sementara; rename folder indeks menandai migrasi selesai
+        tmp_log, tmp_dir = VIRTUAL_LAB_LOG_FILE + ".tmp", VIRTUAL_LAB_INDEX_DIR + ".tmp"
+        if os.path.exists(tmp_log):
+            os.remove(tmp_log)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        open(tmp_log, "wb").close()
+        _append_lab_log_lines(records, tmp_log, tmp_dir)
+        save_data({"next_id": max([r.get("id", 0) for r in records], default=0) + 1},
+                  os.path.join(tmp_dir, "meta.json"))
+        os.replace(tmp_log, VIRTUAL_LAB_LOG_FILE)
+        os.rename(tmp_dir, VIRTUAL_LAB_INDEX_DIR)
+
+def load_lab_log():
+    """Membaca seluruh record lab dari log (untuk analitik kelas)"""
+    if not os.path.exists(VIRTUAL_LAB_LOG_FILE):
+        return []
+    records = []
+    with open(VIRTUAL_LAB_LOG_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+    return records
+
 def save_lab_result(user_id, circuit_type, parameters, results, analysis):
-    lab_results = load_data(VIRTUAL_LAB_FILE)
-    
     new_result = {
-        "id": len(lab_results) + 1,
         "user_id": user_id,
         "circuit_type": circuit_type,
         "parameters": parameters,
@@ -609,15 +1455,162 @@ def save_lab_result(user_id, circuit_type, parameters, results, analysis):
         "created_at": datetime.now().isoformat()
     }
     
-    lab_results.append(new_result)
-    save_data(lab_results, VIRTUAL_LAB_FILE)
+    # Hanya satu baris log, satu baris indeks user, dan penghitung ID kecil yang ditulis
+    with _lab_log_lock():
+        previous_size = _lab_log_size()
+        meta = load_json_dict(VIRTUAL_LAB_META_FILE)
+        new_result = dict(id=meta.get("next_id", 1), **new_result)
+        _append_lab_log_lines([new_result])
+        save_data({"next_id": new_result["id"] + 1}, VIRTUAL_LAB_META_FILE)
+        _append_lab_frame(new_result, previous_size, _lab_log_size())
+    log_event(user_id, "lab", at=new_result["created_at"], result_id=new_result["id"], circuit_type=circuit_type)
     return new_result
 
-def get_user_lab_results(user_id):
-    lab_results = load_data(VIRTUAL_LAB_FILE)
-    user_results = [r for r in lab_results if r.get("user_id") == user_id]
-    user_results.sort(key=lambda x: x.get("created_at"), reverse=True)
-    return user_results
+def _read_lab_entries(entries):
+    """Deserialisasi hanya record yang ditunjuk (offset, panjang) di indeks (seek langsung ke offset)"""
+    records = []
+    with open(VIRTUAL_LAB_LOG_FILE, "rb") as f:
+        for offset, length in entries:
+            f.seek(offset)
+            records.append(json.loads(f.read(length).decode("utf-8")))
+    return records
+
+def count_user_lab_results(user_id):
+    try:
+        return os.path.getsize(_lab_user_index_path(user_id)) // LAB_INDEX_LINE_BYTES
+    except OSError:
+        return 0
+
+def _read_lab_index_range(user_id, start, stop):
+    """Entri indeks ke-start sampai sebelum stop (urut waktu) tanpa membaca baris lain"""
+    with open(_lab_user_index_path(user_id), "rb") as f:
+        f.seek(start * LAB_INDEX_LINE_BYTES)
+        lines = f.read((stop - start) * LAB_INDEX_LINE_BYTES).decode("ascii").splitlines()
+    return [tuple(int(part) for part in line.split()) for line in lines]
+
+def get_user_lab_results(user_id, page=None, limit=None):
+    """Hasil lab user terbaru lebih dulu; dengan page/limit hanya halaman itu yang dibaca dari log"""
+    total = count_user_lab_results(user_id)
+    start, stop = 0, total
+    if page is not None and limit:
+        stop = max(total - (page - 1) * limit, 0)
+        start = max(stop - limit, 0)
+    if start >= stop:
+        return []
+    return _read_lab_entries(reversed(_read_lab_index_range(user_id, start, stop)))
+
+LAB_RESIDUAL_TOLERANCE = 0.01  # hasil dibulatkan 3 desimal, residu di atas ini dianggap janggal
+
+def _lab_records_to_frame(lab_results):
+    """Mengubah daftar hasil lab menjadi DataFrame kolumnar beserta residu KCL/KVL"""
+    if not lab_results:
+        return pd.DataFrame(columns=["id", "user_id", "circuit_type", "created_at", "kcl_residual", "kvl_residual"])
+    
+    base = pd.DataFrame({
+        "id": [r.get("id") for r in lab_results],
+        "user_id": [r.get("user_id") for r in lab_results],
+        "circuit_type": [r.get("circuit_type") for r in lab_results],
+        "created_at": pd.to_datetime([r.get("created_at") for r in lab_results], errors="coerce", format="ISO8601"),
+    })
+    params = pd.DataFrame([r.get("parameters") or {} for r in lab_results]).add_prefix("p_")
+    results = pd.DataFrame([r.get("results") or {} for r in lab_results]).add_prefix("r_")
+    frame = pd.concat([base, params.select_dtypes("number"), results.select_dtypes("number")], axis=1)
+    
+    def col(name):
+        return frame[name] if name in frame else pd.Series(0.0, index=frame.index)
+    
+    ctype = frame["circuit_type"]
+    kcl = pd.Series(0.0, index=frame.index)
+    kvl = pd.Series(0.0, index=frame.index)
+    
+    # Residu Hukum Kirchhoff dihitung ulang dari parameter & hasil tersimpan, per jenis rangkaian
+    series = ctype == "series"
+    kvl[series] = col("p_voltage")[series] - (col("r_V1") + col("r_V2") + col("r_V3").fillna(0))[series]
+    
+    parallel = ctype == "parallel"
+    kcl[parallel] = col("r_I_total")[parallel] - (col("r_I1") + col("r_I2") + col("r_I3").fillna(0))[parallel]
+    
+    complex_ = ctype == "complex"
+    kcl[complex_] = (col("r_I_R1") - col("r_I_R2") - col("r_I_R3"))[complex_]
+    loop1 = col("p_V1") - col("r_V_R1") - col("r_V_R2")
+    loop2 = col("p_V2") - col("r_V_R2") + col("r_V_R3")
+    kvl[complex_] = np.maximum(loop1.abs(), loop2.abs())[complex_]
+    
+    netlist = ctype == "netlist"
+    kcl[netlist] = col("r_kcl_residual")[netlist]
+    
+    frame["kcl_residual"] = kcl.abs().fillna(0.0)
+    frame["kvl_residual"] = kvl.abs().fillna(0.0)
+    return frame
+
+@st.cache_resource(show_spinner=False)
+def _lab_frame_store():
+    """Cache kolumnar hasil lab yang dibagi semua sesi dalam proses ini"""
+    return {"offset": 0, "frame": None, "pending": [], "lock": threading.Lock()}
+
+def _lab_log_size():
+    try:
+        return os.path.getsize(VIRTUAL_LAB_LOG_FILE)
+    except OSError:
+        return 0
+
+def _read_lab_log_tail(offset):
+    """Record lengkap di log lab mulai dari offset byte; mengembalikan (records, offset baris utuh terakhir)"""
+    with open(VIRTUAL_LAB_LOG_FILE, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    # Baris yang masih ditulis (tanpa newline) dibaca pada panggilan berikutnya
+    complete = data[:data.rfind(b"\n") + 1]
+    records = [json.loads(line) for line in complete.splitlines() if line.strip()]
+    return records, offset + len(complete)
+
+def _load_lab_frame_snapshot():
+    """Frame kolumnar yang disimpan di disk beserta offset log yang sudah tercakup"""
+    try:
+        snapshot = pd.read_pickle(LAB_FRAME_SNAPSHOT_FILE)
+        return snapshot["frame"], snapshot["offset"]
+    except (OSError, KeyError, ValueError, EOFError, pickle.UnpicklingError):
+        return _lab_records_to_frame([]), 0
+
+def _save_lab_frame_snapshot(frame, offset):
+    if not os.path.isdir(VIRTUAL_LAB_INDEX_DIR):
+        return
+    tmp_path = LAB_FRAME_SNAPSHOT_FILE + ".tmp"
+    pd.to_pickle({"frame": frame, "offset": offset}, tmp_path)
+    os.replace(tmp_path, LAB_FRAME_SNAPSHOT_FILE)
+
+def _concat_lab_frames(frame, extra):
+    return extra if frame.empty else pd.concat([frame, extra], ignore_index=True)
+
+def get_lab_frame():
+    """Mendapatkan cache kolumnar hasil lab; hanya bagian log yang belum tercakup yang di-parse.
+    Frame disimpan ke disk setiap kali log dibaca, jadi restart cukup membaca ekor log"""
+    store = _lab_frame_store()
+    with store["lock"]:
+        if store["frame"] is None:
+            store["frame"], store["offset"] = _load_lab_frame_snapshot()
+            store["pending"] = []
+        size = _lab_log_size()
+        if size < store["offset"]:
+            # Log ditulis ulang (mis. migrasi): bangun ulang dari awal
+            store["frame"], store["offset"], store["pending"] = _lab_records_to_frame([]), 0, []
+        if store["pending"]:
+            store["frame"] = _concat_lab_frames(store["frame"], _lab_records_to_frame(store["pending"]))
+            store["pending"] = []
+        if size > store["offset"]:
+            records, store["offset"] = _read_lab_log_tail(store["offset"])
+            if records:
+                store["frame"] = _concat_lab_frames(store["frame"], _lab_records_to_frame(records))
+            _save_lab_frame_snapshot(store["frame"], store["offset"])
+        return store["frame"]
+
+def _append_lab_frame(new_result, previous_size, new_size):
+    """Menambahkan hasil baru ke cache kolumnar tanpa membaca ulang log lab"""
+    store = _lab_frame_store()
+    with store["lock"]:
+        if store["frame"] is not None and store["offset"] == previous_size:
+            store["pending"].append(new_result)
+            store["offset"] = new_size
 
 def solve_kirchhoff_circuit(circuit_type, parameters):
     if circuit_type == "series":
@@ -731,85 +1724,318 @@ def analyze_kirchhoff_laws(results, circuit_type, parameters=None):
         else:
             analysis.append("✅ Hukum Kirchhoff 2 (KVL): Perhitungan loop membutuhkan parameter rangkaian")
     
+    elif circuit_type == "netlist":
+        analysis.append(f"✅ Hukum Kirchhoff 1 (KCL): Residu arus maksimum di node = {results['kcl_residual']:.2e} A")
+        analysis.append(f"✅ Hukum Kirchhoff 2 (KVL): Tegangan node konsisten dengan {len(results['node_voltages'])} persamaan node")
+    
     return analysis
 
-def create_circuit_diagram(circuit_type, parameters, results):
+# Template figure per jenis rangkaian: trace & layout dibangun sekali, lalu setiap
+# rerun hanya menambal teks anotasi / nilai bar (tanpa validasi ulang template Plotly)
+CIRCUIT_DIAGRAM_LABELS = {
+    "series": [
+        (0.5, 0.1, "V = {voltage}V", 0),
+        (1.5, 0.1, "R1 = {R1}Ω", 0),
+        (2.5, 0.1, "R2 = {R2}Ω", 0),
+        (1.5, -0.1, "I = {I_total}A", 0),
+    ],
+    "parallel": [
+        (0.2, 0.5, "V = {voltage}V", -90),
+        (1, 0.5, "R1 = {R1}Ω", -90),
+        (2, 0.5, "R2 = {R2}Ω", -90),
+        (1.5, 1.1, "I_total = {I_total}A", 0),
+    ],
+    "complex": [
+        (1, 0, "R1 = {R1}Ω", 0),
+        (3, 0, "R3 = {R3}Ω", 0),
+        (2, 1, "R2 = {R2}Ω", 0),
+        (0, 1, "V1 = {V1}V", 0),
+        (4, 1, "V2 = {V2}V", 0),
+        (0.5, 0.5, "I1 = {I_loop1}A", 0),
+        (3.5, 0.5, "I2 = {I_loop2}A", 0),
+    ],
+}
+
+RESULTS_CHART_SPECS = {
+    "series": {
+        "title": "Distribusi Tegangan dalam Rangkaian Seri",
+        "labels": ['Tegangan R1', 'Tegangan R2', 'Tegangan Total'],
+        "y_title": "Tegangan (V)",
+        "colors": ['blue', 'green', 'red'],
+    },
+    "parallel": {
+        "title": "Distribusi Arus dalam Rangkaian Paralel",
+        "labels": ['Arus R1', 'Arus R2', 'Arus Total'],
+        "y_title": "Arus (A)",
+        "colors": ['blue', 'green', 'red'],
+    },
+    "complex": {
+        "title": "Distribusi Arus dalam Rangkaian Kompleks",
+        "labels": ['Arus Loop 1', 'Arus Loop 2', 'Arus R1', 'Arus R2', 'Arus R3'],
+        "y_title": "Arus (A)",
+        "colors": None,
+    },
+}
+
+def _figure_to_template(fig):
+    """Serialisasi figure menjadi dict template yang bisa ditambal"""
+    return json.loads(json.dumps(fig.to_plotly_json(), cls=PlotlyJSONEncoder))
+
+@st.cache_resource(show_spinner=False)
+def get_circuit_diagram_template(circuit_type):
+    """Membangun template diagram rangkaian sekali per jenis rangkaian"""
+    fig = go.Figure()
     if circuit_type == "series":
-        fig = go.Figure()
         fig.add_trace(go.Scatter(x=[0, 1], y=[0, 0], mode='lines', line=dict(color='red', width=3), name='Baterai'))
         fig.add_trace(go.Scatter(x=[1, 2], y=[0, 0], mode='lines', line=dict(color='blue', width=2), name='R1'))
         fig.add_trace(go.Scatter(x=[2, 3], y=[0, 0], mode='lines', line=dict(color='green', width=2), name='R2'))
-        
-        fig.add_annotation(x=0.5, y=0.1, text=f"V = {parameters['voltage']}V", showarrow=False)
-        fig.add_annotation(x=1.5, y=0.1, text=f"R1 = {parameters['R1']}Ω", showarrow=False)
-        fig.add_annotation(x=2.5, y=0.1, text=f"R2 = {parameters['R2']}Ω", showarrow=False)
-        fig.add_annotation(x=1.5, y=-0.1, text=f"I = {results['I_total']}A", showarrow=False)
-        
-        fig.update_layout(title="Rangkaian Seri", showlegend=False, 
-                         xaxis=dict(visible=False), yaxis=dict(visible=False),
-                         width=400, height=200)
+        fig.update_layout(title="Rangkaian Seri", width=400, height=200)
         
     elif circuit_type == "parallel":
-        fig = go.Figure()
         fig.add_trace(go.Scatter(x=[0, 3], y=[1, 1], mode='lines', line=dict(color='black', width=2)))
         fig.add_trace(go.Scatter(x=[0, 3], y=[0, 0], mode='lines', line=dict(color='black', width=2)))
         fig.add_trace(go.Scatter(x=[1, 1], y=[1, 0], mode='lines', line=dict(color='blue', width=2), name='R1'))
         fig.add_trace(go.Scatter(x=[2, 2], y=[1, 0], mode='lines', line=dict(color='green', width=2), name='R2'))
         fig.add_trace(go.Scatter(x=[0.2, 0.2], y=[0, 1], mode='lines', line=dict(color='red', width=3), name='Baterai'))
-        
-        fig.add_annotation(x=0.2, y=0.5, text=f"V = {parameters['voltage']}V", showarrow=False, textangle=-90)
-        fig.add_annotation(x=1, y=0.5, text=f"R1 = {parameters['R1']}Ω", showarrow=False, textangle=-90)
-        fig.add_annotation(x=2, y=0.5, text=f"R2 = {parameters['R2']}Ω", showarrow=False, textangle=-90)
-        fig.add_annotation(x=1.5, y=1.1, text=f"I_total = {results['I_total']}A", showarrow=False)
-        
-        fig.update_layout(title="Rangkaian Paralel", showlegend=False,
-                         xaxis=dict(visible=False), yaxis=dict(visible=False),
-                         width=400, height=300)
+        fig.update_layout(title="Rangkaian Paralel", width=400, height=300)
     
     elif circuit_type == "complex":
-        fig = go.Figure()
         fig.add_trace(go.Scatter(x=[0, 2, 2, 0, 0], y=[0, 0, 2, 2, 0], 
                                 mode='lines', line=dict(color='blue', width=2), name='Loop 1'))
         fig.add_trace(go.Scatter(x=[2, 4, 4, 2, 2], y=[0, 0, 2, 2, 0], 
                                 mode='lines', line=dict(color='green', width=2), name='Loop 2'))
-        
-        fig.add_annotation(x=1, y=0, text=f"R1 = {parameters['R1']}Ω", showarrow=False)
-        fig.add_annotation(x=3, y=0, text=f"R3 = {parameters['R3']}Ω", showarrow=False)
-        fig.add_annotation(x=2, y=1, text=f"R2 = {parameters['R2']}Ω", showarrow=False)
-        fig.add_annotation(x=0, y=1, text=f"V1 = {parameters['V1']}V", showarrow=False)
-        fig.add_annotation(x=4, y=1, text=f"V2 = {parameters['V2']}V", showarrow=False)
-        fig.add_annotation(x=0.5, y=0.5, text=f"I1 = {results.get('I_loop1', 0)}A", showarrow=False)
-        fig.add_annotation(x=3.5, y=0.5, text=f"I2 = {results.get('I_loop2', 0)}A", showarrow=False)
-        
-        fig.update_layout(title="Rangkaian Kompleks Dua Loop", showlegend=False,
-                         xaxis=dict(visible=False), yaxis=dict(visible=False),
-                         width=500, height=300)
+        fig.update_layout(title="Rangkaian Kompleks Dua Loop", width=500, height=300)
+    
+    for x, y, _, angle in CIRCUIT_DIAGRAM_LABELS.get(circuit_type, []):
+        fig.add_annotation(x=x, y=y, text="", showarrow=False, textangle=angle or None)
     
-    return fig
+    fig.update_layout(showlegend=False, xaxis=dict(visible=False), yaxis=dict(visible=False))
+    return _figure_to_template(fig)
+
+@st.cache_resource(show_spinner=False)
+def get_results_chart_template(circuit_type):
+    """Membangun template grafik hasil sekali per jenis rangkaian"""
+    spec = RESULTS_CHART_SPECS[circuit_type]
+    fig = go.Figure(go.Bar(x=spec["labels"], y=[0] * len(spec["labels"]),
+                           marker_color=spec["colors"]))
+    fig.update_layout(title=spec["title"], xaxis_title="Komponen", yaxis_title=spec["y_title"])
+    return _figure_to_template(fig)
+
+@st.cache_resource(max_entries=512, show_spinner=False)
+def _patched_figure(kind, circuit_type, texts, values):
+    """Cache figure yang sudah ditambal per kombinasi teks anotasi / nilai bar.
+    Validasi plotly hanya terjadi saat cache miss; objek dibagi antar sesi, jadi hanya untuk dibaca"""
+    if kind == "diagram":
+        fig_dict = copy.deepcopy(get_circuit_diagram_template(circuit_type))
+        for annotation, text in zip(fig_dict["layout"].get("annotations", []), texts):
+            annotation["text"] = text
+    else:
+        fig_dict = copy.deepcopy(get_results_chart_template(circuit_type))
+        fig_dict["data"][0]["y"] = list(values)
+    return go.Figure(fig_dict)
+
+def create_circuit_diagram(circuit_type, parameters, results):
+    fields = {"I_loop1": 0, "I_loop2": 0}
+    fields.update(parameters)
+    fields.update(results)
+    texts = tuple(fmt.format(**fields) for _, _, fmt, _ in CIRCUIT_DIAGRAM_LABELS.get(circuit_type, []))
+    return _patched_figure("diagram", circuit_type, texts, ())
 
 def create_results_chart(results, circuit_type):
     if circuit_type == "series":
-        labels = ['Tegangan R1', 'Tegangan R2', 'Tegangan Total']
-        values = [results['V1'], results['V2'], results['V1'] + results['V2']]
-        fig = px.bar(x=labels, y=values, title="Distribusi Tegangan dalam Rangkaian Seri",
-                    labels={'x': 'Komponen', 'y': 'Tegangan (V)'})
-        fig.update_traces(marker_color=['blue', 'green', 'red'])
+        values = (results['V1'], results['V2'], results['V1'] + results['V2'])
         
     elif circuit_type == "parallel":
-        labels = ['Arus R1', 'Arus R2', 'Arus Total']
-        values = [results['I1'], results['I2'], results['I_total']]
-        fig = px.bar(x=labels, y=values, title="Distribusi Arus dalam Rangkaian Paralel",
-                    labels={'x': 'Komponen', 'y': 'Arus (A)'})
-        fig.update_traces(marker_color=['blue', 'green', 'red'])
+        values = (results['I1'], results['I2'], results['I_total'])
         
     elif circuit_type == "complex":
-        labels = ['Arus Loop 1', 'Arus Loop 2', 'Arus R1', 'Arus R2', 'Arus R3']
-        values = [results.get('I_loop1', 0), results.get('I_loop2', 0), 
-                 results.get('I_R1', 0), results.get('I_R2', 0), results.get('I_R3', 0)]
-        fig = px.bar(x=labels, y=values, title="Distribusi Arus dalam Rangkaian Kompleks",
-                    labels={'x': 'Komponen', 'y': 'Arus (A)'})
+        values = (results.get('I_loop1', 0), results.get('I_loop2', 0), 
+                  results.get('I_R1', 0), results.get('I_R2', 0), results.get('I_R3', 0))
     
-    return fig
+    return _patched_figure("chart", circuit_type, (), values)
+
+# ===================== Netlist Solver ===================== #
+NETLIST_GROUND = "0"
+NETLIST_REFACTOR_INTERVAL = 200  # faktorisasi ulang penuh setelah sekian update rank-1
+
+DEFAULT_NETLIST = [
+    {"name": "V1", "type": "V", "n_plus": "1", "n_minus": "0", "value": 12.0},
+    {"name": "R1", "type": "R", "n_plus": "1", "n_minus": "2", "value": 10.0},
+    {"name": "R2", "type": "R", "n_plus": "2", "n_minus": "0", "value": 20.0},
+    {"name": "R3", "type": "R", "n_plus": "2", "n_minus": "3", "value": 30.0},
+    {"name": "V2", "type": "V", "n_plus": "3", "n_minus": "0", "value": 6.0},
+]
+
+def generate_ladder_netlist(num_nodes, voltage=12.0, r_series=10.0, r_shunt=100.0):
+    """Membuat netlist rangkaian tangga (ladder) dengan jumlah node tertentu"""
+    netlist = [{"name": "V1", "type": "V", "n_plus": "1", "n_minus": NETLIST_GROUND, "value": voltage}]
+    for i in range(1, num_nodes + 1):
+        if i < num_nodes:
+            netlist.append({"name": f"RS{i}", "type": "R", "n_plus": str(i), "n_minus": str(i + 1), "value": r_series})
+        netlist.append({"name": f"RP{i}", "type": "R", "n_plus": str(i), "n_minus": NETLIST_GROUND, "value": r_shunt})
+    return netlist
+
+def build_netlist_system(netlist):
+    """Menyusun sistem Modified Nodal Analysis (MNA) dan memfaktorkan matriksnya sekali"""
+    components = []
+    names = set()
+    for row in netlist:
+        name = str(row.get("name") or "").strip()
+        comp_type = str(row.get("type") or "").strip().upper()
+        n_plus = str(row.get("n_plus") or "").strip()
+        n_minus = str(row.get("n_minus") or "").strip()
+        if not name:
+            continue
+        if name in names:
+            return {"error": f"Nama komponen '{name}' duplikat"}
+        if comp_type not in ("R", "V"):
+            return {"error": f"Tipe komponen '{name}' harus R atau V"}
+        if not n_plus or not n_minus or n_plus == n_minus:
+            return {"error": f"Node komponen '{name}' tidak valid"}
+        try:
+            value = float(row.get("value"))
+        except (TypeError, ValueError):
+            return {"error": f"Nilai komponen '{name}' tidak valid"}
+        # NaN (sel data_editor yang dikosongkan) lolos dari perbandingan <= 0, jadi dicek terpisah
+        if comp_type == "R" and not (math.isfinite(value) and value > 0):
+            return {"error": f"Hambatan '{name}' harus lebih dari 0"}
+        if not math.isfinite(value):
+            return {"error": f"Nilai komponen '{name}' tidak valid"}
+        names.add(name)
+        components.append({"name": name, "type": comp_type, "n_plus": n_plus, "n_minus": n_minus, "value": value})
+    
+    if not components:
+        return {"error": "Netlist kosong"}
+    
+    nodes = sorted({n for c in components for n in (c["n_plus"], c["n_minus"]) if n != NETLIST_GROUND},
+                   key=lambda n: (len(n), n))
+    node_index = {n: i for i, n in enumerate(nodes)}
+    node_index[NETLIST_GROUND] = -1
+    num_nodes = len(nodes)
+    sources = [c for c in components if c["type"] == "V"]
+    size = num_nodes + len(sources)
+    
+    A = np.zeros((size, size))
+    z = np.zeros(size)
+    source_row = {}
+    for c in components:
+        a, b = node_index[c["n_plus"]], node_index[c["n_minus"]]
+        if c["type"] == "R":
+            g = 1 / c["value"]
+            if a >= 0:
+                A[a, a] += g
+            if b >= 0:
+                A[b, b] += g
+            if a >= 0 and b >= 0:
+                A[a, b] -= g
+                A[b, a] -= g
+        else:
+            k = num_nodes + len(source_row)
+            source_row[c["name"]] = k
+            if a >= 0:
+                A[a, k] = A[k, a] = 1
+            if b >= 0:
+                A[b, k] = A[k, b] = -1
+            z[k] = c["value"]
+    
+    # Invers eksplisit (bukan faktor LU) karena update Sherman-Morrison memperbarui A^-1 itu sendiri dan
+    # membutuhkan kolom A^-1 secara langsung; matriks MNA tangga (≤ ~1000 node) masih murah untuk dibalik
+    try:
+        A_inv = np.linalg.inv(A)
+    except np.linalg.LinAlgError:
+        return {"error": "Tidak dapat menyelesaikan sistem persamaan (cek node mengambang / loop sumber tegangan)"}
+    
+    return {
+        "components": components,
+        "component_index": {c["name"]: i for i, c in enumerate(components)},
+        "nodes": nodes,
+        "node_index": node_index,
+        "source_row": source_row,
+        "A_inv": A_inv,
+        "z": z,
+        "x": A_inv @ z,
+        "updates_since_factorization": 0,
+    }
+
+def update_netlist_component(system, name, value):
+    """Mengubah nilai satu komponen dengan update rank-1 (Sherman-Morrison) tanpa faktorisasi ulang"""
+    i = system["component_index"].get(name)
+    if i is None:
+        return system
+    component = system["components"][i]
+    value = float(value)
+    if not math.isfinite(value) or value == component["value"]:
+        return system
+    
+    if component["type"] == "V":
+        # Hanya vektor kanan yang berubah: x' = x + A^-1[:, k] * ΔV
+        k = system["source_row"][name]
+        delta = value - component["value"]
+        system["z"][k] = value
+        system["x"] = system["x"] + system["A_inv"][:, k] * delta
+        component["value"] = value
+        return system
+    
+    if value <= 0:
+        return system
+    
+    a = system["node_index"][component["n_plus"]]
+    b = system["node_index"][component["n_minus"]]
+    delta_g = 1 / value - 1 / component["value"]
+    
+    # A' = A + Δg·u·uᵀ dengan u = e_a - e_b (node ground tidak punya baris)
+    A_inv = system["A_inv"]
+    A_inv_u = (A_inv[:, a] if a >= 0 else 0) - (A_inv[:, b] if b >= 0 else 0)
+    uT_A_inv_u = (A_inv_u[a] if a >= 0 else 0) - (A_inv_u[b] if b >= 0 else 0)
+    denominator = 1 + delta_g * uT_A_inv_u
+    
+    if abs(denominator) < 1e-12 or system["updates_since_factorization"] + 1 >= NETLIST_REFACTOR_INTERVAL:
+        # Nilai baru hanya dipakai bila faktorisasi ulang berhasil, agar nilai dan A_inv tetap sepadan
+        rebuilt = build_netlist_system([dict(c, value=value) if c is component else c for c in system["components"]])
+        if "error" not in rebuilt:
+            system.update(rebuilt)
+        return system
+    
+    uT_A_inv = (A_inv[a, :] if a >= 0 else 0) - (A_inv[b, :] if b >= 0 else 0)
+    A_inv -= np.outer(A_inv_u, uT_A_inv) * (delta_g / denominator)
+    uT_x = (system["x"][a] if a >= 0 else 0) - (system["x"][b] if b >= 0 else 0)
+    system["x"] = system["x"] - A_inv_u * (delta_g * uT_x / denominator)
+    system["updates_since_factorization"] += 1
+    component["value"] = value
+    return system
+
+def get_netlist_results(system):
+    """Menghitung tegangan node, arus tiap komponen, dan residu KCL dari solusi MNA"""
+    num_nodes = len(system["nodes"])
+    x = system["x"]
+    # Tambahkan ground (0 V) di indeks -1 agar lookup node tidak perlu percabangan
+    voltages = np.append(x[:num_nodes], 0.0)
+    components = system["components"]
+    a = np.array([system["node_index"][c["n_plus"]] for c in components])
+    b = np.array([system["node_index"][c["n_minus"]] for c in components])
+    values = np.array([c["value"] for c in components])
+    is_resistor = np.array([c["type"] == "R" for c in components])
+    
+    currents = np.zeros(len(components))
+    currents[is_resistor] = (voltages[a[is_resistor]] - voltages[b[is_resistor]]) / values[is_resistor]
+    for name, k in system["source_row"].items():
+        # Arus MNA mengalir masuk ke terminal +; dibalik agar positif saat sumber mengalirkan arus
+        currents[system["component_index"][name]] = -x[k]
+    
+    # KCL: jumlah arus yang keluar dari setiap node harus nol
+    node_sum = np.zeros(num_nodes + 1)
+    branch = np.where(is_resistor, currents, -currents)
+    np.add.at(node_sum, a, branch)
+    np.add.at(node_sum, b, -branch)
+    kcl_residual = float(np.max(np.abs(node_sum[:num_nodes]))) if num_nodes else 0.0
+    
+    power = float(np.sum(values[~is_resistor] * currents[~is_resistor]))
+    return {
+        "node_voltages": {n: round(float(voltages[i]), 6) for i, n in enumerate(system["nodes"])},
+        "currents": {c["name"]: round(float(currents[i]), 6) for i, c in enumerate(components)},
+        "kcl_residual": kcl_residual,
+        "P_total": round(power, 3),
+    }
 
 # ===================== Virtual Lab UI ===================== #
 def show_virtual_lab():
@@ -829,7 +2055,7 @@ def show_virtual_lab():
     </div>
     """, unsafe_allow_html=True)
     
-    tab1, tab2, tab3, tab4 = st.tabs(["🔌 Rangkaian Seri", "🔌 Rangkaian Paralel", "🔌 Rangkaian Kompleks", "📋 Riwayat Eksperimen"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["🔌 Rangkaian Seri", "🔌 Rangkaian Paralel", "🔌 Rangkaian Kompleks", "🧩 Editor Netlist", "📋 Riwayat Eksperimen"])
     
     with tab1:
         show_series_circuit_lab()
@@ -838,6 +2064,8 @@ def show_virtual_lab():
     with tab3:
         show_complex_circuit_lab()
     with tab4:
+        show_netlist_editor_lab()
+    with tab5:
         show_lab_history()
 
 def show_series_circuit_lab():
@@ -1002,6 +2230,113 @@ def show_complex_circuit_lab():
         else:
             st.info("Atur parameter rangkaian dan klik 'Jalankan Eksperimen' untuk melihat hasil")
 
+def _apply_netlist_slider(name):
+    """Callback slider: komponen hanya diubah saat slider benar-benar digeser"""
+    system = st.session_state.get("netlist_system")
+    if system:
+        update_netlist_component(system, name, st.session_state[f"netlist_slider_{name}"])
+
+def show_netlist_editor_lab():
+    st.header("🧩 Editor Netlist")
+    st.write("Susun rangkaian sendiri: setiap baris adalah satu komponen (R = resistor, V = sumber tegangan). "
+             f"Node `{NETLIST_GROUND}` adalah ground.")
+    
+    if "netlist_rows" not in st.session_state:
+        st.session_state.netlist_rows = [dict(row) for row in DEFAULT_NETLIST]
+    
+    col1, col2 = st.columns([1, 1])
+    
+    with col1:
+        st.subheader("Konfigurasi Rangkaian")
+        with st.expander("⚙️ Buat Contoh Rangkaian Tangga"):
+            ladder_nodes = st.number_input("Jumlah Node", min_value=2, max_value=1000, value=50, key="ladder_nodes")
+            if st.button("Buat Rangkaian Tangga", key="make_ladder"):
+                st.session_state.netlist_rows = generate_ladder_netlist(int(ladder_nodes))
+                st.session_state.pop("netlist_system", None)
+                st.session_state.pop("netlist_table", None)
+                st.rerun()
+        
+        edited = st.data_editor(
+            pd.DataFrame(st.session_state.netlist_rows, columns=["name", "type", "n_plus", "n_minus", "value"]),
+            num_rows="dynamic",
+            use_container_width=True,
+            key="netlist_table",
+            column_config={
+                "name": st.column_config.TextColumn("Komponen"),
+                "type": st.column_config.SelectboxColumn("Tipe", options=["R", "V"]),
+                "n_plus": st.column_config.TextColumn("Node +"),
+                "n_minus": st.column_config.TextColumn("Node -"),
+                "value": st.column_config.NumberColumn("Nilai (Ω / V)"),
+            }
+        )
+        
+        if st.button("Bangun & Selesaikan Rangkaian", key="build_netlist"):
+            st.session_state.netlist_rows = edited.to_dict("records")
+            system = build_netlist_system(st.session_state.netlist_rows)
+            if "error" in system:
+                st.error(system["error"])
+                st.session_state.pop("netlist_system", None)
+            else:
+                # Slider lama harus direset agar tidak menimpa nilai netlist yang baru
+                for key in [k for k in st.session_state if str(k).startswith("netlist_slider_")]:
+                    del st.session_state[key]
+                st.session_state.netlist_system = system
+        
+        system = st.session_state.get("netlist_system")
+        if system:
+            st.subheader("🎚️ Ubah Nilai Komponen")
+            names = [c["name"] for c in system["components"]]
+            selected = st.selectbox("Komponen", names, key="netlist_component")
+            component = system["components"][system["component_index"][selected]]
+            # Rentang slider dari nilai netlist saat dibangun, agar nilai di luar rentang bawaan tidak terpotong
+            built_value = next((float(r["value"]) for r in st.session_state.netlist_rows if r.get("name") == selected),
+                               component["value"])
+            if component["type"] == "R":
+                st.slider(f"{selected} (Ω)", min(1.0, built_value), max(1000.0, 2 * built_value), float(component["value"]), 1.0,
+                          key=f"netlist_slider_{selected}", on_change=_apply_netlist_slider, args=(selected,))
+            else:
+                st.slider(f"{selected} (V)", min(0.0, 2 * built_value), max(48.0, 2 * abs(built_value)),
+                          float(component["value"]), 0.1,
+                          key=f"netlist_slider_{selected}", on_change=_apply_netlist_slider, args=(selected,))
+    
+    with col2:
+        st.subheader("Hasil Eksperimen")
+        system = st.session_state.get("netlist_system")
+        if not system:
+            st.info("Susun netlist lalu klik 'Bangun & Selesaikan Rangkaian' untuk melihat hasil")
+            return
+        
+        results = get_netlist_results(system)
+        analysis = analyze_kirchhoff_laws(results, "netlist")
+        
+        col_a, col_b = st.columns(2)
+        with col_a:
+            st.metric("Jumlah Node", len(system["nodes"]))
+            st.metric("Jumlah Komponen", len(system["components"]))
+        with col_b:
+            st.metric("Daya Total", f"{results['P_total']} W")
+            st.metric("Update sejak faktorisasi", system["updates_since_factorization"])
+        
+        st.subheader("📊 Arus Komponen")
+        st.dataframe(
+            pd.DataFrame({"Komponen": list(results["currents"]), "Arus (A)": list(results["currents"].values())}),
+            use_container_width=True, hide_index=True, height=250
+        )
+        st.subheader("📊 Tegangan Node")
+        st.dataframe(
+            pd.DataFrame({"Node": list(results["node_voltages"]), "Tegangan (V)": list(results["node_voltages"].values())}),
+            use_container_width=True, hide_index=True, height=250
+        )
+        
+        st.subheader("🔍 Analisis Hukum Kirchhoff")
+        for line in analysis:
+            st.write(line)
+        
+        if st.session_state.authenticated and st.button("💾 Simpan Eksperimen", key="save_netlist"):
+            parameters = {"netlist": [dict(c) for c in system["components"]]}
+            save_lab_result(st.session_state.current_user.get("id"), "netlist", parameters, results, analysis)
+            st.success("✅ Eksperimen netlist disimpan ke riwayat!")
+
 def show_lab_history():
     st.header("📋 Riwayat Eksperimen")
     
@@ -1010,27 +2345,52 @@ def show_lab_history():
         return
     
     user_id = st.session_state.current_user.get("id")
-    lab_results = get_user_lab_results(user_id)
+    total = count_user_lab_results(user_id)
     
-    if not lab_results:
+    if not total:
         st.info("Belum ada riwayat eksperimen. Lakukan eksperimen di tab lainnya.")
         return
     
-    for result in lab_results:
-        with st.expander(f"🔬 {result['circuit_type'].title()} - {result['created_at'][:16]}"):
-            col1, col2 = st.columns(2)
-            with col1:
-                st.subheader("Parameter")
-                for key, value in result['parameters'].items():
+    col1, col2 = st.columns([1, 1])
+    with col2:
+        limit = st.selectbox("Eksperimen per halaman", [10, 25, 50, 100], key="lab_history_limit")
+    total_pages = (total + limit - 1) // limit
+    with col1:
+        page = st.number_input(f"Halaman (dari {total_pages})", min_value=1, max_value=total_pages, value=1, key="lab_history_page")
+    
+    lab_results = get_user_lab_results(user_id, page=page, limit=limit)
+    st.caption(f"Menampilkan {len(lab_results)} dari {total} eksperimen")
+    
+    st.dataframe(
+        pd.DataFrame([{
+            "ID": r.get("id"),
+            "Waktu": r.get("created_at", "")[:16],
+            "Rangkaian": r.get("circuit_type", "").title(),
+            "Parameter": ", ".join(f"{k}={v}" for k, v in r.get("parameters", {}).items() if not isinstance(v, (list, dict))),
+        } for r in lab_results]),
+        use_container_width=True, hide_index=True
+    )
+    
+    selected = st.selectbox(
+        "Lihat detail eksperimen",
+        [None] + lab_results,
+        format_func=lambda r: "Pilih eksperimen..." if r is None else f"#{r['id']} {r['circuit_type'].title()} - {r['created_at'][:16]}",
+        key=f"lab_history_detail_{page}_{limit}"
+    )
+    if selected:
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader("Parameter")
+            for key, value in selected['parameters'].items():
+                st.write(f"**{key}:** {value}")
+        with col2:
+            st.subheader("Hasil")
+            for key, value in selected['results'].items():
+                if not key.startswith('_'):
                     st.write(f"**{key}:** {value}")
-            with col2:
-                st.subheader("Hasil")
-                for key, value in result['results'].items():
-                    if not key.startswith('_'):
-                        st.write(f"**{key}:** {value}")
-            st.subheader("Analisis Hukum Kirchhoff")
-            for line in result['analysis']:
-                st.write(line)
+        st.subheader("Analisis Hukum Kirchhoff")
+        for line in selected['analysis']:
+            st.write(line)
 
 # ===================== Quiz UI Components ===================== #
 def show_quiz_ui(course_id, module_id):
@@ -1052,43 +2412,72 @@ def show_quiz_ui(course_id, module_id):
     for quiz in quizzes:
         with st.expander(f"🧠 {quiz.get('title')} - {quiz.get('quiz_type').title()}", expanded=True):
             st.write(f"**Deskripsi:** {quiz.get('description')}")
-            st.write(f"**Jumlah Soal:** {len(quiz.get('questions', []))}")
+            st.write(f"**Jumlah Soal:** {len(get_quiz_questions(quiz))}")
             st.write(f"**Batas Attempt:** {quiz.get('max_attempts', 1)}")
             
             if quiz.get('time_limit'):
                 st.write(f"**Batas Waktu:** {quiz.get('time_limit')} menit")
             
             # Cek attempt user
-            user_attempts = get_user_quiz_attempts(quiz.get("id"), current_user.get("id"))
+            attempt_summary = get_quiz_attempt_summary(quiz.get("id"), current_user.get("id"))
             max_attempts = quiz.get("max_attempts", 1)
             
-            if len(user_attempts) >= max_attempts:
+            if attempt_summary["count"] >= max_attempts:
                 st.warning(f"❌ Anda sudah mencapai batas attempt ({max_attempts}) untuk kuis ini.")
                 
                 # Tampilkan hasil terbaik
-                best_result = max(user_attempts, key=lambda x: x.get("percentage", 0))
-                st.write(f"**Nilai Terbaik:** {best_result.get('percentage')}%")
+                st.write(f"**Nilai Terbaik:** {attempt_summary['best_percentage']}%")
                 
                 if st.button("📊 Lihat Detail Hasil", key=f"view_results_{quiz.get('id')}"):
-                    show_quiz_results_detail(quiz, user_attempts)
+                    show_quiz_results_detail(quiz, get_user_quiz_attempts(quiz.get("id"), current_user.get("id")))
             else:
-                remaining_attempts = max_attempts - len(user_attempts)
+                remaining_attempts = max_attempts - attempt_summary["count"]
                 st.success(f"✅ Anda memiliki {remaining_attempts} attempt tersisa.")
                 
-                if st.button("🚀 Mulai Kuis", key=f"start_quiz_{quiz.get('id')}"):
+                # Sesi yang masih berjalan di server dapat dilanjutkan (mis. setelah koneksi terputus)
+                active_session = get_active_quiz_session(quiz.get("id"), current_user.get("id"))
+                if active_session:
+                    st.info("⏳ Anda memiliki attempt yang belum diselesaikan. Jawaban Anda sudah tersimpan.")
+                    start_label, start_key = "▶️ Lanjutkan Kuis", f"resume_quiz_{quiz.get('id')}"
+                else:
+                    start_label, start_key = "🚀 Mulai Kuis", f"start_quiz_{quiz.get('id')}"
+                
+                if st.button(start_label, key=start_key):
                     st.session_state.current_quiz = quiz
-                    st.session_state.quiz_answers = {}
+                    st.session_state.current_quiz_session = start_quiz_session(quiz, current_user.get("id"))
                     st.session_state.quiz_started = True
                     st.rerun()
 
+def _autosave_quiz_answer(session, position, widget_key):
+    # Penolakan karena waktu habis tidak perlu ditangani di sini: render berikutnya menutup sesi
+    outcome = record_quiz_answer(session, position, st.session_state.get(widget_key))
+    if "error" in outcome and not is_quiz_session_expired(session):
+        # Sesi sudah dinilai dari tab lain
+        _close_quiz_interface()
+        st.warning(outcome["error"])
+
+@st.fragment(run_every=5)
+def show_quiz_timer(session):
+    """Menampilkan sisa waktu kuis; saat habis, jalankan ulang halaman agar server menilai sesi"""
+    if is_quiz_session_expired(session):
+        st.rerun()
+    remaining = get_quiz_session_remaining(session)
+    st.info(f"⏱️ Sisa waktu: {remaining // 60:02d}:{remaining % 60:02d} — jawaban tersimpan otomatis")
+
+def _close_quiz_interface():
+    st.session_state.quiz_started = False
+    st.session_state.current_quiz = None
+    st.session_state.current_quiz_session = None
+
 def show_quiz_interface():
     """Menampilkan interface untuk mengerjakan kuis"""
-    if not hasattr(st.session_state, 'current_quiz') or not st.session_state.current_quiz:
+    if not st.session_state.get("current_quiz") or not st.session_state.get("current_quiz_session"):
         st.warning("Tidak ada kuis yang aktif.")
         return
     
     quiz = st.session_state.current_quiz
-    questions = quiz.get("questions", [])
+    session = st.session_state.current_quiz_session
+    questions = get_quiz_questions(quiz)
     
     st.markdown(f"""
     <div class='main-header'>
@@ -1097,54 +2486,62 @@ def show_quiz_interface():
     </div>
     """, unsafe_allow_html=True)
     
-    # Form kuis
-    with st.form(key="quiz_form"):
-        st.subheader("📝 Soal-soal Kuis")
+    # Batas waktu ditegakkan server: jika lewat, sesi dinilai dari jawaban yang tersimpan
+    if is_quiz_session_expired(session):
+        outcome = finish_quiz_session(session["quiz_id"], session["user_id"], timed_out=True)
+        _close_quiz_interface()
+        st.warning("⏰ Waktu pengerjaan habis. Jawaban yang sudah tersimpan telah dinilai otomatis.")
+        if outcome:
+            show_quiz_results(quiz, outcome["result"], outcome["detailed_results"])
+        else:
+            # Sesi sudah dinilai oleh pemeriksaan batas waktu saat halaman dimuat
+            show_quiz_results_detail(quiz, get_user_quiz_attempts(quiz.get("id"), session["user_id"]))
+        return
+    
+    if session.get("deadline"):
+        show_quiz_timer(session)
+    
+    form = session["form"]
+    
+    st.subheader("📝 Soal-soal Kuis")
+    
+    saved_answers = load_quiz_session_answers(session)
+    selected = []
+    for pos, (i, order) in enumerate(zip(form["question_order"], form["option_orders"])):
+        question = questions[i]
+        st.markdown(f"**{pos+1}. {question.get('question')}**")
         
-        for i, question in enumerate(questions):
-            st.markdown(f"**{i+1}. {question.get('question')}**")
-            
-            options = question.get("options", [])
-            user_answer = st.radio(
-                f"Pilih jawaban untuk soal {i+1}:",
-                options,
-                key=f"q_{i}",
-                index=None
-            )
-            
-            if user_answer:
-                st.session_state.quiz_answers[f"q_{i}"] = user_answer
-            
-            st.markdown("---")
+        options = question.get("options", [])
+        widget_key = f"quiz_{session['session_id']}_q_{pos}"
+        user_answer = st.radio(
+            f"Pilih jawaban untuk soal {pos+1}:",
+            range(len(order)),
+            format_func=lambda j, options=options, order=order: options[order[j]],
+            key=widget_key,
+            index=saved_answers.get(pos),
+            on_change=_autosave_quiz_answer,
+            args=(session, pos, widget_key)
+        )
+        selected.append(user_answer)
         
-        # Tombol submit
-        submitted = st.form_submit_button("✅ Submit Kuis", use_container_width=True)
+        st.markdown("---")
+    
+    # Tombol submit
+    if st.button("✅ Submit Kuis", use_container_width=True, key="submit_quiz"):
+        # Validasi jawaban
+        if any(answer is None for answer in selected):
+            st.error("❌ Harap jawab semua soal sebelum submit!")
+            return
         
-        if submitted:
-            # Validasi jawaban
-            if len(st.session_state.quiz_answers) != len(questions):
-                st.error("❌ Harap jawab semua soal sebelum submit!")
-                return
-            
-            # Hitung skor
-            score, detailed_results = calculate_quiz_score(questions, st.session_state.quiz_answers)
-            
-            # Simpan hasil
-            result = submit_quiz_result(
-                quiz.get("id"),
-                st.session_state.current_user.get("id"),
-                st.session_state.quiz_answers,
-                score,
-                len(questions)
-            )
-            
-            # Tampilkan hasil
-            show_quiz_results(quiz, result, detailed_results)
-            
-            # Reset state
-            st.session_state.quiz_started = False
-            st.session_state.current_quiz = None
-            st.session_state.quiz_answers = {}
+        # Penilaian dilakukan sekali di server dari log jawaban sesi
+        outcome = finish_quiz_session(session["quiz_id"], session["user_id"])
+        _close_quiz_interface()
+        if outcome is None:
+            st.warning("Attempt ini sudah dinilai sebelumnya.")
+            return
+        
+        # Tampilkan hasil
+        show_quiz_results(quiz, outcome["result"], outcome["detailed_results"])
 
 def show_quiz_results(quiz, result, detailed_results):
     """Menampilkan hasil kuis"""
@@ -1207,7 +2604,7 @@ def show_quiz_results_detail(quiz, user_attempts):
 
 def show_attempt_details(quiz, attempt):
     """Menampilkan detail jawaban untuk attempt tertentu"""
-    questions = quiz.get("questions", [])
+    questions = get_quiz_questions(quiz)
     user_answers = attempt.get("answers", {})
     
     st.subheader(f"📝 Detail Jawaban - Attempt {attempt.get('attempt_number')}")
@@ -1245,10 +2642,10 @@ def show_manage_quizzes():
         st.warning("Belum ada kursus yang tersedia.")
         return
     
-    course = courses[0]  # Ambil course pertama
+    course = get_active_course(courses)
     course_id = course.get("id")
     
-    tab1, tab2, tab3 = st.tabs(["➕ Buat Kuis Baru", "📋 Daftar Kuis", "📊 Lihat Hasil Kuis"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["➕ Buat Kuis Baru", "📋 Daftar Kuis", "📊 Lihat Hasil Kuis", "🏦 Bank Soal", "📈 N-Gain"])
     
     with tab1:
         show_create_quiz_form(course_id)
@@ -1258,12 +2655,18 @@ def show_manage_quizzes():
     
     with tab3:
         show_quiz_results_admin(course_id)
+    
+    with tab4:
+        show_question_bank(course_id)
+    
+    with tab5:
+        show_learning_gain_admin(course_id)
 
 def show_create_quiz_form(course_id):
     """Form untuk membuat kuis baru"""
     st.subheader("➕ Buat Kuis Baru")
     
-    module_id = st.selectbox("Pilih Modul", range(1, 8), format_func=lambda x: f"Modul {x}")
+    module_id = st.selectbox("Pilih Modul", get_course_module_ids(course_id), format_func=lambda x: f"Modul {x}")
     quiz_type = st.selectbox("Tipe Kuis", ["pre-test", "post-test", "formative", "summative"])
     title = st.text_input("Judul Kuis")
     description = st.text_area("Deskripsi Kuis")
@@ -1273,55 +2676,102 @@ def show_create_quiz_form(course_id):
     st.subheader("📝 Soal-soal Kuis")
     
     questions = []
-    
-    # Input untuk beberapa soal
-    num_questions = st.number_input("Jumlah Soal", min_value=1, max_value=20, value=5)
-    
-    for i in range(num_questions):
-        st.markdown(f"### Soal {i+1}")
-        
-        question_text = st.text_input(f"Pertanyaan {i+1}", key=f"q_{i}_text")
-        
-        # Input untuk opsi jawaban
-        num_options = st.number_input(f"Jumlah Opsi Jawaban {i+1}", min_value=2, max_value=5, value=4, key=f"q_{i}_options")
-        
-        options = []
-        for j in range(num_options):
-            option = st.text_input(f"Opsi {j+1}", key=f"q_{i}_opt_{j}")
-            if option:
-                options.append(option)
-        
-        # Pilih jawaban benar
-        if options:
-            correct_answer = st.selectbox(f"Jawaban Benar untuk Soal {i+1}", options, key=f"q_{i}_correct")
+    question_refs = []
+    topic = None
+    
+    source = st.radio("Sumber Soal", ["Tulis soal baru", "Ambil dari bank soal"], horizontal=True, key="quiz_question_source")
+    
+    if source == "Ambil dari bank soal":
+        topics = get_bank_topics(course_id, module_id)
+        topic_filter = st.selectbox("Topik", [None] + topics, format_func=lambda t: "Semua Topik" if t is None else t,
+                                    key="quiz_bank_topic")
+        bank_items = get_bank_questions(course_id, module_id, topic_filter)
+        if not bank_items:
+            st.info("Bank soal untuk modul ini masih kosong.")
         else:
-            correct_answer = None
-            st.warning("Harap isi semua opsi jawaban")
-        
-        if question_text and options and correct_answer:
-            questions.append({
-                "question": question_text,
-                "options": options,
-                "correct_answer": correct_answer
-            })
+            st.write(f"**Tersedia:** {len(bank_items)} soal")
+            selected_items = st.multiselect(
+                "Pilih Soal",
+                bank_items,
+                format_func=lambda item: f"#{item.get('id')} [{item.get('topic')}] {item.get('question')}",
+                key="quiz_bank_items"
+            )
+            question_refs = [item.get("id") for item in selected_items]
+    else:
+        topic = st.text_input("Topik Soal (untuk bank soal)", placeholder="Contoh: Hukum Kirchhoff 1", key="quiz_topic")
         
-        st.markdown("---")
+        # Input untuk beberapa soal
+        num_questions = st.number_input("Jumlah Soal", min_value=1, max_value=20, value=5)
+        
+        for i in range(num_questions):
+            st.markdown(f"### Soal {i+1}")
+            
+            question_text = st.text_input(f"Pertanyaan {i+1}", key=f"q_{i}_text")
+            
+            # Input untuk opsi jawaban
+            num_options = st.number_input(f"Jumlah Opsi Jawaban {i+1}", min_value=2, max_value=5, value=4, key=f"q_{i}_options")
+            
+            options = []
+            for j in range(num_options):
+                option = st.text_input(f"Opsi {j+1}", key=f"q_{i}_opt_{j}")
+                if option:
+                    options.append(option)
+            
+            # Pilih jawaban benar
+            if options:
+                correct_answer = st.selectbox(f"Jawaban Benar untuk Soal {i+1}", options, key=f"q_{i}_correct")
+            else:
+                correct_answer = None
+                st.warning("Harap isi semua opsi jawaban")
+            
+            if question_text and options and correct_answer:
+                questions.append({
+                    "question": question_text,
+                    "options": options,
+                    "correct_answer": correct_answer
+                })
+            
+            st.markdown("---")
     
     if st.button("💾 Buat Kuis", use_container_width=True):
         if not title or not description:
             st.error("Judul dan deskripsi kuis harus diisi!")
             return
         
-        if len(questions) == 0:
+        if len(questions) == 0 and len(question_refs) == 0:
             st.error("Harap tambahkan setidaknya satu soal!")
             return
         
         quiz = create_quiz(course_id, module_id, title, description, questions, quiz_type, 
-                          time_limit if time_limit > 0 else None, max_attempts)
+                          time_limit if time_limit > 0 else None, max_attempts,
+                          question_refs=question_refs, topic=topic)
         
         st.success(f"✅ Kuis '{title}' berhasil dibuat!")
         st.balloons()
 
+def show_question_bank(course_id):
+    """Ringkasan dan daftar soal di bank soal"""
+    st.subheader("🏦 Bank Soal")
+    
+    items = get_bank_questions(course_id)
+    if not items:
+        st.info("Bank soal masih kosong. Soal akan masuk ke bank saat kuis dibuat.")
+        return
+    
+    bank = pd.DataFrame([{"Modul": item.get("module_id"), "Topik": item.get("topic")} for item in items])
+    st.dataframe(bank.groupby(["Modul", "Topik"]).size().reset_index(name="Jumlah Soal"),
+                 use_container_width=True, hide_index=True)
+    
+    module_id = st.selectbox("Lihat Soal Modul", sorted(bank["Modul"].dropna().unique()),
+                             format_func=lambda x: f"Modul {x}", key="bank_module")
+    st.dataframe(pd.DataFrame([{
+        "ID": item.get("id"),
+        "Topik": item.get("topic"),
+        "Pertanyaan": item.get("question"),
+        "Jumlah Opsi": len(item.get("options", [])),
+        "Jawaban Benar": item.get("correct_answer"),
+    } for item in get_bank_questions(course_id, int(module_id))]), use_container_width=True, hide_index=True)
+
 def show_quizzes_list(course_id):
     """Menampilkan daftar kuis"""
     st.subheader("📋 Daftar Kuis")
@@ -1338,27 +2788,21 @@ def show_quizzes_list(course_id):
             
             with col1:
                 st.write(f"**Deskripsi:** {quiz.get('description')}")
-                st.write(f"**Jumlah Soal:** {len(quiz.get('questions', []))}")
+                st.write(f"**Jumlah Soal:** {len(get_quiz_questions(quiz))}")
                 st.write(f"**Batas Attempt:** {quiz.get('max_attempts', 1)}")
                 
                 if quiz.get('time_limit'):
                     st.write(f"**Batas Waktu:** {quiz.get('time_limit')} menit")
                 
-                # Statistik kuis
-                results = get_quiz_results(quiz.get("id"))
-                if results:
-                    avg_score = sum(r.get("percentage", 0) for r in results) / len(results)
-                    st.write(f"**Rata-rata Nilai:** {avg_score:.1f}%")
-                    st.write(f"**Total Attempt:** {len(results)}")
+                # Statistik kuis dari agregat berjalan
+                stats = get_quiz_stats(quiz.get("id"))
+                if stats:
+                    st.write(f"**Rata-rata Nilai:** {stats['mean']:.1f}% (simpangan baku {stats['std']:.1f})")
+                    st.write(f"**Total Attempt:** {stats['count']}")
             
             with col2:
                 if st.button("🗑️ Hapus", key=f"delete_quiz_{quiz.get('id')}"):
-                    quizzes_data = load_data(QUIZZES_FILE)
-                    for i, q in enumerate(quizzes_data):
-                        if q.get("id") == quiz.get("id"):
-                            quizzes_data[i]["is_active"] = False
-                            break
-                    save_data(quizzes_data, QUIZZES_FILE)
+                    set_quiz_active(quiz.get("id"), False)
                     st.success("✅ Kuis berhasil dihapus!")
                     st.rerun()
                 
@@ -1384,27 +2828,62 @@ def show_quiz_results_admin(course_id):
     )
     
     if selected_quiz:
-        results = get_quiz_results(selected_quiz.get("id"))
+        stats = get_quiz_stats(selected_quiz.get("id"))
         
-        if not results:
+        if not stats:
             st.info("Belum ada hasil kuis untuk kuis ini.")
             return
         
         # Statistik umum
         st.subheader("📈 Statistik Kuis")
-        col1, col2, col3, col4 = st.columns(4)
+        col1, col2, col3, col4, col5 = st.columns(5)
         
         with col1:
-            avg_score = sum(r.get("percentage", 0) for r in results) / len(results)
-            st.metric("Rata-rata Nilai", f"{avg_score:.1f}%")
+            st.metric("Rata-rata Nilai", f"{stats['mean']:.1f}%")
         with col2:
-            max_score = max(r.get("percentage", 0) for r in results)
-            st.metric("Nilai Tertinggi", f"{max_score}%")
+            st.metric("Simpangan Baku", f"{stats['std']:.1f}")
         with col3:
-            min_score = min(r.get("percentage", 0) for r in results)
-            st.metric("Nilai Terendah", f"{min_score}%")
+            st.metric("Nilai Tertinggi", f"{stats['max']:g}%")
         with col4:
-            st.metric("Total Attempt", len(results))
+            st.metric("Nilai Terendah", f"{stats['min']:g}%")
+        with col5:
+            st.metric("Total Attempt", stats["count"])
+        
+        bin_width = 100 // QUIZ_HISTOGRAM_BINS
+        fig = go.Figure(go.Bar(
+            x=[f"{i * bin_width}-{(i + 1) * bin_width}" for i in range(QUIZ_HISTOGRAM_BINS)],
+            y=stats["histogram"],
+            marker_color="#3498db"
+        ))
+        fig.update_layout(title="Distribusi Nilai", xaxis_title="Rentang Nilai (%)", yaxis_title="Jumlah Attempt", height=300)
+        st.plotly_chart(fig, use_container_width=True)
+        
+        results = get_quiz_results(selected_quiz.get("id"))
+        
+        # Analisis butir soal
+        questions = get_quiz_questions(selected_quiz)
+        if questions:
+            st.subheader("🔎 Analisis Butir Soal")
+            item_stats = analyze_quiz_items(questions, [r.get("answers", {}) for r in results])
+            frequencies = item_stats["option_frequencies"]
+            answer_key = get_quiz_answer_key(questions)
+            rows = []
+            for i, question in enumerate(questions):
+                options = question.get("options", [])
+                row = {
+                    "Soal": i + 1,
+                    "Pertanyaan": question.get("question"),
+                    "Kunci": chr(ord("A") + int(answer_key[i])) if answer_key[i] >= 0 else "-",
+                    "Tingkat Kesukaran (p)": round(float(item_stats["difficulty"][i]), 3),
+                    "Daya Beda (r_pb)": None if np.isnan(item_stats["discrimination"][i]) else round(float(item_stats["discrimination"][i]), 3),
+                    "Kosong": int(frequencies[i, 0]),
+                }
+                for j in range(frequencies.shape[1] - 1):
+                    row[f"Opsi {chr(ord('A') + j)}"] = int(frequencies[i, j + 1]) if j < len(options) else None
+                rows.append(row)
+            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+            st.caption("p = proporsi siswa menjawab benar; r_pb = korelasi butir dengan skor total tanpa butir tersebut. "
+                       "Kolom opsi menunjukkan frekuensi pilihan tiap opsi.")
         
         # Tabel hasil
         st.subheader("📋 Detail Hasil per Siswa")
@@ -1426,9 +2905,57 @@ def show_quiz_results_admin(course_id):
                     if st.button(f"Lihat Detail Jawaban", key=f"view_{result.get('id')}"):
                         show_attempt_details_admin(selected_quiz, result, student)
 
+def show_learning_gain_admin(course_id):
+    """Menampilkan N-Gain (Hake) dari pasangan pre-test dan post-test per siswa dan modul"""
+    st.subheader("📈 N-Gain Pre-test / Post-test")
+    
+    frame = get_learning_gain_frame(course_id)
+    complete = frame.dropna(subset=["pre", "post"])
+    if complete.empty:
+        st.info("Belum ada siswa yang mengerjakan pre-test dan post-test pada modul yang sama.")
+        return
+    
+    summary = summarize_learning_gain(frame)
+    class_pre, class_post = complete["pre"].mean(), complete["post"].mean()
+    class_gain = (class_post - class_pre) / (100 - class_pre) if class_pre < 100 else float("nan")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Rata-rata Pre-test", f"{class_pre:.1f}%")
+    with col2:
+        st.metric("Rata-rata Post-test", f"{class_post:.1f}%")
+    with col3:
+        st.metric("N-Gain Kelas", "-" if pd.isna(class_gain) else f"{class_gain:.2f}")
+    with col4:
+        st.metric("Kategori", classify_gain(class_gain))
+    
+    st.subheader("📊 N-Gain per Modul")
+    fig = go.Figure(go.Bar(
+        x=[f"Modul {m}" for m in summary["module_id"]],
+        y=summary["g_kelas"],
+        marker_color="#2ecc71"
+    ))
+    fig.add_hline(y=0.7, line_dash="dash", line_color="#27ae60", annotation_text="Tinggi")
+    fig.add_hline(y=0.3, line_dash="dash", line_color="#f39c12", annotation_text="Sedang")
+    fig.update_layout(yaxis_title="<g>", height=350)
+    st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(summary.round(3), use_container_width=True, hide_index=True)
+    
+    st.subheader("🎓 N-Gain per Siswa")
+    names = {u.get("id"): u.get("name") for u in load_data_cached(USERS_FILE)}
+    module_id = st.selectbox("Modul", list(summary["module_id"]), format_func=lambda m: f"Modul {m}", key="gain_module")
+    table = complete[complete["module_id"] == module_id][["user_id", "pre", "post", "g"]].copy()
+    table.insert(1, "siswa", table["user_id"].map(names))
+    table["kategori"] = table["g"].map(classify_gain)
+    st.dataframe(table.sort_values("g", ascending=False).round(3), use_container_width=True, hide_index=True)
+    
+    missing_post = frame[frame["pre"].notna() & frame["post"].isna() & (frame["module_id"] == module_id)]
+    if not missing_post.empty:
+        st.caption(f"{len(missing_post)} siswa sudah mengerjakan pre-test tetapi belum post-test pada modul ini.")
+
 def show_attempt_details_admin(quiz, result, student):
     """Menampilkan detail jawaban untuk admin"""
-    questions = quiz.get("questions", [])
+    questions = get_quiz_questions(quiz)
     user_answers = result.get("answers", {})
     
     st.subheader(f"📝 Detail Jawaban - {student.get('name')}")
@@ -1450,12 +2977,15 @@ def show_attempt_details_admin(quiz, result, student):
         """, unsafe_allow_html=True)
 
 # ===================== Assignment System ===================== #
+@st.cache_resource(show_spinner=False)
+def _assignments_lock():
+    """Kunci proses untuk baca-ubah-tulis assignments.json (request maupun GC latar belakang)"""
+    return threading.Lock()
+
 def create_assignment(course_id, module_id, title, description, due_date, max_points=100, file_types=None):
     """Membuat tugas baru"""
-    assignments = load_data(ASSIGNMENTS_FILE)
-    
     new_assignment = {
-        "id": len(assignments) + 1,
+        "id": register_course_item("assignments", course_id),
         "course_id": course_id,
         "module_id": module_id,
         "title": title,
@@ -1467,8 +2997,10 @@ def create_assignment(course_id, module_id, title, description, due_date, max_po
         "is_active": True
     }
     
-    assignments.append(new_assignment)
-    save_data(assignments, ASSIGNMENTS_FILE)
+    with _assignments_lock():
+        assignments = load_course_data(course_id, ASSIGNMENTS_FILE)
+        assignments.append(new_assignment)
+        save_course_data(course_id, ASSIGNMENTS_FILE, assignments)
     
     # Notifikasi untuk siswa yang terdaftar
     users = load_data(USERS_FILE)
@@ -1487,114 +3019,203 @@ def create_assignment(course_id, module_id, title, description, due_date, max_po
     return new_assignment
 
 def delete_assignment(assignment_id):
-    """Menghapus tugas"""
-    assignments = load_data(ASSIGNMENTS_FILE)
-    assignment = next((a for a in assignments if a.get("id") == assignment_id), None)
+    """Menghapus tugas: tandai hapus (tombstone), submission & file dibersihkan GC di latar belakang"""
+    course_id = get_item_course_id("assignments", assignment_id)
+    with _assignments_lock():
+        assignments = load_course_data(course_id, ASSIGNMENTS_FILE)
+        assignment = next((a for a in assignments if a.get("id") == assignment_id), None)
+        if assignment:
+            # Nonaktifkan tugas daripada menghapus permanen
+            assignment["is_active"] = False
+            assignment["deleted_at"] = datetime.now().isoformat()
+            save_course_data(course_id, ASSIGNMENTS_FILE, assignments)
     
     if assignment:
-        # Nonaktifkan tugas daripada menghapus permanen
-        assignment["is_active"] = False
-        save_data(assignments, ASSIGNMENTS_FILE)
-        
-        # Hapus semua submission untuk tugas ini
-        submissions = load_data(SUBMISSIONS_FILE)
-        submissions = [s for s in submissions if s.get("assignment_id") != assignment_id]
-        save_data(submissions, SUBMISSIONS_FILE)
-        
+        schedule_submission_gc()
         return True
     return False
 
+# ---- Garbage collection submission ---- #
+@st.cache_resource(show_spinner=False)
+def _submission_store_lock():
+    """Kunci proses untuk baca-ubah-tulis submissions.json (request maupun GC latar belakang)"""
+    return threading.Lock()
+
+@st.cache_resource(show_spinner=False)
+def _submission_gc_state():
+    return {"lock": threading.Lock(), "thread": None, "pending": False}
+
+def schedule_submission_gc():
+    """Menjalankan GC di thread latar; permintaan selama GC berjalan digabung ke putaran berikutnya"""
+    state = _submission_gc_state()
+    store_lock = _submission_store_lock()
+    assignments_lock = _assignments_lock()
+    with state["lock"]:
+        state["pending"] = True
+        if state["thread"] is not None and state["thread"].is_alive():
+            return
+        state["thread"] = threading.Thread(target=_run_submission_gc, args=(state, store_lock, assignments_lock),
+                                           name="submission-gc", daemon=True)
+        state["thread"].start()
+
+def _run_submission_gc(state, store_lock, assignments_lock):
+    while True:
+        with state["lock"]:
+            if not state["pending"]:
+                return
+            state["pending"] = False
+        collect_submission_garbage(store_lock, assignments_lock)
+
+def collect_submission_garbage(store_lock, assignments_lock):
+    """Membersihkan submission & indeks milik tugas yang dihapus, blob tanpa referensi, dan upload parsial basi"""
+    # Kursus pemilik dicatat dari folder datanya, bukan dari registry, karena registry dibaca lewat
+    # cache Streamlit yang tidak tersedia di thread latar
+    deleted = {}
+    for course_id in list_course_data_ids():
+        for assignment in load_course_data(course_id, ASSIGNMENTS_FILE):
+            if assignment.get("deleted_at") and not assignment.get("purged_at"):
+                deleted[assignment.get("id")] = course_id
+    
+    with store_lock:
+        submissions = load_data(SUBMISSIONS_FILE)
+        if deleted:
+            kept = [s for s in submissions if s.get("assignment_id") not in deleted]
+            if len(kept) != len(submissions):
+                save_data(kept, SUBMISSIONS_FILE)
+                submissions = kept
+            submission_index = load_json_dict(SUBMISSION_INDEX_FILE)
+            save_data({k: v for k, v in submission_index.items() if int(k.split(":")[0]) not in deleted},
+                      SUBMISSION_INDEX_FILE)
+        referenced = {s.get("blob_id") for s in submissions if s.get("blob_id")}
+    
+    # Blob baru diberi masa tenggang: bisa saja belum tercatat oleh submit yang sedang berjalan
+    cutoff = time.time() - BLOB_GC_GRACE_SECONDS
+    removed = 0
+    if os.path.isdir(SUBMISSION_BLOB_DIR):
+        for name in os.listdir(SUBMISSION_BLOB_DIR):
+            path = _submission_blob_path(name)
+            if os.path.isfile(path) and name not in referenced and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+    
+    for course_id in set(deleted.values()):
+        with assignments_lock:
+            assignments = load_course_data(course_id, ASSIGNMENTS_FILE)
+            for assignment in assignments:
+                if assignment.get("id") in deleted:
+                    assignment["purged_at"] = datetime.now().isoformat()
+            save_course_data(course_id, ASSIGNMENTS_FILE, assignments)
+    return {"assignments": len(deleted), "blobs": removed}
+
 def get_assignments(course_id, module_id=None):
     """Mendapatkan daftar tugas"""
-    assignments = load_data(ASSIGNMENTS_FILE)
+    assignments = load_course_data(course_id, ASSIGNMENTS_FILE)
     if module_id:
-        return [a for a in assignments if a.get("course_id") == course_id and a.get("module_id") == module_id and a.get("is_active")]
+        return [a for a in assignments if a.get("module_id") == module_id and a.get("is_active")]
     else:
-        return [a for a in assignments if a.get("course_id") == course_id and a.get("is_active")]
+        return [a for a in assignments if a.get("is_active")]
 
 def get_assignment_by_id(assignment_id):
-    """Mendapatkan tugas berdasarkan ID"""
-    assignments = load_data(ASSIGNMENTS_FILE)
-    return next((a for a in assignments if a.get("id") == assignment_id), None)
+    """Mendapatkan tugas berdasarkan ID (hanya membaca file tugas milik kursusnya)"""
+    course_id = get_item_course_id("assignments", assignment_id)
+    if course_id is None:
+        return None
+    return next((a for a in load_course_data(course_id, ASSIGNMENTS_FILE) if a.get("id") == assignment_id), None)
 
-def submit_assignment(assignment_id, user_id, file_data, file_name, file_type, notes=""):
-    """Mengumpulkan tugas - VERSION IMPROVED"""
-    submissions = load_data(SUBMISSIONS_FILE)
-    
+def submit_assignment(assignment_id, user_id, file_data, file_name, file_type, notes="", blob=None):
+    """Mengumpulkan tugas - VERSION IMPROVED; isi file berupa blob dari store_submission_upload atau bytes"""
     # Pastikan tipe data konsisten
     assignment_id = int(assignment_id) if not isinstance(assignment_id, int) else assignment_id
     user_id = int(user_id) if not isinstance(user_id, int) else user_id
     
-    # Cari submission yang sudah ada
-    existing_index = None
-    for i, sub in enumerate(submissions):
-        sub_assignment_id = sub.get("assignment_id")
-        sub_user_id = sub.get("user_id")
-        
-        # Normalize types untuk comparison
-        if isinstance(sub_assignment_id, str):
-            try:
-                sub_assignment_id = int(sub_assignment_id)
-            except:
-                pass
-                
-        if isinstance(sub_user_id, str):
-            try:
-                sub_user_id = int(sub_user_id)
-            except:
-                pass
-        
-        if sub_assignment_id == assignment_id and sub_user_id == user_id:
-            existing_index = i
-            break
-    
-    # Prepare file data
-    if isinstance(file_data, bytes):
-        file_data_encoded = base64.b64encode(file_data).decode('utf-8')
-    else:
-        file_data_encoded = file_data
+    # Prepare file data: simpan sebagai blob di disk, bukan base64 di submissions.json
+    if blob is None:
+        if not isinstance(file_data, bytes):
+            file_data = base64.b64decode(file_data)
+        blob = write_submission_blob([file_data])
     
     # Prepare submission data
     submission_data = {
-        "file_data": file_data_encoded,
+        "file_data": None,
+        "blob_id": blob["blob_id"],
         "file_name": file_name,
         "file_type": file_type,
-        "file_size": len(file_data) if isinstance(file_data, bytes) else len(file_data_encoded),
+        "file_size": blob["file_size"],
         "notes": notes,
         "submission_text": notes,
         "submitted_at": datetime.now().isoformat(),
         "status": "submitted",
         "is_graded": False,
         "grade": None,
+        "score": None,
         "feedback": None,
         "graded_at": None,
         "graded_by": None
     }
     
-    if existing_index is not None:
-        # Update existing submission
-        submissions[existing_index].update(submission_data)
-        st.info("🔄 Memperbarui submission yang sudah ada...")
-    else:
-        # Create new submission
-        new_submission = {
-            "id": len(submissions) + 1,
-            "assignment_id": assignment_id,
-            "user_id": user_id
-        }
-        new_submission.update(submission_data)
-        submissions.append(new_submission)
-        st.info("🆕 Membuat submission baru...")
+    assignment = get_assignment_by_id(assignment_id)
+    replaced_blob = None
     
     # Save data dengan error handling
     try:
-        save_data(submissions, SUBMISSIONS_FILE)
+        with _submission_store_lock():
+            submissions = load_data(SUBMISSIONS_FILE)
+            
+            # Cari submission yang sudah ada
+            existing_index = None
+            for i, sub in enumerate(submissions):
+                sub_assignment_id = sub.get("assignment_id")
+                sub_user_id = sub.get("user_id")
+                
+                # Normalize types untuk comparison
+                if isinstance(sub_assignment_id, str):
+                    try:
+                        sub_assignment_id = int(sub_assignment_id)
+                    except:
+                        pass
+                        
+                if isinstance(sub_user_id, str):
+                    try:
+                        sub_user_id = int(sub_user_id)
+                    except:
+                        pass
+                
+                if sub_assignment_id == assignment_id and sub_user_id == user_id:
+                    existing_index = i
+                    break
+            
+            if existing_index is not None:
+                # Update existing submission
+                replaced_blob = submissions[existing_index].get("blob_id")
+                submissions[existing_index].update(submission_data)
+                saved = submissions[existing_index]
+                st.info("🔄 Memperbarui submission yang sudah ada...")
+            else:
+                # Create new submission; id dari maksimum karena baris lama bisa dibersihkan GC
+                saved = {
+                    "id": max((sub.get("id", 0) for sub in submissions), default=0) + 1,
+                    "assignment_id": assignment_id,
+                    "user_id": user_id
+                }
+                saved.update(submission_data)
+                submissions.append(saved)
+                st.info("🆕 Membuat submission baru...")
+            
+            save_data(submissions, SUBMISSIONS_FILE)
+            submission_index = load_json_dict(SUBMISSION_INDEX_FILE)
+            _update_submission_index(submission_index, saved, assignment.get("due_date") if assignment else None)
+            save_data(submission_index, SUBMISSION_INDEX_FILE)
+        log_event(user_id, "submission", (assignment or {}).get("course_id"),
+                  **_submission_event_data(saved, assignment, resubmitted=existing_index is not None))
         st.success("💾 Data berhasil disimpan!")
         
+        # File lama yang tergantikan dibersihkan di latar belakang
+        if replaced_blob and replaced_blob != blob["blob_id"]:
+            schedule_submission_gc()
+        
         # Notification
         users = load_data(USERS_FILE)
         student = next((u for u in users if u.get("id") == user_id), None)
-        assignment = get_assignment_by_id(assignment_id)
         
         if student and assignment:
             admins = [u for u in users if u.get("role") == "admin"]
@@ -1615,26 +3236,62 @@ def submit_assignment(assignment_id, user_id, file_data, file_name, file_type, n
         return False
 
 def get_submission(assignment_id, user_id):
-    """Mendapatkan submission user untuk tugas tertentu - SIMPLIFIED"""
+    """Mendapatkan submission lengkap user untuk tugas tertentu (untuk detail; daftar cukup pakai status)"""
+    status = get_submission_status(assignment_id, user_id)
+    if status is None:
+        return None
     submissions = load_data(SUBMISSIONS_FILE)
-    
-    # Debug info
-    print(f"DEBUG get_submission: assignment_id={assignment_id}, user_id={user_id}")
-    print(f"DEBUG: Total submissions: {len(submissions)}")
-    
-    for submission in submissions:
-        sub_assignment_id = submission.get("assignment_id")
-        sub_user_id = submission.get("user_id")
-        
-        print(f"DEBUG: Checking submission - assignment_id={sub_assignment_id}, user_id={sub_user_id}")
-        
-        # Simple comparison - biarkan Python handle type conversion
-        if sub_assignment_id == assignment_id and sub_user_id == user_id:
-            print(f"DEBUG: MATCH FOUND!")
-            return submission
-    
-    print(f"DEBUG: NO MATCH FOUND")
-    return None
+    return next((s for s in submissions if s.get("id") == status.get("submission_id")), None)
+
+# ---- Indeks status submission ---- #
+def is_submission_late(submitted_at, due_date):
+    """Terlambat jika dikumpulkan setelah batas waktu; batas berupa tanggal saja berlaku sampai akhir hari"""
+    if not submitted_at or not due_date:
+        return False
+    if len(due_date) <= 10:
+        return submitted_at[:10] > due_date
+    return datetime.fromisoformat(submitted_at) > datetime.fromisoformat(due_date)
+
+def _update_submission_index(submission_index, submission, due_date):
+    """Menyimpan ringkasan status submission (tanpa isi file) pada kunci assignment_id:user_id"""
+    key = f"{submission.get('assignment_id')}:{submission.get('user_id')}"
+    score = submission.get("score")
+    submission_index[key] = {
+        "submission_id": submission.get("id"),
+        "status": submission.get("status") or "submitted",
+        "score": score if score is not None else submission.get("grade"),
+        "graded_by": submission.get("graded_by"),
+        "file_name": submission.get("file_name"),
+        "submitted_at": submission.get("submitted_at"),
+        "late": is_submission_late(submission.get("submitted_at"), due_date)
+    }
+
+def rebuild_submission_index():
+    """Membangun ulang indeks status dari submissions.json"""
+    assignments = load_all_course_data(ASSIGNMENTS_FILE)
+    due_dates = {a.get("id"): a.get("due_date") for a in assignments}
+    deleted = {a.get("id") for a in assignments if a.get("deleted_at")}
+    submission_index = {}
+    for submission in load_data(SUBMISSIONS_FILE):
+        if submission.get("assignment_id") in deleted:
+            continue
+        _update_submission_index(submission_index, submission, due_dates.get(submission.get("assignment_id")))
+    save_data(submission_index, SUBMISSION_INDEX_FILE)
+    return submission_index
+
+def get_submission_status(assignment_id, user_id):
+    """Status submission user untuk satu tugas: lookup O(1) tanpa membaca submissions.json"""
+    return load_data_cached(SUBMISSION_INDEX_FILE, load_json_dict).get(f"{assignment_id}:{user_id}")
+
+def get_assignment_submission_counts(assignment_id):
+    """Jumlah submission, yang sudah dinilai, dan yang terlambat untuk satu tugas dari indeks status"""
+    prefix = f"{assignment_id}:"
+    entries = [e for k, e in load_data_cached(SUBMISSION_INDEX_FILE, load_json_dict).items() if k.startswith(prefix)]
+    return {
+        "total": len(entries),
+        "graded": sum(1 for e in entries if e.get("status") == "graded"),
+        "late": sum(1 for e in entries if e.get("late"))
+    }
 
 def get_all_submissions(assignment_id=None, course_id=None):
     """Mendapatkan semua submission (untuk admin)"""
@@ -1644,44 +3301,188 @@ def get_all_submissions(assignment_id=None, course_id=None):
         submissions = [s for s in submissions if s.get("assignment_id") == assignment_id]
     
     if course_id:
-        assignments = load_data(ASSIGNMENTS_FILE)
-        course_assignments = [a.get("id") for a in assignments if a.get("course_id") == course_id]
+        course_assignments = {a.get("id") for a in load_course_data(course_id, ASSIGNMENTS_FILE) if not a.get("deleted_at")}
         submissions = [s for s in submissions if s.get("assignment_id") in course_assignments]
     
     return submissions
 
-def grade_submission(submission_id, score, feedback, graded_by):
-    """Memberi nilai pada submission"""
-    submissions = load_data(SUBMISSIONS_FILE)
-    
-    for submission in submissions:
-        if submission.get("id") == submission_id:
+def grade_submissions_bulk(grades, graded_by):
+    """Menyimpan banyak nilai sekaligus: satu tulis submissions.json dan satu tulis notifikasi.
+    grades berisi dict {"submission_id", "score", "feedback"}; mengembalikan jumlah submission yang dinilai"""
+    grades_by_id = {g["submission_id"]: g for g in grades}
+    if not grades_by_id:
+        return 0
+    
+    graded_at = datetime.now().isoformat()
+    graded = []
+    with _submission_store_lock():
+        submissions = load_data(SUBMISSIONS_FILE)
+        for submission in submissions:
+            grade = grades_by_id.get(submission.get("id"))
+            if grade is None:
+                continue
             submission.update({
-                "score": score,
-                "feedback": feedback,
-                "graded_at": datetime.now().isoformat(),
+                "score": grade["score"],
+                "feedback": grade.get("feedback", ""),
+                "graded_at": graded_at,
                 "graded_by": graded_by,
                 "status": "graded"
             })
-            break
-    
-    save_data(submissions, SUBMISSIONS_FILE)
-    
-    # Notifikasi untuk siswa
-    submission = next((s for s in submissions if s.get("id") == submission_id), None)
-    if submission:
-        assignment = get_assignment_by_id(submission.get("assignment_id"))
-        create_notification(
-            submission.get("user_id"),
-            "📊 Nilai Tugas",
-            f"Tugas '{assignment.get('title')}' telah dinilai. Nilai: {score}",
-            "success" if score >= 70 else "warning",
-            assignment.get("course_id") if assignment else None,
-            assignment.get("module_id") if assignment else None
-        )
-    
+            graded.append(submission)
+        
+        if not graded:
+            return 0
+        save_data(submissions, SUBMISSIONS_FILE)
+        
+        assignments = {a_id: get_assignment_by_id(a_id) for a_id in {s.get("assignment_id") for s in graded}}
+        due_dates = {a_id: (a or {}).get("due_date") for a_id, a in assignments.items()}
+        submission_index = load_json_dict(SUBMISSION_INDEX_FILE)
+        for submission in graded:
+            _update_submission_index(submission_index, submission, due_dates.get(submission.get("assignment_id")))
+        save_data(submission_index, SUBMISSION_INDEX_FILE)
+    
+    # Notifikasi untuk siswa, disisipkan dalam satu batch
+    notifications = []
+    for submission in graded:
+        assignment = assignments.get(submission.get("assignment_id"))
+        score = submission.get("score")
+        notifications.append({
+            "user_id": submission.get("user_id"),
+            "title": "📊 Nilai Tugas",
+            "message": f"Tugas '{assignment.get('title') if assignment else '-'}' telah dinilai. Nilai: {score}",
+            "notification_type": "success" if score >= 70 else "warning",
+            "course_id": assignment.get("course_id") if assignment else None,
+            "module_id": assignment.get("module_id") if assignment else None
+        })
+    create_notifications(notifications)
+    return len(graded)
+
+def grade_submission(submission_id, score, feedback, graded_by):
+    """Memberi nilai pada submission"""
+    grade_submissions_bulk([{"submission_id": submission_id, "score": score, "feedback": feedback}], graded_by)
     return True
 
+# ---- Penyimpanan file submission (blob) ---- #
+def _submission_blob_path(blob_id):
+    return os.path.join(SUBMISSION_BLOB_DIR, blob_id)
+
+def write_submission_blob(chunks):
+    """Menulis potongan bytes ke file sementara sambil menghitung SHA-256, lalu memindahkannya
+    secara atomik ke blob beralamat hash (file identik disimpan sekali)"""
+    os.makedirs(SUBMISSION_BLOB_DIR, exist_ok=True)
+    # File sementara yang tertinggal karena proses mati tidak direferensikan, jadi ikut dihapus GC blob
+    tmp_path = _submission_blob_path(f".tmp-{secrets.token_hex(8)}")
+    hasher = hashlib.sha256()
+    size = 0
+    with open(tmp_path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            hasher.update(chunk)
+            size += len(chunk)
+    
+    blob_id = hasher.hexdigest()
+    if os.path.exists(_submission_blob_path(blob_id)):
+        os.remove(tmp_path)
+        os.utime(_submission_blob_path(blob_id))  # dipakai lagi: jangan sampai dianggap yatim oleh GC
+    else:
+        os.replace(tmp_path, _submission_blob_path(blob_id))
+    return {"blob_id": blob_id, "file_size": size}
+
+def has_submission_file(submission):
+    return bool(submission.get("blob_id") or submission.get("file_data"))
+
+def iter_submission_file_chunks(submission, chunk_size=EXPORT_CHUNK_SIZE):
+    """Membaca isi file submission per potongan dari blob (atau base64 lama yang didekode bertahap)"""
+    if submission.get("blob_id"):
+        with open(_submission_blob_path(submission["blob_id"]), "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+    
+    encoded = submission.get("file_data") or ""
+    step = max(chunk_size // 3, 1) * 4  # kelipatan 4 karakter base64 = kelipatan 3 byte
+    for start in range(0, len(encoded), step):
+        yield base64.b64decode(encoded[start:start + step])
+
+def read_submission_file(submission):
+    """Isi file submission (bytes) untuk st.download_button; handle file ditutup setelah dibaca"""
+    if submission.get("blob_id"):
+        with open(_submission_blob_path(submission["blob_id"]), "rb") as f:
+            return f.read()
+    return b"".join(iter_submission_file_chunks(submission))
+
+def migrate_submissions_to_blobs():
+    """Migrasi satu kali: pindahkan file base64 di submissions.json ke blob di disk"""
+    if not any(s.get("file_data") for s in load_data_cached(SUBMISSIONS_FILE)):
+        return
+    with _submission_store_lock():
+        submissions = load_data(SUBMISSIONS_FILE)
+        for submission in submissions:
+            if submission.get("file_data"):
+                blob = write_submission_blob(iter_submission_file_chunks(submission))
+                submission.update({"file_data": None, "blob_id": blob["blob_id"], "file_size": blob["file_size"]})
+        save_data(submissions, SUBMISSIONS_FILE)
+
+# ---- Upload tugas ---- #
+def store_submission_upload(assignment, user_id, uploaded_file, notes=""):
+    """Pipeline upload tugas: validasi tipe & ukuran -> tulis blob per potongan + hash -> catat submission"""
+    allowed_types = assignment.get("file_types", DEFAULT_SUBMISSION_FILE_TYPES)
+    if not is_file_type_allowed(uploaded_file.name, allowed_types):
+        return {"error": f"Tipe file tidak diizinkan. File yang diizinkan: {', '.join(allowed_types)}"}
+    if uploaded_file.size > MAX_SUBMISSION_SIZE:
+        return {"error": f"File terlalu besar. Maksimal {format_file_size(MAX_SUBMISSION_SIZE)}"}
+    
+    uploaded_file.seek(0)
+    blob = write_submission_blob(iter(lambda: uploaded_file.read(UPLOAD_CHUNK_SIZE), b""))
+    success = submit_assignment(assignment.get("id"), user_id, None, uploaded_file.name,
+                                uploaded_file.type, notes, blob=blob)
+    return {"success": success, "blob_id": blob["blob_id"]}
+
+# ---- Ekspor ZIP pengumpulan ---- #
+
+def _submission_archive_name(submission, student_name, used_names):
+    """Nama entri ZIP: <siswa>_<waktu submit>_<nama file>, unik dalam arsip"""
+    submitted_at = (submission.get("submitted_at") or "")[:19].replace(":", "").replace("-", "").replace("T", "-")
+    base = re.sub(r"[^\w.-]+", "_", f"{student_name}_{submitted_at}_{submission.get('file_name') or 'file'}")
+    name, counter = base, 1
+    while name in used_names:
+        stem, ext = os.path.splitext(base)
+        name, counter = f"{stem}_{counter}{ext}", counter + 1
+    used_names.add(name)
+    return name
+
+def write_submissions_zip(assignment_id, target):
+    """Menulis semua file submission tugas ke ZIP secara streaming; mengembalikan jumlah file"""
+    names = {u.get("id"): u.get("name") or f"siswa_{u.get('id')}" for u in load_data(USERS_FILE)}
+    used_names = set()
+    count = 0
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for submission in get_all_submissions(assignment_id):
+            if not has_submission_file(submission):
+                continue
+            student_name = names.get(submission.get("user_id"), f"siswa_{submission.get('user_id')}")
+            try:
+                submitted_at = datetime.fromisoformat(submission.get("submitted_at"))
+            except (TypeError, ValueError):
+                submitted_at = datetime.now()
+            info = zipfile.ZipInfo(_submission_archive_name(submission, student_name, used_names),
+                                   date_time=submitted_at.timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, "w", force_zip64=True) as entry:
+                for chunk in iter_submission_file_chunks(submission):
+                    entry.write(chunk)
+            count += 1
+    return count
+
+def export_assignment_submissions_zip(assignment_id):
+    """ZIP semua submission (dibangun di file sementara), dikembalikan sebagai bytes untuk diunduh"""
+    with tempfile.TemporaryFile() as target:
+        write_submissions_zip(assignment_id, target)
+        target.seek(0)
+        return target.read()
+
 def get_file_extension(file_name):
     """Mendapatkan ekstensi file"""
     return os.path.splitext(file_name)[1].lower()
@@ -1694,23 +3495,39 @@ def is_file_type_allowed(file_name, allowed_types):
 # ===================== Notifikasi System ===================== #
 def create_notification(user_id, title, message, notification_type="info", course_id=None, module_id=None):
     """Membuat notifikasi baru"""
-    notifications = load_data(NOTIFICATIONS_FILE)
-    
-    new_notification = {
-        "id": len(notifications) + 1,
+    return create_notifications([{
         "user_id": user_id,
         "title": title,
         "message": message,
-        "type": notification_type,
+        "notification_type": notification_type,
         "course_id": course_id,
-        "module_id": module_id,
-        "is_read": False,
-        "created_at": datetime.now().isoformat()
-    }
+        "module_id": module_id
+    }])[0]
+
+def create_notifications(items):
+    """Menyisipkan banyak notifikasi dengan satu kali tulis file"""
+    notifications = load_data(NOTIFICATIONS_FILE)
+    next_id = len(notifications) + 1
+    created_at = datetime.now().isoformat()
+    
+    new_notifications = []
+    for offset, item in enumerate(items):
+        new_notifications.append({
+            "id": next_id + offset,
+            "user_id": item.get("user_id"),
+            "title": item.get("title"),
+            "message": item.get("message"),
+            "type": item.get("notification_type", "info"),
+            "course_id": item.get("course_id"),
+            "module_id": item.get("module_id"),
+            "is_read": False,
+            "created_at": created_at
+        })
     
-    notifications.append(new_notification)
-    save_data(notifications, NOTIFICATIONS_FILE)
-    return new_notification
+    if new_notifications:
+        notifications.extend(new_notifications)
+        save_data(notifications, NOTIFICATIONS_FILE)
+    return new_notifications
 
 def get_user_notifications(user_id, unread_only=False):
     """Mendapatkan notifikasi user"""
@@ -1749,8 +3566,10 @@ def mark_all_notifications_as_read(user_id):
 
 def send_bulk_notification(user_ids, title, message, notification_type="info", course_id=None):
     """Mengirim notifikasi ke banyak user sekaligus"""
-    for user_id in user_ids:
-        create_notification(user_id, title, message, notification_type, course_id)
+    create_notifications([
+        {"user_id": user_id, "title": title, "message": message, "notification_type": notification_type, "course_id": course_id}
+        for user_id in user_ids
+    ])
 
 # ===================== Auth & Registration ===================== #
 def authenticate(username, password):
@@ -1781,26 +3600,73 @@ def register_student(name, username, password, email):
     return True
 
 # ===================== Course Management ===================== #
-def get_course_code(course_id=1):
-    course_codes = load_data(COURSE_CODES_FILE)
-    for cc in course_codes:
-        if cc.get("course_id") == course_id and cc.get("is_active") == True:
-            return cc.get("code")
-    return None
+def _build_course_code_index(filename):
+    """Kode akses aktif: lookup per kode dan per kursus"""
+    active = [cc for cc in load_data(filename) if cc.get("is_active") == True]
+    return {"by_code": {cc.get("code"): cc for cc in active}, "by_course": {cc.get("course_id"): cc for cc in active}}
+
+def get_course_code(course_id):
+    cc = load_data_cached(COURSE_CODES_FILE, _build_course_code_index)["by_course"].get(course_id)
+    return cc.get("code") if cc else None
 
-def validate_course_code(course_code, course_id=1):
+def validate_course_code(course_code, course_id=None):
+    """Validasi kode akses; tanpa course_id, kursus ditentukan dari kodenya"""
+    cc = load_data_cached(COURSE_CODES_FILE, _build_course_code_index)["by_code"].get(course_code)
+    if cc and (course_id is None or cc.get("course_id") == course_id):
+        return True, cc
+    return False, None
+
+def regenerate_course_code(course_id):
+    """Menonaktifkan kode lama kursus dan membuat kode akses baru"""
     course_codes = load_data(COURSE_CODES_FILE)
     for cc in course_codes:
-        if (cc.get("code") == course_code and 
-            cc.get("course_id") == course_id and 
-            cc.get("is_active") == True):
-            return True, cc
-    return False, None
+        if cc.get("course_id") == course_id:
+            cc["is_active"] = False
+    
+    new_code = generate_course_code()
+    course_codes.append({
+        "course_id": course_id,
+        "code": new_code,
+        "is_active": True,
+        "created_at": datetime.now().isoformat(),
+        "max_students": None
+    })
+    save_data(course_codes, COURSE_CODES_FILE)
+    return new_code
+
+def get_available_courses(user):
+    """Kursus yang bisa dipilih user: semua kursus untuk admin, kursus yang diikuti untuk siswa"""
+    courses = get_course_catalog()["courses"]
+    if not user or user.get("role") == "admin":
+        return courses
+    stored = next((u for u in load_data_cached(USERS_FILE) if u.get("id") == user.get("id")), user)
+    enrolled = stored.get("enrolled_courses", [])
+    return [c for c in courses if c.get("id") in enrolled]
+
+def get_active_course_id():
+    """Kursus aktif sesi ini (dipilih di sidebar); kursus pertama yang tersedia bila belum dipilih"""
+    course_ids = [c.get("id") for c in get_available_courses(st.session_state.get("current_user"))]
+    active = st.session_state.get("active_course_id")
+    if active not in course_ids:
+        active = course_ids[0] if course_ids else None
+        st.session_state.active_course_id = active
+    return active
+
+def get_active_course(courses):
+    """Objek kursus aktif di dalam list courses yang sudah dimuat (aman diubah lalu disimpan)"""
+    active = get_active_course_id()
+    return next((c for c in courses if c.get("id") == active), courses[0])
+
+def get_course_students(course_id, users=None):
+    users = load_data_cached(USERS_FILE) if users is None else users
+    return [u for u in users if u.get("role") == "student" and course_id in u.get("enrolled_courses", [])]
 
 def enroll_user_in_course(user_id, course_id, course_code):
+    """Mendaftarkan user ke kursus; course_id None berarti kursus mengikuti kode akses"""
     is_valid, code_data = validate_course_code(course_code, course_id)
     if not is_valid:
         return False, "❌ Kode akses tidak valid atau sudah tidak aktif."
+    course_id = code_data.get("course_id")
     
     users = load_data(USERS_FILE)
     for user in users:
@@ -1812,21 +3678,10 @@ def enroll_user_in_course(user_id, course_id, course_code):
             break
     save_data(users, USERS_FILE)
     
-    progress = load_data(PROGRESS_FILE)
-    existing_progress = next((p for p in progress if p.get("user_id") == user_id and p.get("course_id") == course_id), None)
-    if not existing_progress:
-        new_prog = {
-            "user_id": user_id,
-            "course_id": course_id,
-            "progress": 0,
-            "completed_modules": [],
-            "enrolled_at": datetime.now().isoformat(),
-            "last_accessed": datetime.now().isoformat()
-        }
-        progress.append(new_prog)
-        save_data(progress, PROGRESS_FILE)
+    start_course_progress(user_id, course_id, enrolled=True)
     
-    course = next((c for c in load_data(COURSES_FILE) if c.get("id") == course_id), None)
+    st.session_state.active_course_id = course_id
+    course = get_course_by_id(course_id)
     if course:
         create_notification(
             user_id,
@@ -1838,24 +3693,195 @@ def enroll_user_in_course(user_id, course_id, course_code):
     
     return True, "✅ Berhasil bergabung ke kursus!"
 
-# ===================== Attendance System ===================== #
+# ===================== Progress System ===================== #
+@st.cache_resource(show_spinner=False)
+def _progress_lock():
+    return threading.Lock()
+
+def _progress_key(user_id, course_id):
+    return f"{user_id}:{course_id}"
+
+def module_bit(module_id):
+    """Bit modul di completed_mask: modul 1 -> bit 0, dst."""
+    return 1 << (int(module_id) - 1)
+
+def get_course_module_mask(course_id):
+    mask = 0
+    for module_id in get_course_module_ids(course_id):
+        mask |= module_bit(module_id)
+    return mask
+
+def _new_progress_record(user_id, course_id, now, enrolled=False):
+    record = {
+        "user_id": user_id,
+        "course_id": course_id,
+        "completed_mask": 0,
+        "completed_at": {},
+        "last_accessed": now
+    }
+    if enrolled:
+        record["enrolled_at"] = now
+    return record
+
+def _store_progress_record(progress, record):
+    progress.setdefault("records", {})[_progress_key(record["user_id"], record["course_id"])] = record
+    courses = progress.setdefault("by_user", {}).setdefault(str(record["user_id"]), [])
+    if record["course_id"] not in courses:
+        courses.append(record["course_id"])
+
+def migrate_progress_to_bitsets():
+    """Mengubah daftar completed_modules di progress.json menjadi bitset (sekali saja)"""
+    if os.path.exists(PROGRESS_BITS_FILE):
+        return
+    progress = {"records": {}, "by_user": {}}
+    for old in load_data(PROGRESS_FILE):
+        record = _new_progress_record(old.get("user_id"), old.get("course_id"), old.get("last_accessed"))
+        if old.get("enrolled_at"):
+            record["enrolled_at"] = old.get("enrolled_at")
+        for module_id in old.get("completed_modules", []):
+            record["completed_mask"] |= module_bit(module_id)
+            record["completed_at"][str(module_id)] = old.get("last_accessed")
+        _store_progress_record(progress, record)
+    save_data(progress, PROGRESS_BITS_FILE)
+
+def get_user_progress(user_id, course_id=None):
+    """Record progress siswa untuk satu kursus (kursus pertama yang diikuti bila course_id None)"""
+    progress = load_data_cached(PROGRESS_BITS_FILE, load_json_dict)
+    if course_id is None:
+        courses = progress.get("by_user", {}).get(str(user_id), [])
+        if not courses:
+            return None
+        course_id = courses[0]
+    return progress.get("records", {}).get(_progress_key(user_id, course_id))
+
+def start_course_progress(user_id, course_id, enrolled=False):
+    """Membuat record progress bila belum ada"""
+    with _progress_lock():
+        progress = load_json_dict(PROGRESS_BITS_FILE)
+        if _progress_key(user_id, course_id) in progress.get("records", {}):
+            return False
+        _store_progress_record(progress, _new_progress_record(user_id, course_id, datetime.now().isoformat(), enrolled))
+        save_data(progress, PROGRESS_BITS_FILE)
+    return True
+
+def set_module_completed(user_id, course_id, module_id, completed=True):
+    """Menandai/membatalkan penyelesaian satu modul dengan satu operasi bit"""
+    now = datetime.now().isoformat()
+    with _progress_lock():
+        progress = load_json_dict(PROGRESS_BITS_FILE)
+        record = progress.get("records", {}).get(_progress_key(user_id, course_id))
+        if record is None:
+            record = _new_progress_record(user_id, course_id, now)
+            _store_progress_record(progress, record)
+        if completed:
+            record["completed_mask"] |= module_bit(module_id)
+            record["completed_at"][str(module_id)] = now
+        else:
+            record["completed_mask"] &= ~module_bit(module_id)
+            record["completed_at"].pop(str(module_id), None)
+        record["last_accessed"] = now
+        save_data(progress, PROGRESS_BITS_FILE)
+    log_event(user_id, "module", course_id, at=now, module_id=module_id, completed=completed)
+    return record
+
+def is_module_completed(record, module_id):
+    return bool(record and record.get("completed_mask", 0) & module_bit(module_id))
+
+def get_completed_module_ids(record):
+    mask = (record or {}).get("completed_mask", 0)
+    return [bit + 1 for bit in range(mask.bit_length()) if mask >> bit & 1]
+
+def get_progress_summary(record, course_id=None):
+    """(modul selesai, total modul, persen) — dihitung dari bitset terhadap modul kursus saat ini"""
+    course_id = course_id if course_id is not None else (record or {}).get("course_id")
+    course_mask = get_course_module_mask(course_id)
+    total = bin(course_mask).count("1")
+    completed = bin((record or {}).get("completed_mask", 0) & course_mask).count("1")
+    return completed, total, int(completed / total * 100) if total else 0
+
+def get_class_completion_matrix(course_id, user_ids):
+    """Matriks siswa x modul (bool) dari bitset dengan operasi bit vektor numpy"""
+    module_ids = get_course_module_ids(course_id)
+    records = load_data_cached(PROGRESS_BITS_FILE, load_json_dict).get("records", {})
+    # Mask disimpan sebagai int Python; modul di atas 64 tidak muat di uint64, pakai array objek
+    dtype = np.uint64 if max(module_ids, default=0) <= 64 else object
+    masks = np.array(
+        [records.get(_progress_key(uid, course_id), {}).get("completed_mask", 0) for uid in user_ids],
+        dtype=dtype
+    )
+    bits = np.array([module_bit(mid) for mid in module_ids], dtype=dtype)
+    return pd.DataFrame((masks[:, None] & bits[None, :]) != 0, index=list(user_ids), columns=module_ids)
+
+# ===================== Attendance System ===================== #
+@st.cache_resource(show_spinner=False)
+def _attendance_lock():
+    return threading.Lock()
+
+def _attendance_partition_path(course_id, date_str):
+    return os.path.join(ATTENDANCE_DIR, str(course_id), f"{date_str}.json")
+
+def _attendance_rollup_path(course_id):
+    return os.path.join(ATTENDANCE_DIR, str(course_id), "rollup.json")
+
+def _write_attendance_records(course_id, date_str, records):
+    """Menulis/mengganti catatan satu partisi (course, tanggal) dan memperbarui rollup hariannya"""
+    path = _attendance_partition_path(course_id, date_str)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partition = load_json_dict(path) or {"course_id": course_id, "date": date_str, "records": {}}
+    
+    created = []
+    for record in records:
+        key = str(record.get("user_id"))
+        previous = partition["records"].get(key)
+        if previous is None:
+            created.append(record)
+        else:
+            record = {**previous, **record}
+        partition["records"][key] = record
+    
+    # Rollup hari ini dihitung ulang dari catatan partisi (satu kursus, satu hari) agar tidak pernah menyimpang
+    counts = {status: 0 for status in ATTENDANCE_STATUSES}
+    for record in partition["records"].values():
+        counts[record.get("status")] = counts.get(record.get("status"), 0) + 1
+    partition["rollup"] = counts
+    rollup = load_json_dict(_attendance_rollup_path(course_id))
+    rollup[date_str] = dict(counts)
+    
+    save_data(partition, path)
+    save_data(rollup, _attendance_rollup_path(course_id))
+    return created
+
+def migrate_attendance_to_partitions():
+    """Memindahkan attendance.json ke partisi per (course, tanggal) sekali saja"""
+    marker = os.path.join(ATTENDANCE_DIR, "migrated")
+    if os.path.exists(marker):
+        return
+    # Penulisan ulang catatan yang sama idempoten, jadi migrasi yang terputus aman diulang
+    partitions = {}
+    for record in load_data(ATTENDANCE_FILE):
+        partitions.setdefault((record.get("course_id"), record.get("date")), []).append(record)
+    with _attendance_lock():
+        for (course_id, date_str), records in partitions.items():
+            _write_attendance_records(course_id, date_str, records)
+        os.makedirs(ATTENDANCE_DIR, exist_ok=True)
+        open(marker, "w").close()
+
 def mark_attendance(user_id, course_id, status="Hadir"):
-    attendance = load_data(ATTENDANCE_FILE)
     today = date.today().isoformat()
-    for a in attendance:
-        if a.get("user_id") == user_id and a.get("course_id") == course_id and a.get("date") == today:
-            a["status"] = status
-            a["updated_at"] = datetime.now().isoformat()
-            save_data(attendance, ATTENDANCE_FILE)
+    now = datetime.now().isoformat()
+    with _attendance_lock():
+        if get_attendance_record(course_id, user_id, today):
+            _write_attendance_records(course_id, today, [{"user_id": user_id, "status": status, "updated_at": now}])
+            log_event(user_id, "attendance", course_id, at=now, status=status)
             return True
-    attendance.append({
-        "user_id": user_id,
-        "course_id": course_id,
-        "date": today,
-        "status": status,
-        "marked_at": datetime.now().isoformat()
-    })
-    save_data(attendance, ATTENDANCE_FILE)
+        _write_attendance_records(course_id, today, [{
+            "user_id": user_id,
+            "course_id": course_id,
+            "date": today,
+            "status": status,
+            "marked_at": now
+        }])
+    log_event(user_id, "attendance", course_id, at=now, status=status)
     
     create_notification(
         user_id,
@@ -1866,35 +3892,800 @@ def mark_attendance(user_id, course_id, status="Hadir"):
     )
     return True
 
+def _get_attendance_partition(course_id, date_str):
+    return load_data_cached(_attendance_partition_path(course_id, date_str), load_json_dict)
+
+def get_attendance_record(course_id, user_id, date_str=None):
+    """Catatan absensi satu siswa pada satu tanggal lewat indeks user_id di partisi"""
+    date_str = date_str or date.today().isoformat()
+    return _get_attendance_partition(course_id, date_str).get("records", {}).get(str(user_id))
+
 def get_attendance(course_id, date_str=None):
-    attendance = load_data(ATTENDANCE_FILE)
     if date_str is None:
         date_str = date.today().isoformat()
-    return [a for a in attendance if a.get("course_id") == course_id and a.get("date") == date_str]
+    return list(_get_attendance_partition(course_id, date_str).get("records", {}).values())
+
+def get_attendance_rollup(course_id, date_str=None):
+    """Jumlah hadir/izin/sakit per tanggal (semua tanggal jika date_str None)"""
+    rollup = load_data_cached(_attendance_rollup_path(course_id), load_json_dict)
+    if date_str is None:
+        return rollup
+    return rollup.get(date_str, {status: 0 for status in ATTENDANCE_STATUSES})
+
+def get_attendance_matrix(course_id, start_date, end_date, student_ids=None):
+    """Matriks siswa x hari pertemuan berisi kode status; hanya partisi tanggal yang punya catatan dibaca"""
+    start_str, end_str = start_date.isoformat(), end_date.isoformat()
+    class_days = sorted(d for d in get_attendance_rollup(course_id) if start_str <= d <= end_str)
+    
+    user_ids, days, statuses = [], [], []
+    for day in class_days:
+        for record in _get_attendance_partition(course_id, day).get("records", {}).values():
+            user_ids.append(record.get("user_id"))
+            days.append(day)
+            statuses.append(record.get("status"))
+    
+    long_frame = pd.DataFrame({"user_id": user_ids, "date": days, "status": statuses})
+    codes = long_frame["status"].map(ATTENDANCE_STATUS_CODES).fillna(ATTENDANCE_STATUS_CODES["Alpa"])
+    matrix = long_frame.assign(code=codes).pivot(index="user_id", columns="date", values="code")
+    matrix = matrix.reindex(columns=class_days)
+    if student_ids is not None:
+        matrix = matrix.reindex(index=student_ids)
+    return matrix.fillna(ATTENDANCE_STATUS_CODES["Alpa"]).astype(int)
+
+def summarize_attendance_matrix(matrix):
+    """Jumlah tiap status dan persentase kehadiran per siswa"""
+    summary = pd.DataFrame(
+        {status: (matrix == code).sum(axis=1) for status, code in ATTENDANCE_STATUS_CODES.items()},
+        index=matrix.index
+    )
+    summary["Kehadiran (%)"] = (summary["Hadir"] / max(matrix.shape[1], 1) * 100).round(1)
+    return summary
 
 # ===================== Forum System ===================== #
+@st.cache_resource(show_spinner=False)
+def _forum_lock():
+    """Kunci proses untuk alokasi ID dan penulisan indeks forum"""
+    return threading.Lock()
+
+def _forum_partition_paths(course_id, module_id, forum_dir=FORUM_DIR):
+    # Forum umum kursus (module_id None) memiliki partisi sendiri
+    part = "umum" if module_id is None else module_id
+    base = os.path.join(forum_dir, f"{course_id}_{part}")
+    return base + ".jsonl", base + ".index.json"
+
+def _allocate_forum_ids(count=1):
+    """Alokator ID monoton: membaca dan menaikkan penghitung tanpa memindai pesan"""
+    meta = load_json_dict(FORUM_META_FILE)
+    first_id = meta.get("next_id", 1)
+    meta["next_id"] = first_id + count
+    save_data(meta, FORUM_META_FILE)
+    return first_id
+
+def _append_forum_messages(course_id, module_id, messages, forum_dir=FORUM_DIR):
+    """Menambahkan pesan ke log partisi dan memperbarui indeks parent -> children"""
+    log_path, index_path = _forum_partition_paths(course_id, module_id, forum_dir)
+    index = load_json_dict(index_path)
+    children = index.setdefault("children", {})
+    offsets = index.setdefault("offsets", {})
+    with open(log_path, "ab") as f:
+        for msg in messages:
+            line = (json.dumps(msg, ensure_ascii=False) + "\n").encode("utf-8")
+            offsets[str(msg["id"])] = [f.tell(), len(line)]
+            f.write(line)
+            parent = "root" if msg.get("parent_id") is None else str(msg.get("parent_id"))
+            children.setdefault(parent, []).append(msg["id"])
+    index["count"] = index.get("count", 0) + len(messages)
+    save_data(index, index_path)
+
+def _rebuild_forum_index(log_path, index_path):
+    """Membangun ulang indeks partisi (children + offset) dari log-nya"""
+    children, offsets, count = {}, {}, 0
+    with open(log_path, "rb") as f:
+        offset = 0
+        for line in f:
+            if line.strip():
+                msg = json.loads(line)
+                offsets[str(msg["id"])] = [offset, len(line)]
+                parent = "root" if msg.get("parent_id") is None else str(msg.get("parent_id"))
+                children.setdefault(parent, []).append(msg["id"])
+                count += 1
+            offset += len(line)
+    save_data({"children": children, "offsets": offsets, "count": count}, index_path)
+
+def init_forum_store():
+    """Migrasi forum.json ke partisi per (course, modul) sekali saja"""
+    if load_json_dict(FORUM_META_FILE).get("version") == FORUM_INDEX_VERSION:
+        return
+    with _forum_lock():
+        meta = load_json_dict(FORUM_META_FILE)
+        if meta.get("version") == FORUM_INDEX_VERSION:
+            return
+        if meta:
+            # Partisi sudah ada dari versi indeks lama: bangun ulang indeksnya saja
+            for name in os.listdir(FORUM_DIR):
+                if name.endswith(".jsonl"):
+                    log_path = os.path.join(FORUM_DIR, name)
+                    _rebuild_forum_index(log_path, log_path[:-len(".jsonl")] + ".index.json")
+            meta["version"] = FORUM_INDEX_VERSION
+            save_data(meta, FORUM_META_FILE)
+            return
+        forum = sorted(load_data(FORUM_FILE), key=lambda m: m.get("timestamp") or "")
+        partitions = {}
+        for msg in forum:
+            partitions.setdefault((msg.get("course_id"), msg.get("module_id")), []).append(msg)
+        
+        # Partisi dibangun di folder sementara; rename folder menandai migrasi selesai,
+        # jadi migrasi yang terputus diulang dari awal tanpa menggandakan pesan
+        tmp_dir = FORUM_DIR + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for (course_id, module_id), messages in partitions.items():
+            _append_forum_messages(course_id, module_id, messages, tmp_dir)
+        save_data({
+            "next_id": max([m.get("id", 0) for m in forum], default=0) + 1,
+            "version": FORUM_INDEX_VERSION
+        }, os.path.join(tmp_dir, "meta.json"))
+        shutil.rmtree(FORUM_DIR, ignore_errors=True)  # sisa migrasi versi lama tanpa meta
+        os.rename(tmp_dir, FORUM_DIR)
+
 def post_forum_message(course_id, module_id, user_id, user_name, content, parent_id=None):
-    forum = load_data(FORUM_FILE)
-    msg_id = (max([m.get("id",0) for m in forum]) + 1) if forum else 1
-    msg = {
-        "id": msg_id,
+    with _forum_lock():
+        msg = {
+            "id": _allocate_forum_ids(),
+            "course_id": course_id,
+            "module_id": module_id,
+            "user_id": user_id,
+            "user_name": user_name,
+            "content": content,
+            "parent_id": parent_id,
+            "timestamp": datetime.now().isoformat()
+        }
+        _append_forum_messages(course_id, module_id, [msg])
+    index_search_documents([_forum_search_doc(msg)])
+    log_event(user_id, "forum", course_id, at=msg["timestamp"], module_id=module_id,
+              message_id=msg["id"], parent_id=parent_id)
+    return msg
+
+def _load_forum_log(filename):
+    if not os.path.exists(filename):
+        return []
+    with open(filename, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def read_forum_messages(course_id, module_id, message_ids):
+    """Membaca pesan tertentu langsung dari log partisi lewat offset byte di indeks"""
+    log_path, index_path = _forum_partition_paths(course_id, module_id)
+    offsets = load_data_cached(index_path, load_json_dict).get("offsets", {})
+    messages = []
+    if not message_ids or not os.path.exists(log_path):
+        return messages
+    with open(log_path, "rb") as f:
+        for message_id in message_ids:
+            entry = offsets.get(str(message_id))
+            if entry is None:
+                continue
+            f.seek(entry[0])
+            messages.append(json.loads(f.read(entry[1])))
+    return messages
+
+def get_forum_page(course_id, module_id, page=0, per_page=FORUM_THREADS_PER_PAGE):
+    """Satu halaman thread utama (terbaru dulu) beserta jumlah balasannya, tanpa memuat balasan"""
+    _, index_path = _forum_partition_paths(course_id, module_id)
+    children = load_data_cached(index_path, load_json_dict).get("children", {})
+    root_ids = children.get("root", [])
+    total_pages = max(1, -(-len(root_ids) // per_page))
+    page = min(max(page, 0), total_pages - 1)
+    
+    # Log partisi urut waktu kirim, jadi thread terbaru ada di ujung daftar root
+    end = len(root_ids) - page * per_page
+    page_ids = root_ids[max(0, end - per_page):end][::-1]
+    threads = [
+        {"message": msg, "reply_count": len(children.get(str(msg.get("id")), []))}
+        for msg in read_forum_messages(course_id, module_id, page_ids)
+    ]
+    return {"threads": threads, "page": page, "total_pages": total_pages, "total_threads": len(root_ids)}
+
+def get_forum_replies(course_id, module_id, parent_id):
+    """Balasan satu thread, urut waktu kirim"""
+    _, index_path = _forum_partition_paths(course_id, module_id)
+    children = load_data_cached(index_path, load_json_dict).get("children", {})
+    return read_forum_messages(course_id, module_id, children.get(str(parent_id), []))
+
+def get_all_forum_messages():
+    messages = []
+    if os.path.isdir(FORUM_DIR):
+        for name in sorted(os.listdir(FORUM_DIR)):
+            if name.endswith(".jsonl"):
+                messages += _load_forum_log(os.path.join(FORUM_DIR, name))
+    return messages
+
+def get_forum_threads(course_id, module_id=None):
+    if module_id is not None:
+        log_path, _ = _forum_partition_paths(course_id, module_id)
+        return list(load_data_cached(log_path, _load_forum_log))
+    
+    # Seluruh modul dalam kursus: gabungkan partisi milik kursus ini
+    threads = []
+    if os.path.isdir(FORUM_DIR):
+        for name in os.listdir(FORUM_DIR):
+            if name.startswith(f"{course_id}_") and name.endswith(".jsonl"):
+                threads.extend(load_data_cached(os.path.join(FORUM_DIR, name), _load_forum_log))
+    return sorted(threads, key=lambda x: x.get("timestamp"))
+
+# ===================== Event Log ===================== #
+@st.cache_resource(show_spinner=False)
+def _event_log_lock():
+    return threading.Lock()
+
+@st.cache_resource(show_spinner=False)
+def _event_log_state():
+    """Nomor segmen aktif (dihitung sekali per proses)"""
+    return {}
+
+def _event_segment_path(segment):
+    return os.path.join(EVENT_LOG_DIR, f"events-{segment:06d}.jsonl")
+
+def _event_user_index_path(user_id):
+    return os.path.join(EVENT_LOG_DIR, "users", f"{user_id}.idx")
+
+def _format_event_index_line(segment, offset, length, at):
+    # Baris berlebar tetap agar indeks bisa dibaca mundur dari ujung file
+    return f"{segment:06d} {offset:012d} {length:08d} {(at or '')[:19]:<19}\n"
+
+EVENT_INDEX_LINE_BYTES = len(_format_event_index_line(0, 0, 0, ""))
+
+def _list_event_segments():
+    if not os.path.isdir(EVENT_LOG_DIR):
+        return []
+    return sorted(int(name[7:13]) for name in os.listdir(EVENT_LOG_DIR)
+                  if name.startswith("events-") and name.endswith(".jsonl"))
+
+def log_events(events):
+    """Menambahkan event ke segmen aktif dan mencatat offset-nya di indeks per user"""
+    if not events:
+        return
+    with _event_log_lock():
+        _write_events(events)
+
+def _write_events(events):
+    """Menulis event ke log; pemanggil harus memegang _event_log_lock"""
+    state = _event_log_state()
+    if "segment" not in state:
+        state["segment"] = (_list_event_segments() or [1])[-1]
+    os.makedirs(os.path.join(EVENT_LOG_DIR, "users"), exist_ok=True)
+    
+    index_lines = {}
+    f = open(_event_segment_path(state["segment"]), "ab")
+    try:
+        offset = f.seek(0, os.SEEK_END)
+        for event in events:
+            if offset >= EVENT_SEGMENT_BYTES:
+                f.close()
+                state["segment"] += 1
+                f = open(_event_segment_path(state["segment"]), "ab")
+                offset = f.seek(0, os.SEEK_END)
+            line = (json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+            f.write(line)
+            if event.get("user_id") is not None:
+                index_lines.setdefault(event["user_id"], []).append(
+                    _format_event_index_line(state["segment"], offset, len(line), event.get("at"))
+                )
+            offset += len(line)
+    finally:
+        f.close()
+    
+    for user_id, lines in index_lines.items():
+        with open(_event_user_index_path(user_id), "a", encoding="ascii") as idx:
+            idx.writelines(lines)
+
+def log_event(user_id, event_type, course_id=None, at=None, **data):
+    log_events([{
+        "at": at or datetime.now().isoformat(),
+        "user_id": user_id,
+        "course_id": course_id,
+        "type": event_type,
+        "data": data
+    }])
+
+def _quiz_event_data(result, quiz):
+    return {"at": result.get("submitted_at"), "quiz_id": result.get("quiz_id"),
+            "quiz_type": (quiz or {}).get("quiz_type"), "module_id": (quiz or {}).get("module_id"),
+            "percentage": result.get("percentage"), "attempt": result.get("attempt_number")}
+
+def _submission_event_data(submission, assignment, resubmitted=False):
+    return {"at": submission.get("submitted_at"), "assignment_id": submission.get("assignment_id"),
+            "module_id": (assignment or {}).get("module_id"),
+            "late": is_submission_late(submission.get("submitted_at"), (assignment or {}).get("due_date")),
+            "resubmitted": resubmitted}
+
+def init_event_log():
+    """Mengisi log event dari data yang sudah ada (sekali saja), urut waktu"""
+    if os.path.exists(EVENT_BACKFILL_MARKER):
+        return
+    with _event_log_lock():
+        if os.path.exists(EVENT_BACKFILL_MARKER):
+            return
+        # Backfill sebelumnya terputus: buang log parsial beserta feed turunannya lalu ulangi dari awal
+        shutil.rmtree(EVENT_LOG_DIR, ignore_errors=True)
+        _event_log_state().clear()
+        if os.path.exists(RISK_STATE_FILE):
+            os.remove(RISK_STATE_FILE)
+        _write_events(_collect_backfill_events())
+        open(EVENT_BACKFILL_MARKER, "w").close()
+
+def _collect_backfill_events():
+    events = []
+    
+    def add(user_id, event_type, course_id, at, **data):
+        events.append({"at": at, "user_id": user_id, "course_id": course_id, "type": event_type, "data": data})
+    
+    if os.path.isdir(ATTENDANCE_DIR):
+        for course_dir in os.listdir(ATTENDANCE_DIR):
+            course_path = os.path.join(ATTENDANCE_DIR, course_dir)
+            if not os.path.isdir(course_path):
+                continue
+            for name in os.listdir(course_path):
+                if name != "rollup.json":
+                    for record in load_json_dict(os.path.join(course_path, name)).get("records", {}).values():
+                        add(record.get("user_id"), "attendance", record.get("course_id"),
+                            record.get("updated_at") or record.get("marked_at"), status=record.get("status"))
+    
+    quizzes = {q.get("id"): q for q in load_all_course_data(QUIZZES_FILE)}
+    for result in load_all_course_data(QUIZ_RESULTS_FILE):
+        quiz = quizzes.get(result.get("quiz_id"))
+        add(result.get("user_id"), "quiz", (quiz or {}).get("course_id"), **_quiz_event_data(result, quiz))
+    
+    assignments = {a.get("id"): a for a in load_all_course_data(ASSIGNMENTS_FILE)}
+    for submission in load_data(SUBMISSIONS_FILE):
+        assignment = assignments.get(submission.get("assignment_id"))
+        add(submission.get("user_id"), "submission", (assignment or {}).get("course_id"),
+            **_submission_event_data(submission, assignment))
+    
+    for record in load_lab_log():
+        add(record.get("user_id"), "lab", None, record.get("created_at"),
+            result_id=record.get("id"), circuit_type=record.get("circuit_type"))
+    
+    for msg in get_all_forum_messages():
+        add(msg.get("user_id"), "forum", msg.get("course_id"), msg.get("timestamp"),
+            module_id=msg.get("module_id"), message_id=msg.get("id"), parent_id=msg.get("parent_id"))
+    
+    for record in load_json_dict(PROGRESS_BITS_FILE).get("records", {}).values():
+        for module_id, completed_at in record.get("completed_at", {}).items():
+            add(record.get("user_id"), "module", record.get("course_id"), completed_at,
+                module_id=int(module_id), completed=True)
+    
+    events.sort(key=lambda e: e.get("at") or "")
+    return events
+
+def _read_event_entries(entries):
+    """Membaca event yang ditunjuk (segmen, offset, panjang), membuka tiap segmen sekali"""
+    events = []
+    files = {}
+    try:
+        for segment, offset, length in entries:
+            if segment not in files:
+                files[segment] = open(_event_segment_path(segment), "rb")
+            files[segment].seek(offset)
+            events.append(json.loads(files[segment].read(length)))
+    finally:
+        for f in files.values():
+            f.close()
+    return events
+
+def get_user_events(user_id, since=None, limit=None):
+    """Event seorang user, terbaru dulu; indeks dibaca mundur sampai melewati `since`"""
+    path = _event_user_index_path(user_id)
+    if not os.path.exists(path):
+        return []
+    since = since.isoformat()[:19] if isinstance(since, datetime) else since
+    entries = []
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        while position > 0 and (limit is None or len(entries) < limit):
+            block_start = max(0, position - 256 * EVENT_INDEX_LINE_BYTES)
+            f.seek(block_start)
+            lines = f.read(position - block_start).decode("ascii").splitlines()
+            position = block_start
+            for line in reversed(lines):
+                segment, offset, length, at = line.split(" ", 3)
+                if since and at.strip() < since:
+                    position = 0
+                    break
+                entries.append((int(segment), int(offset), int(length)))
+                if limit is not None and len(entries) >= limit:
+                    break
+    return _read_event_entries(entries)
+
+def read_events_since(cursor=None):
+    """Feed inkremental seluruh event sejak cursor (segment, offset); mengembalikan (event, cursor baru)"""
+    segment, offset = cursor or (1, 0)
+    events = []
+    for current in [s for s in _list_event_segments() if s >= segment]:
+        start = offset if current == segment else 0
+        with open(_event_segment_path(current), "rb") as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # baris yang masih ditulis, dibaca pada pemanggilan berikutnya
+                events.append(json.loads(line))
+                start += len(line)
+        segment, offset = current, start
+    return events, (segment, offset)
+
+def describe_event(event):
+    data = event.get("data", {})
+    kind = event.get("type")
+    if kind == "attendance":
+        return f"Absensi: {data.get('status')}"
+    if kind == "quiz":
+        return f"Mengerjakan kuis #{data.get('quiz_id')} ({data.get('quiz_type') or '-'}) — {data.get('percentage')}%"
+    if kind == "submission":
+        action = "Mengumpulkan ulang" if data.get("resubmitted") else "Mengumpulkan"
+        return f"{action} tugas #{data.get('assignment_id')}" + (" (terlambat)" if data.get("late") else "")
+    if kind == "lab":
+        return f"Eksperimen lab rangkaian {data.get('circuit_type')}"
+    if kind == "forum":
+        action = "Membalas diskusi" if data.get("parent_id") is not None else "Memulai diskusi"
+        return f"{action} di Modul {data.get('module_id')}" if data.get("module_id") is not None else f"{action} di forum umum"
+    if kind == "module":
+        return f"{'Menyelesaikan' if data.get('completed') else 'Membuka kembali'} Modul {data.get('module_id')}"
+    return kind
+
+# ===================== Student Risk ===================== #
+@st.cache_resource(show_spinner=False)
+def _risk_state_lock():
+    return threading.Lock()
+
+def _touch_risk_aggregate(aggregates, key, touched, default):
+    if key not in touched:  # kunci siswa "user_id" tidak pernah bentrok dengan "user_id:course_id"
+        # Agregat lama dibagi lewat cache: salin hanya entri yang berubah
+        aggregates[key] = copy.deepcopy(aggregates.get(key)) or default
+        touched.add(key)
+    return aggregates[key]
+
+def _apply_risk_event(students, courses, event, touched):
+    """Lab & aktivitas terakhir per siswa; absensi, modul, kuis, dan tugas per (siswa, kursus)"""
+    if event.get("user_id") is None:
+        return
+    data = event.get("data", {})
+    at = event.get("at") or ""
+    kind = event.get("type")
+    user = _touch_risk_aggregate(students, str(event["user_id"]), touched,
+                                 {"lab_count": 0, "last_lab": None, "last_active": None})
+    user["last_active"] = max(user["last_active"] or "", at)
+    if kind == "lab":
+        user["lab_count"] += 1
+        user["last_lab"] = max(user["last_lab"] or "", at)
+        return
+    if event.get("course_id") is None:
+        return
+    student = _touch_risk_aggregate(courses, _progress_key(event["user_id"], event["course_id"]), touched,
+                                    {"hadir": 0, "last_attendance": None, "modules": 0, "quizzes": {}, "submissions": {}})
+    if kind == "attendance":
+        # Absensi hanya bisa diubah pada hari yang sama, jadi cukup ingat status terakhir
+        previous = student["last_attendance"]
+        if previous and previous[0] == at[:10] and previous[1] == "Hadir":
+            student["hadir"] -= 1
+        student["hadir"] += data.get("status") == "Hadir"
+        student["last_attendance"] = [at[:10], data.get("status")]
+    elif kind == "module" and data.get("module_id") is not None:
+        bit = module_bit(data["module_id"])
+        student["modules"] = student["modules"] | bit if data.get("completed") else student["modules"] & ~bit
+    elif kind == "quiz":
+        student["quizzes"][str(data.get("quiz_id"))] = data.get("percentage")  # attempt terakhir per kuis
+    elif kind == "submission":
+        student["submissions"][str(data.get("assignment_id"))] = bool(data.get("late"))
+
+def refresh_student_risk_state():
+    """Memperbarui agregat risiko hanya dengan event baru sejak cursor terakhir"""
+    with _risk_state_lock():
+        state = load_data_cached(RISK_STATE_FILE, load_json_dict)
+        if state.get("version") != RISK_STATE_VERSION:
+            state = {}  # format lama: hitung ulang dari awal log
+        events, cursor = read_events_since(tuple(state["cursor"]) if state.get("cursor") else None)
+        if not events and state:
+            return state
+        students = dict(state.get("students", {}))
+        courses = dict(state.get("courses", {}))
+        touched = set()
+        for event in events:
+            _apply_risk_event(students, courses, event, touched)
+        state = {"version": RISK_STATE_VERSION, "students": students, "courses": courses, "cursor": list(cursor)}
+        save_data(state, RISK_STATE_FILE)
+        return state
+
+def classify_risk(score):
+    return next(label for threshold, label in RISK_CATEGORIES if score >= threshold)
+
+def get_student_risk_frame(course_id, students):
+    """Skor risiko (0-100, makin tinggi makin berisiko) per siswa dari agregat inkremental"""
+    state = refresh_student_risk_state()
+    user_aggregates, course_aggregates = state.get("students", {}), state.get("courses", {})
+    class_days = len(get_attendance_rollup(course_id)) or 1
+    course_mask = get_course_module_mask(course_id)
+    total_modules = bin(course_mask).count("1") or 1
+    now = datetime.now()
+    
+    rows = []
+    for student in students:
+        agg = dict(course_aggregates.get(_progress_key(student.get("id"), course_id), {}),
+                   **user_aggregates.get(str(student.get("id")), {}))
+        quizzes = [p for p in agg.get("quizzes", {}).values() if p is not None]
+        submissions = agg.get("submissions", {})
+        last_lab = agg.get("last_lab")
+        rows.append({
+            "user_id": student.get("id"),
+            "Nama": student.get("name"),
+            "hadir": agg.get("hadir", 0),
+            "modul": bin(agg.get("modules", 0) & course_mask).count("1"),
+            "kuis": sum(quizzes) / len(quizzes) if quizzes else np.nan,
+            "terlambat": sum(submissions.values()),
+            "tugas": len(submissions),
+            "lab": agg.get("lab_count", 0),
+            "hari_tanpa_lab": (now - datetime.fromisoformat(last_lab)).days if last_lab else np.nan,
+            "terakhir_aktif": (agg.get("last_active") or "")[:16].replace("T", " ")
+        })
+    frame = pd.DataFrame(rows)
+    if frame.empty:
+        return frame
+    
+    frame["Kehadiran (%)"] = (frame["hadir"] / class_days * 100).clip(upper=100).round(1)
+    frame["Modul (%)"] = (frame["modul"] / total_modules * 100).round(1)
+    frame["Rata-rata Kuis (%)"] = frame["kuis"].round(1)
+    deficits = {
+        "attendance": 1 - frame["Kehadiran (%)"] / 100,
+        "completion": 1 - frame["Modul (%)"] / 100,
+        "quiz": (1 - frame["kuis"] / 100).fillna(1.0),  # belum mengerjakan kuis dihitung defisit penuh
+        "late": (frame["terlambat"] / frame["tugas"].where(frame["tugas"] > 0)).fillna(0.0),
+        "lab": (frame["hari_tanpa_lab"] / RISK_LAB_IDLE_DAYS).clip(upper=1).fillna(1.0),
+    }
+    frame["Skor Risiko"] = sum(RISK_WEIGHTS[k] * deficits[k] for k in RISK_WEIGHTS).round(1)
+    frame["Kategori"] = frame["Skor Risiko"].map(classify_risk)
+    return frame.sort_values("Skor Risiko", ascending=False)
+
+# ===================== Search System ===================== #
+_INDONESIAN_PARTICLES = ("lah", "kah", "tah", "pun")
+_INDONESIAN_POSSESSIVES = ("nya", "ku", "mu")
+_INDONESIAN_SUFFIXES = ("kan", "an", "i")
+_INDONESIAN_PREFIXES = ("meng", "meny", "mem", "men", "me", "peng", "peny", "pem", "pen", "per", "pe",
+                        "ber", "be", "ter", "di", "ke", "se")
+
+def _strip_affix(word, affixes, prefix=False, min_stem=4):
+    for affix in affixes:
+        matches = word.startswith(affix) if prefix else word.endswith(affix)
+        if matches and len(word) - len(affix) >= min_stem:
+            return word[len(affix):] if prefix else word[:-len(affix)]
+    return word
+
+def stem_indonesian(word):
+    """Stemming ringan bergaya Nazief-Adriani: partikel, posesif, sufiks, lalu prefiks"""
+    if word.isdigit():
+        return word
+    word = _strip_affix(word, _INDONESIAN_PARTICLES)
+    word = _strip_affix(word, _INDONESIAN_POSSESSIVES)
+    word = _strip_affix(word, _INDONESIAN_SUFFIXES)
+    return _strip_affix(word, _INDONESIAN_PREFIXES, prefix=True)
+
+def tokenize_search_text(text):
+    """Normalisasi (huruf kecil, tanpa diakritik), buang stopword, lalu stem tiap kata"""
+    text = unicodedata.normalize("NFKD", str(text or "")).encode("ascii", "ignore").decode().lower()
+    return [
+        stem_indonesian(word)
+        for word in re.findall(r"[a-z0-9]+", text)
+        if len(word) > 1 and word not in SEARCH_STOPWORDS
+    ]
+
+def _make_search_doc(key, doc_type, title, text, course_id=None, module_id=None, ref=None):
+    terms = {}
+    for term in tokenize_search_text(f"{title} {text}"):
+        terms[term] = terms.get(term, 0) + 1
+    snippet = " ".join(str(text or "").split())
+    return {
+        "key": key,
+        "type": doc_type,
+        "title": title,
+        "snippet": snippet[:200] + ("…" if len(snippet) > 200 else ""),
         "course_id": course_id,
         "module_id": module_id,
-        "user_id": user_id,
-        "user_name": user_name,
-        "content": content,
-        "parent_id": parent_id,
-        "timestamp": datetime.now().isoformat()
+        "ref": ref,
+        "length": sum(terms.values()),
+        "terms": terms
     }
-    forum.append(msg)
-    save_data(forum, FORUM_FILE)
-    return msg
 
-def get_forum_threads(course_id, module_id=None):
-    forum = load_data(FORUM_FILE)
-    threads = [m for m in forum if m.get("course_id") == course_id and (module_id is None or m.get("module_id") == module_id)]
-    threads_sorted = sorted(threads, key=lambda x: x.get("timestamp"))
-    return threads_sorted
+def _forum_search_doc(msg):
+    return _make_search_doc(f"forum:{msg.get('id')}", "forum", f"Diskusi oleh {msg.get('user_name')}",
+                            msg.get("content"), msg.get("course_id"), msg.get("module_id"),
+                            {"message_id": msg.get("id"), "parent_id": msg.get("parent_id")})
+
+def _module_search_doc(course_id, module):
+    return _make_search_doc(f"module:{course_id}:{module.get('id')}", "module", module.get("title"),
+                            module.get("content"), course_id, module.get("id"))
+
+def _quiz_search_doc(quiz):
+    # Hanya judul & deskripsi; teks soal tidak diindeks agar tidak terbaca sebelum attempt dimulai
+    return _make_search_doc(f"quiz:{quiz.get('id')}", "quiz", quiz.get("title"), quiz.get("description") or "",
+                            quiz.get("course_id"), quiz.get("module_id"), {"quiz_id": quiz.get("id")})
+
+def _media_search_doc(media):
+    return _make_search_doc(f"media:{media.get('id')}", "media", media.get("file_name"),
+                            f"{media.get('media_type') or ''} {media.get('description') or ''}",
+                            ref={"media_id": media.get("id")})
+
+@st.cache_resource(show_spinner=False)
+def _search_lock():
+    return threading.Lock()
+
+@st.cache_resource(show_spinner=False)
+def _search_index_store():
+    """Indeks terbalik di memori: dokumen, posting term -> {key: tf}, dan posisi baca journal"""
+    return {}
+
+def _apply_search_op(index, op):
+    old = index["docs"].pop(op["key"], None)
+    if old is not None:
+        del index["lengths"][op["key"]]
+        index["total_length"] -= old["length"]
+        for term in old["terms"]:
+            postings = index["postings"].get(term)
+            if postings is not None:
+                postings.pop(op["key"], None)
+                if not postings:
+                    del index["postings"][term]
+    if op.get("op") == "put":
+        doc = op["doc"]
+        index["docs"][op["key"]] = doc
+        index["lengths"][op["key"]] = doc["length"]
+        index["total_length"] += doc["length"]
+        for term, tf in doc["terms"].items():
+            index["postings"].setdefault(term, {})[op["key"]] = tf
+
+def _refresh_search_index():
+    """Membawa indeks di memori ke keadaan terbaru: snapshot sekali, lalu hanya baris journal baru"""
+    store = _search_index_store()
+    journal_size = get_file_signature(SEARCH_JOURNAL_FILE)[1]
+    snapshot_signature = get_file_signature(SEARCH_INDEX_FILE)
+    if store.get("snapshot") != snapshot_signature or journal_size < store["offset"]:
+        # Snapshot baru (mis. dipadatkan proses lain): muat ulang lalu putar journal dari awal
+        index = {"docs": {}, "postings": {}, "lengths": {}, "total_length": 0}
+        for key, doc in load_json_dict(SEARCH_INDEX_FILE).get("docs", {}).items():
+            _apply_search_op(index, {"op": "put", "key": key, "doc": doc})
+        store.update(index=index, offset=0, snapshot=snapshot_signature)
+    if journal_size > store["offset"]:
+        with open(SEARCH_JOURNAL_FILE, "rb") as f:
+            f.seek(store["offset"])
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # baris yang masih ditulis, dibaca pada refresh berikutnya
+                store["offset"] += len(line)
+                if line.strip():
+                    _apply_search_op(store["index"], json.loads(line))
+    return store["index"]
+
+def _compact_search_index(index):
+    # Ditulis tanpa indentasi: snapshot bisa berisi puluhan ribu dokumen
+    with open(SEARCH_INDEX_FILE, "w", encoding="utf-8") as f:
+        json.dump({"version": SEARCH_INDEX_VERSION, "docs": index["docs"]}, f, ensure_ascii=False, separators=(",", ":"))
+    open(SEARCH_JOURNAL_FILE, "w").close()
+    _search_index_store().update(index=index, offset=0, snapshot=get_file_signature(SEARCH_INDEX_FILE))
+
+def _load_search_index_version(filename):
+    return load_json_dict(filename).get("version")
+
+def _search_put_op(doc):
+    return {"op": "put", "key": doc["key"], "doc": {k: v for k, v in doc.items() if k != "key"}}
+
+def _write_search_ops(ops):
+    with _search_lock():
+        with open(SEARCH_JOURNAL_FILE, "a", encoding="utf-8") as f:
+            for op in ops:
+                f.write(json.dumps(op, ensure_ascii=False) + "\n")
+        index = _refresh_search_index()
+        if get_file_signature(SEARCH_JOURNAL_FILE)[1] >= SEARCH_JOURNAL_COMPACT_BYTES:
+            _compact_search_index(index)
+
+def index_search_documents(docs):
+    """Menambahkan/mengganti dokumen di indeks pencarian (dipanggil saat konten ditulis)"""
+    _write_search_ops([_search_put_op(doc) for doc in docs])
+
+def remove_search_documents(keys):
+    _write_search_ops([{"op": "del", "key": key} for key in keys])
+
+def rebuild_search_index():
+    """Membangun ulang indeks pencarian dari seluruh sumber konten"""
+    docs = [_forum_search_doc(m) for m in get_all_forum_messages()]
+    for course in load_data(COURSES_FILE):
+        docs += [_module_search_doc(course.get("id"), m) for m in course.get("modules", [])]
+    docs += [_quiz_search_doc(q) for q in load_all_course_data(QUIZZES_FILE) if q.get("is_active")]
+    docs += [_media_search_doc(m) for m in load_data(MEDIA_FILE)]
+    
+    with _search_lock():
+        index = {"docs": {}, "postings": {}, "lengths": {}, "total_length": 0}
+        for doc in docs:
+            _apply_search_op(index, _search_put_op(doc))
+        _compact_search_index(index)
+
+def search_content(query, course_ids=None, doc_types=None, limit=20):
+    """Pencarian BM25 atas indeks terbalik; hanya posting term kueri yang disentuh.
+    course_ids membatasi hasil ke kursus tersebut (dokumen tanpa kursus, mis. media, tetap tampil)"""
+    terms = set(tokenize_search_text(query))
+    if not terms:
+        return []
+    with _search_lock():
+        index = _refresh_search_index()
+        n_docs = len(index["docs"])
+        if n_docs == 0:
+            return []
+        avg_length = index["total_length"] / n_docs or 1
+        lengths = index["lengths"]
+        norm_base = SEARCH_BM25_K1 * (1 - SEARCH_BM25_B)
+        norm_per_length = SEARCH_BM25_K1 * SEARCH_BM25_B / avg_length
+        scores = {}
+        for term in terms:
+            postings = index["postings"].get(term, {})
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            weight = idf * (SEARCH_BM25_K1 + 1)
+            for key, tf in postings.items():
+                scores[key] = scores.get(key, 0.0) + weight * tf / (tf + norm_base + norm_per_length * lengths[key])
+        
+        def visible(key):
+            doc = index["docs"][key]
+            if doc_types and doc["type"] not in doc_types:
+                return False
+            return course_ids is None or doc["course_id"] is None or doc["course_id"] in course_ids
+        
+        top = heapq.nlargest(limit, (item for item in scores.items() if visible(item[0])), key=lambda item: item[1])
+        return [
+            dict({k: v for k, v in index["docs"][key].items() if k != "terms"}, key=key, score=score)
+            for key, score in top
+        ]
+
+# ===================== Search UI ===================== #
+def show_search():
+    inject_custom_css()
+    
+    st.markdown("""
+    <div class='main-header'>
+        <h1>🔍 Pencarian</h1>
+        <p>Cari di forum diskusi, materi modul, kuis, dan media ajar</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    col1, col2 = st.columns([3, 2])
+    with col1:
+        query = st.text_input("Kata kunci", placeholder="mis. hukum kirchhoff arus percabangan", key="search_query")
+    with col2:
+        doc_types = st.multiselect("Jenis konten", list(SEARCH_DOC_TYPES), format_func=SEARCH_DOC_TYPES.get,
+                                   key="search_types")
+    
+    if not query.strip():
+        st.info("Masukkan kata kunci untuk mulai mencari.")
+        return
+    
+    # Admin mencari di kursus aktif; siswa hanya di kursus yang diikutinya
+    user = st.session_state.current_user
+    if user.get("role") == "admin":
+        course_ids = {get_active_course_id()}
+    else:
+        course_ids = {c.get("id") for c in get_available_courses(user)}
+    
+    started = time.perf_counter()
+    results = search_content(query, course_ids=course_ids, doc_types=doc_types or None)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    st.caption(f"{len(results)} hasil ({elapsed_ms:.1f} ms)")
+    
+    if not results:
+        st.warning("Tidak ada hasil yang cocok.")
+        return
+    
+    for result in results:
+        location = ""
+        if result.get("module_id") is not None:
+            module = get_catalog_module(result.get("course_id"), result.get("module_id"))
+            location = f" • Modul {result.get('module_id')}" + (f": {module.get('title')}" if module else "")
+        elif result.get("type") == "forum":
+            location = " • Forum Umum"
+        st.markdown(f"**{SEARCH_DOC_TYPES.get(result.get('type'))} — {result.get('title')}**{location}")
+        st.caption(result.get("snippet") or "")
 
 # ===================== UI Components ===================== #
 def create_hero_section():
@@ -2034,7 +4825,7 @@ def show_dashboard():
     with col2:
         create_metric_card("Jumlah Siswa", len(students), "👥", "Siswa Terdaftar")
     with col3:
-        current_code = get_course_code(1)
+        current_code = get_course_code(get_active_course_id())
         create_metric_card("Kode Akses", current_code if current_code else "-", "🔑", "Aktif")
     with col4:
         if st.session_state.authenticated:
@@ -2053,6 +4844,56 @@ def show_dashboard():
     with col2:
         if st.session_state.authenticated:
             show_notifications_preview()
+    
+    if st.session_state.authenticated and st.session_state.current_user.get("role") == "admin":
+        show_teacher_dashboard(get_active_course_id(), students)
+    
+    if st.session_state.authenticated and st.session_state.current_user.get("role") == "student":
+        st.markdown("""
+        <div class='custom-card'>
+            <h3>🕒 Aktivitas 7 Hari Terakhir</h3>
+        </div>
+        """, unsafe_allow_html=True)
+        show_activity_timeline(st.session_state.current_user.get("id"))
+
+def show_teacher_dashboard(course_id, students):
+    st.markdown("""
+    <div class='custom-card'>
+        <h3>🚨 Siswa Berisiko</h3>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    enrolled = [s for s in students if course_id in s.get("enrolled_courses", [])]
+    frame = get_student_risk_frame(course_id, enrolled)
+    if frame.empty:
+        st.info("Belum ada siswa yang terdaftar di kursus ini.")
+        return
+    
+    counts = frame["Kategori"].value_counts()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Risiko Tinggi", int(counts.get("Tinggi", 0)))
+    with col2:
+        st.metric("Risiko Sedang", int(counts.get("Sedang", 0)))
+    with col3:
+        st.metric("Rata-rata Kehadiran", f"{frame['Kehadiran (%)'].mean():.1f}%")
+    with col4:
+        st.metric("Rata-rata Modul Selesai", f"{frame['Modul (%)'].mean():.1f}%")
+    
+    categories = [label for _, label in RISK_CATEGORIES]
+    selected = st.multiselect("Tampilkan kategori", categories, default=categories[:2], key="risk_categories")
+    shown = frame[frame["Kategori"].isin(selected)]
+    st.dataframe(
+        shown[["Nama", "Skor Risiko", "Kategori", "Kehadiran (%)", "Modul (%)", "Rata-rata Kuis (%)",
+               "terlambat", "lab", "terakhir_aktif"]].rename(columns={
+            "terlambat": "Tugas Terlambat", "lab": "Eksperimen Lab", "terakhir_aktif": "Terakhir Aktif"
+        }),
+        use_container_width=True,
+        hide_index=True,
+        column_config={"Skor Risiko": st.column_config.ProgressColumn("Skor Risiko", min_value=0, max_value=100, format="%.1f")}
+    )
+    labels = {"attendance": "absen", "quiz": "kuis", "completion": "modul", "late": "terlambat", "lab": "lab"}
+    st.caption("Skor = " + " + ".join(f"{w}×{labels[k]}" for k, w in RISK_WEIGHTS.items()) + " (defisit tiap komponen 0-1)")
 
 def show_learning_progress():
     st.markdown("""
@@ -2063,23 +4904,41 @@ def show_learning_progress():
     
     if st.session_state.authenticated:
         user_id = st.session_state.current_user.get("id")
-        progress_data = load_data(PROGRESS_FILE)
-        user_prog = next((p for p in progress_data if p.get("user_id") == user_id), None)
+        user_prog = get_user_progress(user_id, get_active_course_id())
         
         if user_prog:
-            progress_value = user_prog.get("progress", 0)
-            completed_modules = len(user_prog.get("completed_modules", []))
+            completed_modules, total_modules, progress_value = get_progress_summary(user_prog)
             
             st.progress(progress_value / 100)
-            st.write(f"**{progress_value}% Selesai** | {completed_modules}/7 Modul")
+            st.write(f"**{progress_value}% Selesai** | {completed_modules}/{total_modules} Modul")
             
             if completed_modules > 0:
                 st.markdown("**Modul yang sudah diselesaikan:**")
-                for mod_id in user_prog.get("completed_modules", []):
+                for mod_id in get_completed_module_ids(user_prog):
                     st.markdown(f"✅ Modul {mod_id}")
         else:
             st.info("Belum ada progress pembelajaran. Mulai belajar dari menu 'Materi Pembelajaran'.")
 
+def show_activity_timeline(user_id, days=7, limit=30):
+    """Ringkasan keterlibatan dan linimasa aktivitas user selama `days` hari terakhir"""
+    events = get_user_events(user_id, since=datetime.now() - timedelta(days=days))
+    if not events:
+        st.info(f"Belum ada aktivitas dalam {days} hari terakhir.")
+        return
+    
+    counts = {}
+    for event in events:
+        counts[event.get("type")] = counts.get(event.get("type"), 0) + 1
+    active_types = [t for t in EVENT_TYPES if counts.get(t)]
+    for col, event_type in zip(st.columns(len(active_types)), active_types):
+        with col:
+            st.metric(EVENT_TYPES[event_type], counts[event_type])
+    
+    for event in events[:limit]:
+        st.markdown(f"`{(event.get('at') or '')[:16].replace('T', ' ')}` {EVENT_TYPES.get(event.get('type'), '')} — {describe_event(event)}")
+    if len(events) > limit:
+        st.caption(f"... dan {len(events) - limit} aktivitas lainnya")
+
 def show_notifications_preview():
     st.markdown("""
     <div class='custom-card'>
@@ -2134,7 +4993,7 @@ def show_course_access_ui():
         if course_code.strip():
             success, message = enroll_user_in_course(
                 st.session_state.current_user.get("id"), 
-                1,
+                None,
                 course_code.strip()
             )
             if success:
@@ -2146,12 +5005,6 @@ def show_course_access_ui():
             st.error("Harap masukkan kode akses.")
 
 # ===================== Modul Helper ===================== #
-def get_module_by_id(modules, mid):
-    for m in modules:
-        if m.get("id") == mid:
-            return m
-    return None
-
 def render_module_content_enhanced(m, course_id, module_id):
     if not m:
         st.info("📝 Modul sedang dalam pengembangan...")
@@ -2193,12 +5046,13 @@ def render_module_content_enhanced(m, course_id, module_id):
             st.markdown(f"[📹 Tonton Video Pembelajaran]({m.get('video_url')})")
     
     # Tampilkan kuis untuk modul ini
-    show_quiz_ui(1, m.get("id"))  # course_id 1
+    show_quiz_ui(course_id, m.get("id"))
 
 # ===================== Forum UI ===================== #
 def module_forum_ui(course_id, module_id):
     user = st.session_state.current_user
-    threads = get_forum_threads(course_id, module_id)
+    page_key = f"forum_page_{course_id}_{module_id}"
+    forum = get_forum_page(course_id, module_id, st.session_state.get(page_key, 0))
     
     st.markdown("""
     <div class='custom-card'>
@@ -2206,19 +5060,52 @@ def module_forum_ui(course_id, module_id):
     </div>
     """, unsafe_allow_html=True)
     
-    for msg in threads:
-        if msg.get("parent_id") is None:
-            st.markdown(f"**{msg.get('user_name')}** • _{msg.get('timestamp')}_")
-            st.write(msg.get("content"))
-            replies = [r for r in threads if r.get("parent_id") == msg.get("id")]
-            for r in replies:
+    if not forum["threads"]:
+        st.info("Belum ada diskusi. Mulailah percakapan!")
+    
+    for thread in forum["threads"]:
+        msg = thread["message"]
+        msg_id = msg.get("id")
+        st.markdown(f"**{msg.get('user_name')}** • _{msg.get('timestamp')}_")
+        st.write(msg.get("content"))
+        
+        # Balasan hanya dibaca dari log saat thread dibuka
+        open_key = f"forum_open_{msg_id}"
+        is_open = st.session_state.get(open_key, False)
+        label = "🔼 Sembunyikan balasan" if is_open else f"💬 {thread['reply_count']} balasan"
+        if st.button(label, key=f"toggle_{open_key}"):
+            st.session_state[open_key] = not is_open
+            st.rerun()
+        
+        if is_open:
+            for r in get_forum_replies(course_id, module_id, msg_id):
                 st.markdown(f"> **{r.get('user_name')}** • _{r.get('timestamp')}_")
                 st.markdown(f"> {r.get('content')}")
+            reply = st.text_input("Balas:", key=f"reply_{msg_id}")
+            if st.button("Kirim Balasan", key=f"send_reply_{msg_id}"):
+                if reply.strip():
+                    post_forum_message(course_id, module_id, user.get("id"), user.get("name"), reply.strip(), parent_id=msg_id)
+                    st.rerun()
+        st.markdown("---")
+    
+    if forum["total_pages"] > 1:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("⬅️ Lebih baru", key=f"newer_{page_key}", disabled=forum["page"] == 0):
+                st.session_state[page_key] = forum["page"] - 1
+                st.rerun()
+        with col2:
+            st.caption(f"Halaman {forum['page'] + 1} dari {forum['total_pages']} • {forum['total_threads']} thread")
+        with col3:
+            if st.button("Lebih lama ➡️", key=f"older_{page_key}", disabled=forum["page"] >= forum["total_pages"] - 1):
+                st.session_state[page_key] = forum["page"] + 1
+                st.rerun()
     
     text = st.text_area("Tulis pesan baru:", key=f"forum_{course_id}_{module_id}")
     if st.button("Kirim", key=f"send_{course_id}_{module_id}"):
         if text.strip():
             post_forum_message(course_id, module_id, user.get("id"), user.get("name"), text.strip())
+            st.session_state[page_key] = 0
             st.success("Pesan terkirim.")
             st.rerun()
 
@@ -2248,8 +5135,17 @@ def show_my_courses():
         show_course_access_ui()
         return
     
-    progress = load_data(PROGRESS_FILE)
-    user_prog = next((p for p in progress if p.get("user_id") == uid), None)
+    with st.expander("➕ Gabung Kursus Lain"):
+        join_code = st.text_input("Kode Akses Kursus", placeholder="Contoh: A1B2C3D4", key="join_course_code")
+        if st.button("🚀 Gabung", key="join_course"):
+            success, message = enroll_user_in_course(uid, None, join_code.strip())
+            if success:
+                st.success(message)
+                st.rerun()
+            else:
+                st.error(message)
+    
+    user_prog = get_user_progress(uid, get_active_course_id())
     
     if not user_prog:
         st.markdown("""
@@ -2271,15 +5167,8 @@ def show_my_courses():
                 """, unsafe_allow_html=True)
                 
                 if st.button("🚀 Mulai Belajar", key=f"start_{course.get('id')}"):
-                    new_prog = {
-                        "user_id": uid,
-                        "course_id": course.get("id"),
-                        "progress": 0,
-                        "completed_modules": [],
-                        "last_accessed": datetime.now().isoformat()
-                    }
-                    progress.append(new_prog)
-                    save_data(progress, PROGRESS_FILE)
+                    start_course_progress(uid, course.get("id"))
+                    st.session_state.active_course_id = course.get("id")
                     
                     create_notification(
                         uid,
@@ -2310,14 +5199,14 @@ def show_course_detail_enhanced(course, user_prog=None):
     """, unsafe_allow_html=True)
     
     if user_prog:
-        progress_value = user_prog.get("progress", 0)
+        completed_modules, total_modules, progress_value = get_progress_summary(user_prog, course.get("id"))
         st.markdown(f"""
         <div class='custom-card'>
             <h4>📊 Progress Belajar</h4>
         </div>
         """, unsafe_allow_html=True)
         st.progress(progress_value / 100)
-        st.write(f"**{progress_value}% selesai** | {len(user_prog.get('completed_modules', []))}/7 modul terselesaikan")
+        st.write(f"**{progress_value}% selesai** | {completed_modules}/{total_modules} modul terselesaikan")
     
     if st.session_state.current_user.get("role") == "student":
         st.markdown("""
@@ -2326,9 +5215,7 @@ def show_course_detail_enhanced(course, user_prog=None):
         </div>
         """, unsafe_allow_html=True)
         
-        today = date.today().isoformat()
-        att = get_attendance(course.get("id"), today)
-        my_att = next((a for a in att if a.get("user_id") == st.session_state.current_user.get("id")), None)
+        my_att = get_attendance_record(course.get("id"), st.session_state.current_user.get("id"))
         
         if my_att:
             st.success(f"✅ Anda sudah menandai kehadiran hari ini ({my_att.get('status')})")
@@ -2357,7 +5244,6 @@ def show_course_detail_enhanced(course, user_prog=None):
     """, unsafe_allow_html=True)
     
     modules = course.get("modules", [])
-    progress_data = load_data(PROGRESS_FILE)
     
     # Buat modul default jika belum ada
     if not modules:
@@ -2376,11 +5262,12 @@ def show_course_detail_enhanced(course, user_prog=None):
             if c.get("id") == course.get("id"):
                 courses[i] = course
         save_data(courses, COURSES_FILE)
+        index_search_documents([_module_search_doc(course.get("id"), m) for m in modules])
     
-    for mid in range(1, 8):
-        m = get_module_by_id(modules, mid)
+    for mid in get_course_module_ids(course.get("id")):
+        m = get_catalog_module(course.get("id"), mid)
         module_title = m.get('title') if m else f'Modul {mid} - Listrik Dinamis'
-        status = "completed" if user_prog and mid in user_prog.get("completed_modules", []) else "in-progress" if m else "locked"
+        status = "completed" if is_module_completed(user_prog, mid) else "in-progress" if m else "locked"
         
         create_module_card(mid, module_title, status, 
                           progress=100 if status == "completed" else 50 if status == "in-progress" else 0)
@@ -2395,17 +5282,10 @@ def show_course_detail_enhanced(course, user_prog=None):
                 if user_prog:
                     col1, col2 = st.columns(2)
                     with col1:
-                        if mid in user_prog.get("completed_modules", []):
+                        if is_module_completed(user_prog, mid):
                             st.success("🎉 Modul ini sudah berhasil diselesaikan!")
                             if st.button(f"↩️ Batalkan Tandai Selesai", key=f"undo_{mid}"):
-                                user_prog["completed_modules"].remove(mid)
-                                user_prog["progress"] = int(len(user_prog["completed_modules"]) / 7 * 100)
-                                user_prog["last_accessed"] = datetime.now().isoformat()
-                                
-                                for i, p in enumerate(progress_data):
-                                    if p.get("user_id") == user_prog.get("user_id"):
-                                        progress_data[i] = user_prog
-                                save_data(progress_data, PROGRESS_FILE)
+                                set_module_completed(user_prog.get("user_id"), course.get("id"), mid, completed=False)
                                 
                                 create_notification(
                                     user_prog.get("user_id"),
@@ -2419,16 +5299,7 @@ def show_course_detail_enhanced(course, user_prog=None):
                                 st.rerun()
                         else:
                             if st.button(f"✅ Tandai Modul {mid} sebagai Selesai", key=f"done_{mid}"):
-                                if "completed_modules" not in user_prog:
-                                    user_prog["completed_modules"] = []
-                                user_prog["completed_modules"].append(mid)
-                                user_prog["progress"] = int(len(user_prog["completed_modules"]) / 7 * 100)
-                                user_prog["last_accessed"] = datetime.now().isoformat()
-                                
-                                for i, p in enumerate(progress_data):
-                                    if p.get("user_id") == user_prog.get("user_id"):
-                                        progress_data[i] = user_prog
-                                save_data(progress_data, PROGRESS_FILE)
+                                set_module_completed(user_prog.get("user_id"), course.get("id"), mid)
                                 
                                 create_notification(
                                     user_prog.get("user_id"),
@@ -2486,19 +5357,15 @@ def show_assignment_ui(course_id, module_id):
             st.write(f"**Batas Waktu:** {assignment.get('due_date')[:10]}")
             st.write(f"**Nilai Maksimal:** {assignment.get('max_points')} poin")
             
-            # Get submission untuk user yang sedang login
-            submission = get_submission(assignment.get("id"), current_user.get("id"))
+            # Status submission dari indeks (tanpa membaca isi submission)
+            submission = get_submission_status(assignment.get("id"), current_user.get("id"))
             
             if submission:
                 # Status penilaian
-                score = submission.get('grade')
+                score = submission.get('score')
                 max_score = assignment.get('max_points', 100)
                 
-                is_graded = (
-                    submission.get("status") == "graded" or 
-                    submission.get("is_graded") is True or
-                    score is not None
-                )
+                is_graded = submission.get("status") == "graded" or score is not None
                 
                 if is_graded and score is not None:
                     st.success("🎉 **TUGAS TELAH DINILAI**")
@@ -2528,6 +5395,8 @@ def show_assignment_ui(course_id, module_id):
                     st.info("⏳ Menunggu penilaian dari guru...")
                 
                 st.write(f"**Waktu Pengumpulan:** {submission.get('submitted_at')[:16]}")
+                if submission.get("late"):
+                    st.warning("⏰ Dikumpulkan melewati batas waktu")
                 st.write(f"**File:** {submission.get('file_name')}")
                 
                 # Tombol aksi - PERBAIKAN LOGIC DI SINI
@@ -2551,7 +5420,9 @@ def show_assignment_ui(course_id, module_id):
                 
                 # Tampilkan detail jika diminta
                 if st.session_state[detail_key]:
-                    show_submission_detail(assignment, submission, detail_key)
+                    full_submission = get_submission(assignment.get("id"), current_user.get("id"))
+                    if full_submission:
+                        show_submission_detail(assignment, full_submission, detail_key)
                     
             else:
                 st.warning("❌ **TUGAS BELUM DIKUMPULKAN**")
@@ -2674,7 +5545,7 @@ def show_submission_form(assignment, form_key, course_id, module_id):
     with st.form(key=f"submit_form_{assignment.get('id')}_{current_user.get('id')}_{module_id}", clear_on_submit=False):
         uploaded_file = st.file_uploader(
             "Pilih file tugas *",
-            type=[ext.replace(".", "") for ext in assignment.get("file_types", [".pdf", ".doc", ".docx", ".jpg", ".png"])],
+            type=[ext.replace(".", "") for ext in assignment.get("file_types", DEFAULT_SUBMISSION_FILE_TYPES)],
             key=f"uploader_{assignment.get('id')}_{current_user.get('id')}_{module_id}"
         )
         
@@ -2686,6 +5557,8 @@ def show_submission_form(assignment, form_key, course_id, module_id):
         if uploaded_file:
             st.success(f"✅ File siap diupload: **{uploaded_file.name}**")
             st.info(f"📏 Ukuran file: {format_file_size(uploaded_file.size)}")
+            if uploaded_file.size > MAX_SUBMISSION_SIZE:
+                st.warning(f"⚠️ File melebihi batas {format_file_size(MAX_SUBMISSION_SIZE)}")
         else:
             st.warning("⚠️ Harap pilih file terlebih dahulu")
         
@@ -2703,38 +5576,15 @@ def show_submission_form(assignment, form_key, course_id, module_id):
                 return
             
             try:
-                # Baca file
-                file_data = uploaded_file.getvalue()
-                file_name = uploaded_file.name
-                file_type = uploaded_file.type
-                
-                # Validasi tipe file
-                allowed_extensions = assignment.get("file_types", [".pdf", ".doc", ".docx", ".jpg", ".png"])
-                file_extension = os.path.splitext(file_name)[1].lower()
-                
-                if file_extension not in allowed_extensions:
-                    st.error(f"❌ Tipe file tidak diizinkan. File yang diizinkan: {', '.join(allowed_extensions)}")
-                    return
+                # Tipe & ukuran divalidasi sebelum isi file dibaca; file ditulis ke disk per potongan
+                with st.spinner("🔄 Mengupload file..."):
+                    upload_result = store_submission_upload(assignment, current_user.get("id"), uploaded_file, notes)
                 
-                # Validasi ukuran file (max 10MB)
-                max_size = 10 * 1024 * 1024  # 10MB
-                if len(file_data) > max_size:
-                    st.error(f"❌ File terlalu besar. Maksimal {format_file_size(max_size)}")
+                if "error" in upload_result:
+                    st.error(f"❌ {upload_result['error']}")
                     return
                 
-                # Progress indicator
-                with st.spinner("🔄 Mengupload file..."):
-                    # Submit assignment
-                    success = submit_assignment(
-                        assignment.get("id"),
-                        current_user.get("id"),
-                        file_data,
-                        file_name,
-                        file_type,
-                        notes
-                    )
-                
-                if success:
+                if upload_result.get("success"):
                     st.success("✅ Tugas berhasil dikumpulkan!")
                     st.balloons()
                     
@@ -2757,7 +5607,7 @@ def show_submission_detail(assignment, submission, detail_key):
     st.markdown("---")
     
     # CEK STATUS PENILAIAN YANG LEBIH AKURAT DENGAN ERROR HANDLING
-    score = submission.get('grade')
+    score = submission.get('score') if submission.get('score') is not None else submission.get('grade')
     max_score = assignment.get('max_points', 100)
     
     is_graded = (
@@ -2993,7 +5843,7 @@ def show_manage_media():
         st.warning("Belum ada kursus yang tersedia.")
         return
     
-    course = courses[0]
+    course = get_active_course(courses)
     course_id = course.get("id")
     
     tab1, tab2 = st.tabs(["📤 Unggah Media Baru", "📋 Kelola Media Terupload"])
@@ -3001,7 +5851,7 @@ def show_manage_media():
     with tab1:
         st.subheader("📤 Unggah Media Ajar Baru")
         
-        module_id = st.selectbox("Pilih Modul", range(1, 8), format_func=lambda x: f"Modul {x}", key="media_module")
+        module_id = st.selectbox("Pilih Modul", get_course_module_ids(course_id), format_func=lambda x: f"Modul {x}", key="media_module")
         media_type = st.selectbox("Jenis Media", 
                                  ["modul_ajar", "bahan_ajar", "lkpd", "media_pembelajaran", "lainnya"],
                                  format_func=lambda x: x.replace("_", " ").title(),
@@ -3039,16 +5889,14 @@ def show_manage_media():
         st.subheader("📋 Media Ajar Terupload")
         
         module_id_filter = st.selectbox("Filter berdasarkan Modul", 
-                                       [None] + list(range(1, 8)), 
+                                       [None] + get_course_module_ids(course_id), 
                                        format_func=lambda x: "Semua Modul" if x is None else f"Modul {x}",
                                        key="media_filter")
         
-        media_list = load_data(MEDIA_FILE)
         if module_id_filter:
-            # Filter media berdasarkan modul yang dipilih
-            media_in_module = get_media_by_module(course_id, module_id_filter)
-            media_ids_in_module = [m.get("id") for m in media_in_module]
-            media_list = [m for m in media_list if m.get("id") in media_ids_in_module]
+            media_list = get_media_by_module(course_id, module_id_filter)
+        else:
+            media_list = get_media_index()["items"]
         
         if not media_list:
             st.info("Belum ada media ajar yang diupload.")
@@ -3059,12 +5907,8 @@ def show_manage_media():
             st.session_state.current_media_preview = None
         
         for i, media in enumerate(media_list):
-            # Cari modul yang memiliki media ini
-            modules_with_media = []
-            for mod_id in range(1, 8):
-                module_media = get_media_by_module(course_id, mod_id)
-                if any(m.get("id") == media.get("id") for m in module_media):
-                    modules_with_media.append(f"Modul {mod_id}")
+            # Modul yang memakai media ini, dari indeks balik katalog
+            modules_with_media = [f"Modul {mod_id}" for _, mod_id in sorted(get_media_modules(media.get("id"), course_id))]
             
             # Buat key yang unik untuk setiap media item
             media_key = f"media_{media.get('id')}_{module_id_filter if module_id_filter else 'all'}"
@@ -3093,8 +5937,7 @@ def show_manage_media():
                     delete_key = f"delete_{media.get('id')}_{module_id_filter if module_id_filter else 'all'}_{i}"
                     if st.button("🗑️ Hapus", key=delete_key):
                         # Hapus dari semua modul terlebih dahulu
-                        for mod_id in range(1, 8):
-                            remove_media_from_module(course_id, mod_id, media.get("id"))
+                        detach_media_from_modules(media.get("id"))
                         # Hapus file media
                         delete_media_file(media.get("id"))
                         st.success("✅ Media berhasil dihapus!")
@@ -3127,12 +5970,22 @@ def show_manage_students():
     """, unsafe_allow_html=True)
     
     users = load_data(USERS_FILE)
-    students = [u for u in users if u.get("role") == "student"]
+    course_id = get_active_course_id()
+    students = get_course_students(course_id, users)
     
     if not students:
-        st.info("Belum ada siswa yang terdaftar.")
+        st.info("Belum ada siswa yang terdaftar di kursus ini.")
         return
     
+    completion = get_class_completion_matrix(course_id, [s.get("id") for s in students])
+    with st.expander("📊 Matriks Penyelesaian Modul", expanded=False):
+        rate = completion.mean(axis=0) * 100
+        st.bar_chart(pd.Series(rate.to_numpy(), index=[f"Modul {mid}" for mid in completion.columns], name="Selesai (%)"))
+        table = completion.replace({True: "✅", False: ""})
+        table.columns = [f"M{mid}" for mid in completion.columns]
+        table.insert(0, "Nama", [s.get("name") for s in students])
+        st.dataframe(table, use_container_width=True, hide_index=True)
+    
     for i, student in enumerate(students):  # PAKAI enumerate UNTUK DAPAT INDEX UNIK
         with st.expander(f"🎓 {student.get('name')} ({student.get('username')})"):
             col1, col2 = st.columns([3, 1])
@@ -3141,15 +5994,16 @@ def show_manage_students():
                 st.write(f"**Terdaftar:** {student.get('registered_at')[:10]}")
                 
                 # Progress siswa
-                progress_data = load_data(PROGRESS_FILE)
-                student_progress = next((p for p in progress_data if p.get("user_id") == student.get("id")), None)
+                student_progress = get_user_progress(student.get("id"), course_id)
                 if student_progress:
-                    progress_value = student_progress.get("progress", 0)
-                    completed_modules = len(student_progress.get("completed_modules", []))
-                    st.write(f"**Progress:** {progress_value}% ({completed_modules}/7 modul)")
+                    completed_modules, total_modules, progress_value = get_progress_summary(student_progress)
+                    st.write(f"**Progress:** {progress_value}% ({completed_modules}/{total_modules} modul)")
                     st.progress(progress_value / 100)
                 else:
                     st.write("**Progress:** Belum memulai pembelajaran")
+                
+                st.markdown("**🕒 Aktivitas 7 Hari Terakhir**")
+                show_activity_timeline(student.get("id"), limit=10)
             
             with col2:
                 # GUNAKAN INDEX i UNTUK MEMBUAT KEY YANG LEBIH UNIK
@@ -3174,7 +6028,7 @@ def show_manage_modules():
         st.warning("Belum ada kursus yang tersedia.")
         return
     
-    course = courses[0]  # Ambil course pertama
+    course = get_active_course(courses)
     
     st.markdown(f"""
     <div class='electric-card'>
@@ -3189,8 +6043,10 @@ def show_manage_modules():
     tab1, tab2 = st.tabs(["✏️ Edit Konten Modul", "📁 Kelola Media Modul"])
     
     with tab1:
-        for mid in range(1, 8):
-            m = get_module_by_id(modules, mid)
+        # Modul yang ada ditambah satu slot untuk modul baru
+        module_ids = get_course_module_ids(course.get("id"))
+        for mid in module_ids + [max(module_ids) + 1]:
+            m = get_catalog_module(course.get("id"), mid)
             with st.expander(f"Modul {mid}: {m.get('title') if m else 'Modul Baru'}", expanded=False):
                 title = st.text_input("Judul Modul", value=m.get("title") if m else f"Modul {mid} - Hukum Kirchhoff", key=f"title_{mid}")
                 content = st.text_area("Konten Materi", value=m.get("content") if m else f"Konten untuk modul {mid}...", key=f"content_{mid}", height=200)
@@ -3198,11 +6054,13 @@ def show_manage_modules():
                 quiz_url = st.text_input("URL Quiz", value=m.get("quiz_url") if m else "", key=f"quiz_{mid}")
                 
                 if st.button(f"💾 Simpan Modul {mid}", key=f"save_{mid}"):
-                    new_module = {
+                    # Pertahankan field lain (mis. media_ids) agar media tidak terlepas saat modul diedit
+                    new_module = {k: v for k, v in (m or {}).items() if k not in ("video_url", "quiz_url")}
+                    new_module.update({
                         "id": mid,
                         "title": title,
                         "content": content
-                    }
+                    })
                     if video_url:
                         new_module["video_url"] = video_url
                     if quiz_url:
@@ -3224,6 +6082,7 @@ def show_manage_modules():
                         if c.get("id") == course.get("id"):
                             courses[i] = course
                     save_data(courses, COURSES_FILE)
+                    index_search_documents([_module_search_doc(course.get("id"), new_module)])
                     
                     st.success(f"✅ Modul {mid} berhasil disimpan!")
                     st.rerun()
@@ -3241,7 +6100,8 @@ def show_manage_course_codes():
     </div>
     """, unsafe_allow_html=True)
     
-    current_code = get_course_code(1)
+    course_id = get_active_course_id()
+    current_code = get_course_code(course_id)
     
     if current_code:
         st.markdown(f"""
@@ -3255,20 +6115,7 @@ def show_manage_course_codes():
         st.warning("Belum ada kode akses yang aktif.")
     
     if st.button("🔄 Generate Kode Baru", use_container_width=True):
-        course_codes = load_data(COURSE_CODES_FILE)
-        for cc in course_codes:
-            if cc.get("course_id") == 1:
-                cc["is_active"] = False
-        
-        new_code = generate_course_code()
-        course_codes.append({
-            "course_id": 1,
-            "code": new_code,
-            "is_active": True,
-            "created_at": datetime.now().isoformat(),
-            "max_students": None
-        })
-        save_data(course_codes, COURSE_CODES_FILE)
+        new_code = regenerate_course_code(course_id)
         st.success(f"✅ Kode akses baru berhasil dibuat: {new_code}")
         st.rerun()
 
@@ -3359,11 +6206,19 @@ def show_attendance_report():
     </div>
     """, unsafe_allow_html=True)
     
+    tab1, tab2 = st.tabs(["📅 Harian", "🗓️ Rentang Tanggal"])
+    with tab1:
+        show_daily_attendance_report()
+    with tab2:
+        show_attendance_range_report()
+
+def show_daily_attendance_report():
     date_sel = st.date_input("Pilih Tanggal", value=date.today())
     date_str = date_sel.isoformat()
     
-    attendance = get_attendance(1, date_str)  # course_id 1
-    users = load_data(USERS_FILE)
+    course_id = get_active_course_id()
+    attendance = get_attendance(course_id, date_str)
+    users_by_id = {u.get("id"): u for u in load_data_cached(USERS_FILE)}
     
     if not attendance:
         st.info(f"Belum ada absensi untuk tanggal {date_str}.")
@@ -3371,12 +6226,165 @@ def show_attendance_report():
     
     st.write(f"**Rekapan Absensi - {date_str}**")
     
+    rollup = get_attendance_rollup(course_id, date_str)
+    for col, status in zip(st.columns(len(ATTENDANCE_STATUSES)), ATTENDANCE_STATUSES):
+        with col:
+            st.metric(status, rollup.get(status, 0))
+    
     for att in attendance:
-        user = next((u for u in users if u.get("id") == att.get("user_id")), None)
+        user = users_by_id.get(att.get("user_id"))
         if user:
             status_icon = "✅" if att.get("status") == "Hadir" else "⚠️" if att.get("status") == "Izin" else "❌"
             st.write(f"{status_icon} **{user.get('name')}** - {att.get('status')}")
 
+def show_attendance_range_report():
+    course_id = get_active_course_id()
+    today = date.today()
+    presets = {
+        "Minggu ini": today - timedelta(days=today.weekday()),
+        "Bulan ini": today.replace(day=1),
+        "Semester (6 bulan terakhir)": today - timedelta(days=182),
+    }
+    preset = st.radio("Rentang", list(presets) + ["Pilih sendiri"], horizontal=True, key="attendance_range_preset")
+    if preset == "Pilih sendiri":
+        selected = st.date_input("Dari - Sampai", value=(today - timedelta(days=30), today), key="attendance_range_dates")
+        if not isinstance(selected, (tuple, list)) or len(selected) != 2:
+            st.info("Pilih tanggal awal dan akhir.")
+            return
+        start_date, end_date = selected
+    else:
+        start_date, end_date = presets[preset], today
+    
+    users = load_data_cached(USERS_FILE)
+    students = get_course_students(course_id, users)
+    users_by_id = {u.get("id"): u for u in users}
+    matrix = get_attendance_matrix(course_id, start_date, end_date, [u.get("id") for u in students])
+    if matrix.shape[1] == 0:
+        st.info(f"Belum ada absensi antara {start_date.isoformat()} dan {end_date.isoformat()}.")
+        return
+    
+    summary = summarize_attendance_matrix(matrix)
+    names = [users_by_id.get(uid, {}).get("name", f"ID {uid}") for uid in matrix.index]
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Hari Pertemuan", matrix.shape[1])
+    with col2:
+        st.metric("Siswa", matrix.shape[0])
+    with col3:
+        st.metric("Rata-rata Kehadiran", f"{summary['Kehadiran (%)'].mean():.1f}%" if len(summary) else "-")
+    
+    # Skala warna diskrit: satu warna per kode status
+    colors = ["#e74c3c", "#9b59b6", "#f39c12", "#2ecc71"]
+    n = len(colors)
+    colorscale = [[edge, color] for i, color in enumerate(colors) for edge in (i / n, (i + 1) / n)]
+    fig = go.Figure(go.Heatmap(
+        z=matrix.to_numpy(),
+        x=list(matrix.columns),
+        y=names,
+        zmin=-0.5,
+        zmax=n - 0.5,
+        colorscale=colorscale,
+        colorbar=dict(tickvals=list(ATTENDANCE_STATUS_CODES.values()), ticktext=list(ATTENDANCE_STATUS_CODES)),
+        xgap=1,
+        ygap=1
+    ))
+    fig.update_layout(height=max(300, 22 * len(names) + 120), xaxis_title="Tanggal", yaxis_autorange="reversed")
+    st.plotly_chart(fig, use_container_width=True)
+    
+    st.subheader("📋 Rekap per Siswa")
+    st.dataframe(summary.assign(Nama=names).reset_index(drop=True)[["Nama"] + list(summary.columns)],
+                 use_container_width=True, hide_index=True)
+
+def show_lab_analytics():
+    inject_custom_css()
+    
+    st.markdown("""
+    <div class='main-header'>
+        <h1>🔬 Analitik Laboratorium Virtual</h1>
+        <p>Rekap eksperimen seluruh siswa berdasarkan jenis rangkaian, parameter, dan waktu</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    frame = get_lab_frame()
+    if frame.empty:
+        st.info("Belum ada eksperimen yang tersimpan.")
+        return
+    
+    valid_dates = frame["created_at"].dropna()
+    if valid_dates.empty:
+        st.warning("Tanggal eksperimen tidak dapat dibaca, analitik tidak dapat ditampilkan.")
+        return
+    start_date, end_date = valid_dates.min().date(), valid_dates.max().date()
+    date_range = st.date_input("Rentang Tanggal", value=(start_date, end_date), key="lab_analytics_range")
+    if isinstance(date_range, (tuple, list)) and len(date_range) == 2:
+        start_date, end_date = date_range
+    mask = (frame["created_at"] >= pd.Timestamp(start_date)) & (frame["created_at"] < pd.Timestamp(end_date) + pd.Timedelta(days=1))
+    data = frame[mask]
+    
+    if data.empty:
+        st.info("Tidak ada eksperimen pada rentang tanggal ini.")
+        return
+    
+    flagged = (data["kcl_residual"] > LAB_RESIDUAL_TOLERANCE) | (data["kvl_residual"] > LAB_RESIDUAL_TOLERANCE)
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        create_metric_card("Total Eksperimen", len(data), "🔬")
+    with col2:
+        create_metric_card("Siswa Aktif", data["user_id"].nunique(), "👥")
+    with col3:
+        create_metric_card("Jenis Rangkaian", data["circuit_type"].nunique(), "🔌")
+    with col4:
+        create_metric_card("Residu Janggal", int(flagged.sum()), "⚠️", f"> {LAB_RESIDUAL_TOLERANCE}")
+    
+    st.subheader("📊 Ringkasan per Jenis Rangkaian")
+    summary = data.groupby("circuit_type", observed=True).agg(
+        eksperimen=("id", "size"),
+        siswa=("user_id", "nunique"),
+        kcl_maks=("kcl_residual", "max"),
+        kvl_maks=("kvl_residual", "max"),
+        terakhir=("created_at", "max"),
+    ).reset_index()
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+    
+    st.subheader("📈 Eksperimen per Hari")
+    daily = data.groupby([data["created_at"].dt.date, "circuit_type"], observed=True).size().unstack(fill_value=0)
+    st.bar_chart(daily)
+    
+    st.subheader("🗺️ Wilayah Parameter yang Dieksplorasi")
+    circuit_type = st.selectbox("Jenis Rangkaian", list(summary["circuit_type"]), key="lab_analytics_type")
+    subset = data[data["circuit_type"] == circuit_type]
+    param_cols = [c for c in subset.columns if c.startswith("p_") and subset[c].notna().any()]
+    if len(param_cols) >= 2:
+        col1, col2 = st.columns(2)
+        with col1:
+            x_col = st.selectbox("Parameter X", param_cols, index=0, format_func=lambda c: c[2:], key="lab_analytics_x")
+        with col2:
+            y_col = st.selectbox("Parameter Y", param_cols, index=1, format_func=lambda c: c[2:], key="lab_analytics_y")
+        points = subset[[x_col, y_col]].dropna().to_numpy()
+        counts, x_edges, y_edges = np.histogram2d(points[:, 0], points[:, 1], bins=20)
+        fig = go.Figure(go.Heatmap(
+            z=counts.T,
+            x=(x_edges[:-1] + x_edges[1:]) / 2,
+            y=(y_edges[:-1] + y_edges[1:]) / 2,
+            colorscale="Blues",
+            colorbar=dict(title="Eksperimen")
+        ))
+        fig.update_layout(xaxis_title=x_col[2:], yaxis_title=y_col[2:], height=400)
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("Jenis rangkaian ini tidak memiliki cukup parameter numerik untuk dipetakan.")
+    
+    st.subheader("⚠️ Eksperimen dengan Residu Kirchhoff Janggal")
+    suspicious = data[flagged].assign(residu=np.maximum(data["kcl_residual"], data["kvl_residual"])).nlargest(50, "residu")
+    if suspicious.empty:
+        st.success("✅ Semua eksperimen memenuhi KCL/KVL dalam batas toleransi.")
+    else:
+        users = {u.get("id"): u.get("name") for u in load_data(USERS_FILE)}
+        table = suspicious[["id", "user_id", "circuit_type", "created_at", "kcl_residual", "kvl_residual"]].copy()
+        table.insert(2, "siswa", table["user_id"].map(users))
+        st.dataframe(table, use_container_width=True, hide_index=True)
+
 def show_manage_assignments():
     inject_custom_css()
     
@@ -3392,7 +6400,7 @@ def show_manage_assignments():
         st.warning("Belum ada kursus yang tersedia.")
         return
     
-    course = courses[0]  # Ambil course pertama
+    course = get_active_course(courses)
     course_id = course.get("id")
     
     tab1, tab2, tab3 = st.tabs(["➕ Buat Tugas Baru", "📋 Daftar Tugas", "📊 Kelola Pengumpulan"])
@@ -3400,7 +6408,7 @@ def show_manage_assignments():
     with tab1:
         st.subheader("➕ Buat Tugas Baru")
         
-        module_id = st.selectbox("Pilih Modul", range(1, 8), format_func=lambda x: f"Modul {x}")
+        module_id = st.selectbox("Pilih Modul", get_course_module_ids(course_id), format_func=lambda x: f"Modul {x}")
         title = st.text_input("Judul Tugas")
         description = st.text_area("Deskripsi Tugas")
         due_date = st.date_input("Batas Waktu", value=date.today() + timedelta(days=7))
@@ -3437,12 +6445,9 @@ def show_manage_assignments():
                     st.write(f"**Nilai Maksimal:** {assignment.get('max_points')}")
                     st.write(f"**File yang Diizinkan:** {', '.join(assignment.get('file_types', []))}")
                     
-                    # Statistik pengumpulan
-                    submissions = get_all_submissions(assignment.get("id"))
-                    total_submissions = len(submissions)
-                    graded_submissions = len([s for s in submissions if s.get("status") == "graded"])
-                    
-                    st.write(f"**Statistik:** {total_submissions} dikumpulkan, {graded_submissions} dinilai")
+                    # Statistik pengumpulan dari indeks status
+                    counts = get_assignment_submission_counts(assignment.get("id"))
+                    st.write(f"**Statistik:** {counts['total']} dikumpulkan, {counts['graded']} dinilai, {counts['late']} terlambat")
                     
                     # Tombol hapus tugas
                     if st.button("🗑️ Hapus Tugas", key=f"delete_{assignment.get('id')}"):
@@ -3472,8 +6477,22 @@ def show_manage_assignments():
                 if not submissions:
                     st.info("Belum ada pengumpulan untuk tugas ini.")
                 else:
-                    st.write(f"**Total Pengumpulan:** {len(submissions)}")
+                    col_total, col_zip = st.columns([3, 1])
+                    with col_total:
+                        st.write(f"**Total Pengumpulan:** {len(submissions)}")
+                    with col_zip:
+                        # ZIP dibuat saat tombol diklik, bukan pada setiap rerun halaman
+                        st.download_button(
+                            "📦 Unduh Semua (ZIP)",
+                            data=lambda assignment_id=selected_assignment.get("id"): export_assignment_submissions_zip(assignment_id),
+                            file_name=f"pengumpulan_tugas_{selected_assignment.get('id')}_{date.today().isoformat()}.zip",
+                            mime="application/zip",
+                            key=f"download_zip_{selected_assignment.get('id')}",
+                            use_container_width=True
+                        )
+                    show_grading_queue(selected_assignment, submissions, users)
                     
+                    st.markdown("#### 📄 Detail Pengumpulan")
                     for submission in submissions:
                         student = next((u for u in users if u.get("id") == submission.get("user_id")), None)
                         
@@ -3489,51 +6508,95 @@ def show_manage_assignments():
                                 st.write(f"**Dikumpulkan:** {submission.get('submitted_at', 'Unknown')[:16]}")
                                 st.write(f"**File:** {submission.get('file_name', 'Unknown')}")
                                 
-                                # Download link dengan error handling
-                                if submission.get("file_data"):
-                                    try:
-                                        st.markdown(create_download_link(
-                                            base64.b64decode(submission.get("file_data")),
-                                            submission.get("file_name", "file"),
-                                            submission.get("file_type", "application/octet-stream")
-                                        ), unsafe_allow_html=True)
-                                    except Exception as e:
-                                        st.error(f"Error membuat link download: {e}")
+                                # File dibaca dari blob hanya saat tombol download diklik
+                                if has_submission_file(submission):
+                                    st.download_button(
+                                        f"📥 Download {submission.get('file_name', 'file')}",
+                                        data=lambda submission=submission: read_submission_file(submission),
+                                        file_name=submission.get("file_name", "file"),
+                                        mime=submission.get("file_type") or "application/octet-stream",
+                                        key=f"download_submission_{submission.get('id')}"
+                                    )
                                 
                                 if submission.get("notes"):
                                     st.write(f"**Catatan:** {submission.get('notes')}")
                             
                             with col2:
                                 if submission.get("status") == "submitted" or not submission.get("status"):
+                                    st.info("⏳ Belum dinilai. Beri nilai melalui Antrian Penilaian di atas.")
+                                else:
+                                    st.write(f"**Nilai:** {submission.get('score', 0)}/{selected_assignment.get('max_points', 100)}")
+                                    st.write(f"**Feedback:** {submission.get('feedback', 'Tidak ada feedback')}")
+                                    st.write(f"**Dinilai oleh:** {submission.get('graded_by', 'Unknown')}")
+                                    if submission.get('graded_at'):
+                                        st.write(f"**Waktu Penilaian:** {submission.get('graded_at')[:16]}")
+                                    
+                                    # Koreksi nilai untuk submission yang sudah keluar dari antrian
+                                    st.markdown("**✏️ Ubah Nilai**")
                                     score = st.number_input(
                                         "Nilai",
                                         min_value=0,
                                         max_value=selected_assignment.get("max_points", 100),
-                                        value=submission.get('score', 0),
-                                        key=f"score_{submission.get('id')}"
+                                        value=int(submission.get('score') or 0),
+                                        key=f"regrade_score_{submission.get('id')}"
                                     )
                                     feedback = st.text_area(
                                         "Feedback",
-                                        value=submission.get('feedback', ''),
-                                        placeholder="Berikan feedback untuk siswa...",
-                                        key=f"feedback_{submission.get('id')}"
+                                        value=submission.get('feedback') or '',
+                                        key=f"regrade_feedback_{submission.get('id')}"
                                     )
-                                    
-                                    if st.button("💾 Simpan Nilai", key=f"grade_{submission.get('id')}"):
-                                        grade_submission(
-                                            submission.get("id"),
-                                            score,
-                                            feedback,
-                                            st.session_state.current_user.get("name")
-                                        )
-                                        st.success("✅ Nilai berhasil disimpan!")
+                                    if st.button("💾 Simpan Perubahan", key=f"regrade_{submission.get('id')}"):
+                                        grade_submission(submission.get("id"), score, feedback,
+                                                         st.session_state.current_user.get("name"))
+                                        st.success("✅ Nilai berhasil diperbarui!")
                                         st.rerun()
-                                else:
-                                    st.write(f"**Nilai:** {submission.get('score', 0)}/{selected_assignment.get('max_points', 100)}")
-                                    st.write(f"**Feedback:** {submission.get('feedback', 'Tidak ada feedback')}")
-                                    st.write(f"**Dinilai oleh:** {submission.get('graded_by', 'Unknown')}")
-                                    if submission.get('graded_at'):
-                                        st.write(f"**Waktu Penilaian:** {submission.get('graded_at')[:16]}")
+
+def show_grading_queue(assignment, submissions, users):
+    """Antrian penilaian: nilai banyak submission dalam satu tabel lalu simpan sekaligus"""
+    pending = [s for s in submissions if s.get("status") == "submitted" or not s.get("status")]
+    st.markdown("#### 🗂️ Antrian Penilaian")
+    if not pending:
+        st.success("✅ Semua pengumpulan untuk tugas ini sudah dinilai.")
+        return
+    
+    names = {u.get("id"): u.get("name") for u in users}
+    queue = pd.DataFrame([{
+        "id": s.get("id"),
+        "Siswa": names.get(s.get("user_id"), "Unknown"),
+        "Dikumpulkan": (s.get("submitted_at") or "")[:16],
+        "Terlambat": is_submission_late(s.get("submitted_at"), assignment.get("due_date")),
+        "File": s.get("file_name"),
+        "Nilai": s.get("score"),
+        "Feedback": s.get("feedback") or ""
+    } for s in pending])
+    queue["Nilai"] = pd.to_numeric(queue["Nilai"], errors="coerce")
+    
+    max_points = assignment.get("max_points", 100)
+    edited = st.data_editor(
+        queue,
+        use_container_width=True,
+        hide_index=True,
+        disabled=["id", "Siswa", "Dikumpulkan", "Terlambat", "File"],
+        key=f"grading_queue_{assignment.get('id')}",
+        column_config={
+            "Nilai": st.column_config.NumberColumn("Nilai", min_value=0, max_value=max_points, step=1),
+            "Feedback": st.column_config.TextColumn("Feedback", width="large"),
+        }
+    )
+    
+    scored = edited[edited["Nilai"].notna()]
+    st.caption(f"{len(scored)} dari {len(pending)} pengumpulan sudah diberi nilai di tabel. "
+               "Baris dengan nilai kosong tidak disimpan.")
+    if st.button("💾 Simpan Semua Nilai", key=f"grade_bulk_{assignment.get('id')}", disabled=scored.empty):
+        count = grade_submissions_bulk([
+            # Nilai desimal dibulatkan (bukan dipotong); sel feedback kosong bisa berisi NaN
+            {"submission_id": int(row["id"]), "score": int(round(row["Nilai"])),
+             "feedback": "" if pd.isna(row["Feedback"]) else str(row["Feedback"])}
+            for row in scored.to_dict("records")
+        ], st.session_state.current_user.get("name"))
+        st.success(f"✅ {count} nilai berhasil disimpan!")
+        st.rerun()
+
 # ===================== Main Function ===================== #
 def main():
     init_data()
@@ -3546,8 +6609,8 @@ def main():
         st.session_state.quiz_started = False
     if "current_quiz" not in st.session_state:
         st.session_state.current_quiz = None
-    if "quiz_answers" not in st.session_state:
-        st.session_state.quiz_answers = {}
+    if "current_quiz_session" not in st.session_state:
+        st.session_state.current_quiz_session = None
     if "current_media_preview" not in st.session_state:
         st.session_state.current_media_preview = None
 
@@ -3592,18 +6655,28 @@ def main():
         
         if user.get("role") == "admin":
             menu_options = ["Dashboard", "Materi Pembelajaran", "Laboratorium Virtual", notification_text, 
-                           "Kelola Siswa", "Kelola Modul", "Kelola Tugas", "Kelola Kuis", "Kelola Kode Akses", "Kirim Notifikasi", "Lihat Absensi", "Profil"]
+                           "Kelola Siswa", "Kelola Modul", "Kelola Tugas", "Kelola Kuis", "Kelola Kode Akses", "Kirim Notifikasi", "Lihat Absensi", "Analitik Lab", "Pencarian", "Profil"]
         else:
-            menu_options = ["Dashboard", "Materi Pembelajaran", "Laboratorium Virtual", notification_text, "Profil"]
+            menu_options = ["Dashboard", "Materi Pembelajaran", "Laboratorium Virtual", notification_text, "Pencarian", "Profil"]
         
         selected_menu = st.sidebar.selectbox("📋 Menu Navigasi", menu_options)
         
+        # Pemilih kursus aktif: semua halaman per kursus membaca data kursus ini saja
+        available_courses = get_available_courses(user)
+        if len(available_courses) > 1:
+            course_ids = [c.get("id") for c in available_courses]
+            titles = {c.get("id"): c.get("title") for c in available_courses}
+            st.session_state.active_course_id = st.sidebar.selectbox(
+                "🏫 Kursus Aktif", course_ids, index=course_ids.index(get_active_course_id()),
+                format_func=lambda cid: titles.get(cid, f"Kursus {cid}")
+            )
+        
         if st.sidebar.button("🚪 Logout", use_container_width=True):
             st.session_state.authenticated = False
             st.session_state.current_user = None
             st.session_state.quiz_started = False
             st.session_state.current_quiz = None
-            st.session_state.quiz_answers = {}
+            st.session_state.current_quiz_session = None
             st.session_state.current_media_preview = None
             st.rerun()
     else:
@@ -3658,6 +6731,8 @@ def main():
             show_virtual_lab()
         elif "Notifikasi" in selected_menu:
             show_notifications()
+        elif selected_menu == "Pencarian":
+            show_search()
         elif selected_menu == "Kelola Siswa" and st.session_state.current_user.get("role") == "admin":
             show_manage_students()
         elif selected_menu == "Kelola Modul" and st.session_state.current_user.get("role") == "admin":
@@ -3672,6 +6747,8 @@ def main():
             show_send_notification()
         elif selected_menu == "Lihat Absensi" and st.session_state.current_user.get("role") == "admin":
             show_attendance_report()
+        elif selected_menu == "Analitik Lab" and st.session_state.current_user.get("role") == "admin":
+            show_lab_analytics()
         elif selected_menu == "Profil":
             show_profile()
 
@@ -0,0 +1,39 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamlit_app as app
+
+
+def _forum_message_count():
+    return sum(
+        len(app._load_forum_log(os.path.join(app.FORUM_DIR, name)))
+        for name in os.listdir(app.FORUM_DIR) if name.endswith(".jsonl")
+    )
+
+
+def test_forum_migration_rerun_after_partial_write(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    forum = [
+        {"id": i, "course_id": 1, "module_id": i % 2 or None, "user_id": 2, "user_name": "Siswa",
+         "content": f"pesan {i}", "parent_id": None, "timestamp": f"2024-01-01T00:00:{i:02d}"}
+        for i in range(1, 6)
+    ]
+    with open(app.FORUM_FILE, "w", encoding="utf-8") as f:
+        json.dump(forum, f)
+    
+    # Migrasi terputus: sebagian partisi sudah tertulis di folder sementara maupun folder lama tanpa meta
+    os.makedirs(app.FORUM_DIR + ".tmp")
+    app._append_forum_messages(1, 1, forum[:1], app.FORUM_DIR + ".tmp")
+    os.makedirs(app.FORUM_DIR)
+    app._append_forum_messages(1, 1, forum[:1])
+    
+    app.init_forum_store()
+    assert _forum_message_count() == len(forum)
+    assert not os.path.exists(app.FORUM_DIR + ".tmp")
+    
+    app.init_forum_store()
+    assert _forum_message_count() == len(forum)
+    assert app.load_json_dict(app.FORUM_META_FILE)["next_id"] == len(forum) + 1